@@ -1,32 +1,186 @@
+import time
 from datetime import date
-from opik import track
+from tools.tracing import track
 from config.characters import AgentCharacters
-from tools.gemini_client import GeminiBrain
-from tools.data_store import DataStore
+from config.settings import Settings
+from tools.gemini_client import GeminiBrain, StructuredOutputError
+from tools.resilience import BackendUnavailable, with_deadline
+from tools.models import HumanResponseUnderstanding, DailyBriefing
+from tools.data_store import format_currency
+from tools.task_graph import TaskGraph
+from tools.memo import memoize
+from tools.rate_limiter import Priority, in_lane
+from tools.briefing_state import BriefingState, ledger_state, fingerprint, compute_diff, diff_size, format_diff
 from agents.doc_processor import DocProcessorAgent
 from agents.finance_manager import FinanceManagerAgent
 
+BRIEFING_QUESTION = """
+As CFO, prepare your daily briefing. Think about:
+1. What's the ONE thing I must focus on today?
+2. What decisions need to be made right now?
+3. What can wait?
+4. Any red flags I should be worried about?
+5. How are we doing on our long-term financial goals?
+6. Any good news?
+
+Create a briefing that:
+- Starts with the most important thing
+- Is clear about what needs my decision
+- Gives me enough context to decide
+- Explicitly mentions progress on goals
+- Doesn't waste my time with details I don't need
+
+Format it for a busy person reading on their phone.
+"""
+
+# Parts of a full briefing that only a full rebuild refreshes
+FULL_BRIEFING_ONLY = ("cash_analysis", "payment_reco", "collection_status", "goals_status", "formatted")
+
+# A full briefing reads whatever the Finance Manager's analyses read (the
+# single-call package is the same ledger plus the trend)
+BRIEFING_READS = tuple(sorted({
+    name
+    for step in (
+        FinanceManagerAgent.analyze_cash_position, FinanceManagerAgent.recommend_payments,
+        FinanceManagerAgent.analyze_collections, FinanceManagerAgent.analyze_financial_goals
+    )
+    for name in step.reads
+}))
+
+
 class CFOBrainAgent:
     def __init__(self):
         self.character = AgentCharacters.CFO_BRAIN_CHARACTER
         self.brain = GeminiBrain()
         self.doc_processor = DocProcessorAgent()
         self.finance_manager = FinanceManagerAgent()
-        self.data_store = DataStore()
+        # One store for Rajesh and Arjun, so a write invalidates both agents' memos
+        self.data_store = self.finance_manager.data_store
+        self.briefing_state = BriefingState(self.data_store.db_path.parent / "briefing_state.json")
 
     @track(name="rajesh.daily_briefing")
-    def create_daily_briefing(self) -> dict:
+    @in_lane(Priority.BRIEFING)
+    @with_deadline(Settings.BRIEFING_DEADLINE_SECONDS)
+    def create_daily_briefing(self, full: bool = False) -> dict:
         """
         Rajesh creates the morning briefing for himself/human.
+        Only what changed since the last briefing is sent to the model,
+        unless a full rebuild is requested or due.
         """
-        # Get input from Finance Manager
-        cash_analysis = self.finance_manager.analyze_cash_position()
-        payment_reco = self.finance_manager.recommend_payments(cash_analysis.response)
-        collection_status = self.finance_manager.analyze_collections()
-        goals_status = self.finance_manager.analyze_financial_goals()
+        # Keep the daily history going so trend questions have data
+        self.data_store.record_snapshot()
 
+        today = date.today()
+        ledger = ledger_state(self.data_store)
+        previous = None if full else self.briefing_state.load()
+
+        if previous is not None:
+            since = date.fromisoformat(previous['date'])
+            diff = compute_diff(previous['ledger'], ledger, since, today)
+            fresh_enough = (today - since).days <= Settings.BRIEFING_FULL_REFRESH_DAYS
+
+            if fresh_enough and diff_size(diff) == 0 and previous['fingerprint'] == fingerprint(ledger):
+                # Nothing moved: yesterday's briefing still stands
+                result = dict(previous['result'], mode="unchanged", changes=format_diff(diff))
+                result["briefing"] = f"No changes since the {since} briefing.\n\n{previous['result']['briefing']}"
+                return result
+
+            if fresh_enough and diff_size(diff) <= Settings.BRIEFING_MAX_DELTA_CHANGES:
+                result = self._create_delta_briefing(previous, diff, since)
+                self.briefing_state.save(ledger, result, today)
+                return result
+
+        if full:
+            # A requested rebuild is built afresh, not served from the memo
+            result = self._create_full_briefing.__wrapped__(self, Settings.BRIEFING_MODE)
+        else:
+            result = self._create_full_briefing(Settings.BRIEFING_MODE)
+        self.briefing_state.save(ledger, result, today)
+        return result
+
+    @memoize(*BRIEFING_READS)
+    def _create_full_briefing(self, mode: str = "pipeline") -> dict:
+        """
+        Full briefing built from the Finance Manager's complete analysis.
+        Independent steps run concurrently; the critical path is
+        cash -> payments -> synthesis -> actions.
+        """
+        if mode == "single":
+            try:
+                return self._create_single_call_briefing()
+            except (StructuredOutputError, BackendUnavailable) as e:
+                print(f"⚠️ Single-call briefing failed, using the step-by-step one: {e}")
+        fm = self.finance_manager
+        graph = TaskGraph(max_workers=Settings.BRIEFING_MAX_WORKERS)
+        # Get input from Finance Manager
+        graph.add("cash_analysis", fm.analyze_cash_position)
+        graph.add("payment_reco", lambda cash_analysis: fm.recommend_payments(cash_analysis.response),
+                  depends_on=["cash_analysis"])
+        graph.add("collection_status", fm.analyze_collections)
+        graph.add("goals_status", fm.analyze_financial_goals)
         # Rajesh synthesizes everything
-        briefing = self.brain.think(
+        graph.add("briefing", self._synthesize_briefing,
+                  depends_on=["cash_analysis", "payment_reco", "collection_status", "goals_status"])
+        # Rajesh identifies what needs human decision
+        graph.add("actions_needed", lambda briefing: self._identify_actions(briefing.response),
+                  depends_on=["briefing"])
+
+        results, timings = graph.run()
+
+        return {
+            "mode": "full",
+            "briefing": results["briefing"].response,
+            "actions_needed": results["actions_needed"].response,
+            "cash_analysis": results["cash_analysis"].response,
+            "payment_reco": results["payment_reco"].response,
+            "collection_status": results["collection_status"].response,
+            "goals_status": results["goals_status"].response,
+            "timings": timings
+        }
+
+    def _create_single_call_briefing(self) -> dict:
+        """
+        The whole briefing in one structured call: the Finance Manager's
+        numbers are worked out locally and the reply carries the analysis,
+        the decisions and the phone-ready text, so Priya needn't rewrite it.
+        """
+        started = time.perf_counter()
+        result = self.brain.think_structured(
+            character=self.character,
+            context=self.finance_manager.briefing_package(),
+            question=BRIEFING_QUESTION + """
+Do the Finance Manager's work as well: assess our cash, decide on each bill
+worth deciding today, say who to chase for collections and how our goals
+are doing. Then list the decisions you need from the human, and write
+phone_text: the briefing itself, ready to send.
+""",
+            schema=DailyBriefing
+        )
+
+        actions = "\n".join(
+            f"{i}. {a.decision} - I recommend: {a.recommendation} Reply: {a.how_to_reply}"
+            for i, a in enumerate(result.action_items, 1)
+        )
+        plan = "\n".join(
+            f"- {p.invoice_id} {p.vendor_name} {format_currency(p.amount)}: {p.decision.upper()} ({p.reason})"
+            for p in result.payment_plan
+        )
+        return {
+            "mode": "single",
+            "briefing": result.phone_text,
+            "actions_needed": actions,
+            "cash_analysis": result.cash_assessment,
+            "payment_reco": f"{plan}\nCash left after paying now: {format_currency(result.cash_after_payments)}",
+            "collection_status": result.collections,
+            "goals_status": result.goals,
+            # Already written for the phone
+            "formatted": result.phone_text,
+            "timings": {"wall_seconds": round(time.perf_counter() - started, 3)}
+        }
+
+    def _synthesize_briefing(self, cash_analysis, payment_reco, collection_status, goals_status):
+        """Rajesh turns the Finance Manager's analyses into the briefing."""
+        return self.brain.think(
             character=self.character,
             context=f"""
 FINANCE MANAGER'S CASH ANALYSIS: {cash_analysis.response}
@@ -36,30 +190,48 @@ FINANCE MANAGER'S GOAL ANALYSIS: {goals_status.response}
 TODAY: {date.today()}
 DAY: {date.today().strftime('%A')}
 """,
-            question="""
-As CFO, prepare your daily briefing. Think about:
-1. What's the ONE thing I must focus on today?
-2. What decisions need to be made right now?
-3. What can wait?
-4. Any red flags I should be worried about?
-5. How are we doing on our long-term financial goals?
-6. Any good news?
+            question=BRIEFING_QUESTION
+        )
 
-Create a briefing that:
-- Starts with the most important thing
-- Is clear about what needs my decision
-- Gives me enough context to decide
-- Explicitly mentions progress on goals
-- Doesn't waste my time with details I don't need
+    def _create_delta_briefing(self, previous: dict, diff: dict, since: date) -> dict:
+        """Briefing from yesterday's summary plus only what changed since."""
+        last = previous['result']
+        changes = format_diff(diff)
+        started = time.perf_counter()
 
-Format it for a busy person reading on their phone.
+        briefing = self.brain.think(
+            character=self.character,
+            context=f"""
+MY LAST BRIEFING ({since}): {last['briefing']}
+DECISIONS I ASKED FOR LAST TIME: {last['actions_needed']}
+WHAT CHANGED SINCE THEN: {changes}
+TODAY: {date.today()}
+DAY: {date.today().strftime('%A')}
+""",
+            question=BRIEFING_QUESTION + """
+Build on my last briefing: carry forward what still stands and focus on what the changes mean.
 """
         )
+        actions = self._identify_actions(briefing.response)
 
-        # Rajesh identifies what needs human decision
-        actions = self.brain.think(
+        # Arjun's analyses and Priya's text belong to the full briefing they
+        # came from; a delta saved as the next baseline mustn't pass them off as current
+        carried = {k: v for k, v in last.items() if k not in FULL_BRIEFING_ONLY}
+        return dict(
+            carried,
+            mode="delta",
+            based_on=str(since),
+            changes=changes,
+            briefing=briefing.response,
+            actions_needed=actions.response,
+            timings={"wall_seconds": round(time.perf_counter() - started, 3)}
+        )
+
+    def _identify_actions(self, briefing: str):
+        """Rajesh identifies what needs human decision"""
+        return self.brain.think(
             character=self.character,
-            context=f"My briefing: {briefing.response}",
+            context=f"My briefing: {briefing}",
             question="""
 What specific decisions/approvals do I need from the human?
 For each decision:
@@ -72,16 +244,8 @@ Format as a clear list of action items.
 """
         )
 
-        return {
-            "briefing": briefing.response,
-            "actions_needed": actions.response,
-            "cash_analysis": cash_analysis.response,
-            "payment_reco": payment_reco.response,
-            "collection_status": collection_status.response,
-            "goals_status": goals_status.response
-        }
-
     @track(name="rajesh.handle_document")
+    @with_deadline(Settings.DOCUMENT_DEADLINE_SECONDS)
     def handle_new_document(self, file_path: str) -> dict:
         """
         Rajesh handles a newly uploaded document.
@@ -124,44 +288,35 @@ Give me your decision and reasoning.
         """
         Rajesh processes what the human said.
         """
-        understanding = self.brain.think(
-            character=self.character,
-            context=f"""
-WHAT WE ASKED THE HUMAN: {pending_context.get('actions_needed', '')}
+        try:
+            understanding = self.brain.think_structured(
+                character=self.character,
+                context=f"""
+WHAT WE ASKED THE HUMAN: {(pending_context or {}).get('actions_needed', '')}
 HUMAN'S RESPONSE: {response}
 """,
-            question="""
-What is the human telling us? Think about:
-1. What did they approve or reject?
-2. Did they modify anything?
-3. Did they ask for more information?
-4. What actions should we take now?
-
-
-        If their response is unclear, what should we ask?
-
-        Give your answer as a JSON object with:
-        {
-            "understanding": "What you understood",
-            "actions_to_take": "List of actions",
-            "reply_to_user": "The exact message to send back to the human"
-        }
-"""
-        )
-
-        # Parse the JSON response because we asked for one
-        parsed_response = self.brain.extract_json(understanding.response)
-        
-        reply = parsed_response.get("reply_to_user", understanding.response)
-        actions = parsed_response.get("actions_to_take", "None")
+                question="""
+What is the human telling us? What did they approve or reject, did they
+modify anything or ask for more information, and what should we do now?
+If their response is unclear, say what we should ask.
+""",
+                schema=HumanResponseUnderstanding
+            )
+        except (StructuredOutputError, BackendUnavailable) as e:
+            print(f"⚠️ Could not understand the human's response: {e}")
+            return {
+                "understanding": "Sorry sir, I didn't quite follow. Could you tell me which items you approve?",
+                "actions": [],
+                "needs_clarification": True
+            }
 
-        if "unclear" not in reply.lower():
-            self._log_approval_score(reply, response)
+        if not understanding.needs_clarification:
+            self._log_approval_score(understanding.reply_to_user, response)
 
         return {
-            "understanding": reply,
-            "actions": actions,
-            "needs_clarification": "unclear" in reply.lower()
+            "understanding": understanding.reply_to_user,
+            "actions": understanding.actions_to_take,
+            "needs_clarification": understanding.needs_clarification
         }
 
     def _log_approval_score(self, understanding: str, original_response: str):
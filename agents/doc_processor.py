@@ -1,110 +1,127 @@
+import json
 from datetime import datetime
-from opik import track
+from tools.tracing import track
 from config.characters import AgentCharacters
-from tools.gemini_client import GeminiBrain
+from tools.gemini_client import GeminiBrain, StructuredOutputError
+from tools.resilience import BackendUnavailable
 from tools.data_store import DataStore
-from tools.models import DocumentExtraction, AgentResponse
-from tools.utils import generate_id, parse_json
+from tools.models import DocumentExtraction, AgentResponse, DocumentAnalysis, VendorMatch
+from tools.rate_limiter import Priority, in_lane
+from tools.response_cache import ResponseCache
+from tools.document_cache import file_digest, get_shared_documents
+from config.settings import Settings
+from tools.utils import generate_id
+
+# process() runs under this call site, which routes its PDF text to a model tier
+EXTRACTION_CALL_SITE = "meera.process_document"
+
+EXTRACTION_QUESTION = """
+            Analyze this document completely: identify what type of document
+            it is and whether it is readable, extract all financial details,
+            and validate them (do the numbers add up, are dates valid, any
+            warning flags?).
+            """
 
 class DocProcessorAgent:
     def __init__(self):
         self.character = AgentCharacters.DOC_PROCESSOR_CHARACTER
         self.brain = GeminiBrain()
         self.data_store = DataStore()
+        self.documents = get_shared_documents()
 
-    @track(name="meera.process_document")
+    def extraction_version(self) -> str:
+        """Changes whenever the extraction prompt, schema or model does, retiring cached extractions"""
+        return ResponseCache.make_key(
+            self.brain.vision_model_name, self.brain.model_for(EXTRACTION_CALL_SITE), self.character, EXTRACTION_QUESTION,
+            json.dumps(DocumentAnalysis.model_json_schema(), sort_keys=True)
+        )[:16]
+
+    @track(name=EXTRACTION_CALL_SITE)
+    @in_lane(Priority.BULK)
     def process(self, file_path: str) -> DocumentExtraction:
         """
         Meera looks at a document and extracts information.
         Optimized to do identification, extraction, and validation in ONE step.
+        A file read before (by content, whatever its name) is answered from
+        the document cache.
         """
-        # Single consolidated step: Identify -> Extract -> Validate
-        analysis = self.brain.see_and_think(
-            character=self.character,
-            image_path=file_path,
-            question="""
-            Analyze this document completely.
-            
-            PART 1: IDENTIFICATION
-            - What type of document is this? (invoice, receipt, bank statement, etc)
-            - Is it readable?
-            
-            PART 2: EXTRACTION
-            Extract ALL financial details as a JSON object inside the response. Look for:
-            - key_dates (date, due_date)
-            - entities (vendor_name, client_name, bank_name)
-            - amounts (base_amount, tax_amount, total_amount)
-            - references (invoice_number, po_number)
-            - line_items (summary of what was bought/sold)
-            
-            PART 3: VALIDATION
-            - Do the numbers add up? (base + tax = total)
-            - Are dates valid?
-            - Any warning flags?
-            
-            OUTPUT FORMAT:
-            Provide your thinking process first, then output the final extraction as a valid JSON object.
-            The JSON should have this structure:
-            {
-                "document_type": "...",
-                "extracted_data": { ... },
-                "validation_notes": "...",
-                "confidence_score": 0.0 to 1.0
-            }
-            """
-        )
+        digest, version = None, self.extraction_version()
+        if Settings.DOCUMENT_CACHE_ENABLED:
+            try:
+                digest = file_digest(file_path)
+            except OSError:
+                pass  # _extract reports the unreadable file
+        if digest:
+            cached = self.documents.get_extraction(digest, version)
+            if cached is not None:
+                return cached.model_copy(update={'file_name': file_path})
+
+        extraction = self._extract(file_path)
+        # Failed reads aren't kept, so the next upload tries again
+        if digest and extraction.extracted_data:
+            self.documents.put_extraction(digest, version, extraction)
+        return extraction
 
-        # Parse the result
-        result_json = self.brain.extract_json(analysis.response)
-        
-        # Fallback if JSON parsing fails or keys are missing - try to find type in text
-        doc_type = result_json.get("document_type")
-        if not doc_type:
-            # Fallback: Guess based on text content
-            lower_text = analysis.response.lower()
-            if "invoice" in lower_text:
-                doc_type = "invoice"
-            elif "statement" in lower_text:
-                doc_type = "bank_statement"
-            elif "receipt" in lower_text:
-                doc_type = "receipt"
-            else:
-                doc_type = "unknown_document"
+    def _extract(self, file_path: str) -> DocumentExtraction:
+        """One structured vision/PDF call: identify, extract and validate."""
+        # Single consolidated step: Identify -> Extract -> Validate
+        try:
+            analysis = self.brain.see_structured(
+                character=self.character,
+                image_path=file_path,
+                question=EXTRACTION_QUESTION,
+                schema=DocumentAnalysis
+            )
+        except Exception as e:
+            # Unreadable file or a reply that never fit the schema: hand it to a human
+            print(f"⚠️ Could not extract {file_path}: {e}")
+            return DocumentExtraction(
+                document_id=generate_id(),
+                document_type="unknown_document",
+                file_name=file_path,
+                processed_at=datetime.now(),
+                raw_text=getattr(e, "raw", ""),
+                extracted_data={},
+                confidence_notes=f"Extraction failed, needs manual review: {e}"
+            )
 
-        extracted_data = result_json.get("extracted_data", {})
-        validation_notes = result_json.get("validation_notes", analysis.response[:200]) # Fallback to raw text
+        notes = f"{analysis.validation_notes} (confidence {analysis.confidence_score:.0%})"
+        if not analysis.readable:
+            notes = f"Parts of the document are unreadable. {notes}"
 
         # Return the extraction
         return DocumentExtraction(
             document_id=generate_id(),
-            document_type=doc_type,
+            document_type=analysis.document_type,
             file_name=file_path,
             processed_at=datetime.now(),
-            raw_text=analysis.response,
-            extracted_data=extracted_data,
-            confidence_notes=validation_notes
+            raw_text=analysis.model_dump_json(),
+            extracted_data=analysis.extracted_data.model_dump(exclude_none=True),
+            confidence_notes=notes
         )
 
+    @track(name="meera.match_vendor")
+    @in_lane(Priority.BULK)
     def match_vendor(self, vendor_name: str) -> dict:
         """
         Meera tries to match extracted vendor with known vendors.
         """
         vendors = self.data_store.get_all_vendors()
-        match_result = self.brain.think(
-            character=self.character,
-            context=f"""
+        try:
+            match = self.brain.think_structured(
+                character=self.character,
+                context=f"""
             Extracted vendor name: {vendor_name}
             Known vendors in our system: {vendors}
             """,
-            question="""
-            Is this vendor already in our system? Look for:
-            - Exact matches
-            - Partial matches (abbreviations, spelling variations)
-            - Similar sounding names
-            
-            If you find a match, which one and how confident?
-            If no match, this might be a new vendor.
-            Give your answer as a JSON object with keys: matched_vendor (null if none), confidence, and notes.
-            """
-        )
-        return parse_json(match_result.response)
+                question="""
+            Is this vendor already in our system? Look for exact matches,
+            partial matches (abbreviations, spelling variations) and similar
+            sounding names. If no match, this might be a new vendor.
+            """,
+                schema=VendorMatch
+            )
+        except (StructuredOutputError, BackendUnavailable) as e:
+            print(f"⚠️ Vendor match failed for {vendor_name}: {e}")
+            return VendorMatch(matched_vendor=None, confidence=0.0, notes=f"Match failed: {e}").model_dump()
+        return match.model_dump()
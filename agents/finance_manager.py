@@ -1,41 +1,107 @@
 from datetime import date, datetime
-from opik import track
+from tools.tracing import track
+from tools.data_tools import DataTools
+from tools.memo import memoize
+from tools.context_builder import payables_context, receivables_context
 from config.characters import AgentCharacters
+from config.settings import Settings
 from tools.gemini_client import GeminiBrain
-from tools.data_store import DataStore
+from tools.data_store import DataStore, format_currency
+from tools.query_engine import QueryEngine
 from tools.models import AgentResponse
 from tools.utils import (
     format_data, format_summary, format_detailed, 
     format_cheques_issued, format_cheques_received,
-    format_vendor_context, format_client_context
+    format_vendor_context, format_client_context, LLM_FIELDS
 )
 
+# Every collection ledger_context() puts in the prompt, so every analysis that
+# sends it as its prefix depends on all of them (anomaly flags come from
+# payables and vendors). The trend needs nothing more: today's snapshot is
+# built from these collections, and the memo key already holds the date.
+LEDGER_READS = ("bank_accounts", "cheque_register", "payables", "vendors", "receivables", "clients", "financial_goals")
+
+
 class FinanceManagerAgent:
     def __init__(self):
         self.character = AgentCharacters.FINANCE_MANAGER_CHARACTER
         self.brain = GeminiBrain()
         self.data_store = DataStore()
+        self.query_engine = QueryEngine(self.data_store)
+
+    def ledger_context(self) -> str:
+        """
+        Everything Arjun's analyses read from the ledger, in one stable block.
+        Sent as the prompt prefix of each analysis so it is cached once and
+        reused across the briefing's steps; only the question part varies.
+        Payables and receivables are ranked and cut to a token budget each,
+        so the payments and collections steps see the invoices that matter.
+        """
+        ds = self.data_store
+        cheques = ds.get_cheque_register()
+        vendors, clients = ds.get_all_vendors(), ds.get_all_clients()
+        return f"""
+LEDGER SNAPSHOT
+BANK ACCOUNTS: {format_data(ds.get_all_bank_accounts(), LLM_FIELDS['bank_accounts'])}
+CHEQUES ISSUED (not yet cleared): {format_cheques_issued(cheques)}
+CHEQUES RECEIVED (not yet cleared): {format_cheques_received(cheques)}
+PENDING PAYMENTS (most urgent and material first): {payables_context(ds.get_all_payables(), vendors, Settings.PAYABLES_CONTEXT_TOKENS)}
+VENDOR INFORMATION: {format_vendor_context(vendors)}
+ANOMALY FLAGS (duplicates, GST, outliers): {format_detailed(ds.get_payable_flags(), LLM_FIELDS['flags'])}
+RECEIVABLES (what clients owe us, most urgent first): {receivables_context(ds.get_all_receivables(), clients, Settings.RECEIVABLES_CONTEXT_TOKENS)}
+CLIENT INFORMATION: {format_client_context(clients)}
+FINANCIAL GOALS: {format_data(ds.get_financial_goals(), LLM_FIELDS['goals'])}
+"""
+
+    def briefing_package(self) -> str:
+        """
+        The whole briefing's inputs, worked out locally: totals and the cash
+        left after what is due, then the ranked ledgers, flags, goals and
+        trend. Compact enough to answer in one structured call.
+        """
+        ds = self.data_store
+        cheques = ds.get_pending_cheques_summary()
+        payables, receivables = ds.get_all_payables(), ds.get_all_receivables()
+        vendors, clients = ds.get_all_vendors(), ds.get_all_clients()
+        balance = ds.get_total_bank_balance()
+        credit = sum(float(a.get('cc_limit') or 0) for a in ds.get_all_bank_accounts())
+        due_payables = [p for p in payables if p.get('status') in ('Overdue', 'Due Today')]
+        due_total = sum(float(p.get('net_payable') or 0) for p in due_payables)
+        overdue_receivables = ds.get_overdue_receivables()
+        return f"""
+TODAY: {date.today()} ({date.today().strftime('%A')})
+CASH
+Bank balance: {format_currency(balance)} | Credit lines: {format_currency(credit)}
+Uncleared cheques issued: {format_currency(cheques['issued'])} | received: {format_currency(cheques['received'])}
+Available after uncleared cheques: {format_currency(balance - cheques['issued'])}
+Pending payables: {format_currency(ds.get_total_pending_payables())} | overdue or due today: {format_currency(due_total)} ({len(due_payables)} bills)
+Pending receivables: {format_currency(ds.get_total_pending_receivables())} | overdue: {format_currency(sum(float(r.get('balance_due') or 0) for r in overdue_receivables))} ({len(overdue_receivables)} invoices)
+Left if every due bill is paid: {format_currency(balance - cheques['issued'] - due_total)}
+TREND: {ds.get_trend_summary()}
+PAYABLES (most urgent and material first): {payables_context(payables, vendors, Settings.BRIEFING_PACKAGE_PAYABLES_TOKENS)}
+ANOMALY FLAGS: {format_detailed(ds.get_payable_flags(), LLM_FIELDS['flags'])}
+RECEIVABLES (most urgent first): {receivables_context(receivables, clients, Settings.BRIEFING_PACKAGE_RECEIVABLES_TOKENS)}
+FINANCIAL GOALS: {format_data(ds.get_financial_goals(), LLM_FIELDS['goals'])}
+"""
 
     @track(name="arjun.analyze_cash")
+    @memoize(*LEDGER_READS)
     def analyze_cash_position(self) -> AgentResponse:
         """
         Arjun looks at the company's cash situation and assesses it.
         """
         # Gather all relevant data
-        bank_accounts = self.data_store.get_all_bank_accounts()
-        cheques = self.data_store.get_cheque_register()
         pending_payables = self.data_store.get_all_payables()
         pending_receivables = self.data_store.get_all_receivables()
 
         # Arjun thinks about the cash situation
         analysis = self.brain.think(
             character=self.character,
+            prefix=self.ledger_context(),
             context=f"""
-BANK ACCOUNTS: {format_data(bank_accounts)}
-CHEQUES ISSUED (not yet cleared): {format_cheques_issued(cheques)}
-CHEQUES RECEIVED (not yet cleared): {format_cheques_received(cheques)}
 PENDING PAYMENTS (what we owe): {format_summary(pending_payables)}
 PENDING COLLECTIONS (what we're owed): {format_summary(pending_receivables)}
+TREND (last 90 days): {self.data_store.get_trend_summary()}
 TODAY'S DATE: {date.today()}
 """,
             question="""
@@ -53,19 +119,17 @@ Give me your assessment as our Finance Manager. Be honest and direct.
         return analysis
 
     @track(name="arjun.recommend_payments")
+    @memoize(*LEDGER_READS)
     def recommend_payments(self, cash_analysis: str) -> AgentResponse:
         """
         Arjun decides which payments to make and which to hold.
         """
-        payables = self.data_store.get_all_payables()
-        vendors = self.data_store.get_all_vendors()
-
+        # Payables, vendors and anomaly flags are in the ledger prefix
         recommendation = self.brain.think(
             character=self.character,
+            prefix=self.ledger_context(),
             context=f"""
 CASH SITUATION: {cash_analysis}
-PENDING PAYMENTS: {format_detailed(payables)}
-VENDOR INFORMATION: {format_vendor_context(vendors)}
 TODAY: {date.today()}
 """,
             question="""
@@ -92,18 +156,16 @@ Format your response as:
         return recommendation
 
     @track(name="arjun.analyze_collections")
+    @memoize(*LEDGER_READS)
     def analyze_collections(self) -> AgentResponse:
         """
         Arjun reviews receivables and collection status.
         """
-        receivables = self.data_store.get_all_receivables()
-        clients = self.data_store.get_all_clients()
-
+        # Receivables and client information are in the ledger prefix
         analysis = self.brain.think(
             character=self.character,
+            prefix=self.ledger_context(),
             context=f"""
-RECEIVABLES (what clients owe us): {format_detailed(receivables)}
-CLIENT INFORMATION: {format_client_context(clients)}
 TODAY: {date.today()}
 """,
             question="""
@@ -128,43 +190,37 @@ Give me a practical assessment.
         """
         Arjun answers any finance-related question.
         """
-        # Gather relevant context
-        context = self._gather_relevant_context(question)
-        answer = self.brain.think(
-            character=self.character,
-            context=context,
-            question=question
-        )
-        return answer
+        # Simple numeric questions are answered straight from the ledger
+        direct_answer = self.query_engine.answer(question)
+        if direct_answer is not None:
+            return AgentResponse(
+                agent_name="Arjun",
+                query=question,
+                thinking="Answered directly from ledger data.",
+                response=direct_answer,
+                confidence=1.0,
+                needs_human_review=False,
+                timestamp=datetime.now()
+            )
 
-    def _gather_relevant_context(self, question: str) -> str:
-        """
-        Arjun figures out what data he needs to answer the question.
-        """
-        # Ask Arjun what data he needs
-        data_needs = self.brain.think(
+        # Arjun fetches exactly the records he needs through the ledger tools
+        if self.brain.backend.supports_tools:
+            return self.brain.think_with_tools(
+                character=self.character,
+                context=f"TODAY: {date.today()}\nUse the ledger tools to look up the figures you need.",
+                question=question,
+                tools=DataTools(self.data_store)
+            )
+        # Backends without function calling get the budgeted ledger instead
+        return self.brain.think(
             character=self.character,
-            context=f"Question: {question}",
-            question="What data do you need to answer this question? Just name the data types if possible (e.g., bank accounts, vendors, payables)."
+            prefix=self.ledger_context(),
+            context=f"TODAY: {date.today()}",
+            question=question
         )
-        
-        # Simple fetch logic: if it's in the response, get it.
-        # This is a basic implementation of Arjun's "thinking" about what he needs.
-        needs = data_needs.response.lower()
-        context_parts = []
-        
-        if "bank" in needs or "cash" in needs:
-            context_parts.append(f"BANK ACCOUNTS: {format_data(self.data_store.get_all_bank_accounts())}")
-        if "vendor" in needs or "payment" in needs or "payable" in needs:
-            context_parts.append(f"PAYABLES: {format_summary(self.data_store.get_all_payables())}")
-            context_parts.append(f"VENDORS: {format_vendor_context(self.data_store.get_all_vendors())}")
-        if "client" in needs or "collection" in needs or "receivable" in needs:
-            context_parts.append(f"RECEIVABLES: {format_summary(self.data_store.get_all_receivables())}")
-            context_parts.append(f"CLIENTS: {format_client_context(self.data_store.get_all_clients())}")
-            
-        return "\n\n".join(context_parts) if context_parts else "No specific context gathered."
 
     @track(name="arjun.analyze_goals")
+    @memoize(*LEDGER_READS)
     def analyze_financial_goals(self) -> AgentResponse:
         """
         Arjun reviews progress towards financial goals.
@@ -186,8 +242,8 @@ Give me a practical assessment.
         
         analysis = self.brain.think(
             character=self.character,
+            prefix=self.ledger_context(),
             context=f"""
-FINANCIAL GOALS: {format_data(goals)}
 TOTAL LIQUID CASH AVAILABLE: {total_cash}
 TODAY: {date.today()}
 """,
@@ -1,13 +1,19 @@
 import os
 import json
+import asyncio
 from datetime import datetime
-from opik import track
+from tools.tracing import track
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
 from config.characters import AgentCharacters
-from tools.gemini_client import GeminiBrain
+from config.settings import Settings
+from tools.gemini_client import GeminiBrain, StructuredOutputError
+from tools.resilience import BackendUnavailable, with_deadline
+from tools.rate_limiter import Priority, in_lane
+from tools.progressive_message import ProgressiveMessage
+from tools.conversation_memory import ConversationMemory, brain_summarizer
 from agents.cfo_brain import CFOBrainAgent
-from tools.utils import parse_json
+from tools.models import MessageUnderstanding
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -29,16 +35,15 @@ class HumanInterfaceAgent:
             self.contexts[chat_id] = {
                 "pending_actions": "None",
                 "last_message": "None",
-                "pending": {}
+                "pending": {},
+                # Recent turns plus a running summary, at a bounded size
+                "memory": ConversationMemory(summarize=brain_summarizer(self.brain))
             }
         return self.contexts[chat_id]
 
-    @track(name="priya.format_briefing")
-    def format_for_human(self, briefing_data: dict) -> str:
-        """
-        Priya takes the CFO's briefing and formats it for the human.
-        """
-        formatted = self.brain.think(
+    def _briefing_prompt(self, briefing_data: dict) -> dict:
+        """What Priya is asked when formatting the CFO's briefing."""
+        return dict(
             character=self.character,
             context=f"""
 CFO'S BRIEFING: {briefing_data['briefing']}
@@ -55,32 +60,79 @@ Format this briefing for a busy executive reading on their phone. Make it:
 Keep it under 3000 characters. Make sure they can respond with simple words like YES, NO, APPROVE, HOLD.
 """
         )
+
+    @track(name="priya.format_briefing")
+    def format_for_human(self, briefing_data: dict) -> str:
+        """
+        Priya takes the CFO's briefing and formats it for the human.
+        """
+        if briefing_data.get("mode") == "single":
+            # Written for the phone in the same call as the briefing
+            return briefing_data["formatted"]
+        formatted = self.brain.think(**self._briefing_prompt(briefing_data))
         return formatted.response
 
-    @track(name="priya.understand_message")
-    def understand_message(self, message: str, context: dict) -> dict:
+    @track(name="priya.format_briefing")
+    @with_deadline(Settings.BRIEFING_DEADLINE_SECONDS)
+    async def send_briefing(self, bot, chat_id: int, briefing_data: dict) -> str:
         """
-        Priya figures out what the human is saying.
+        Stream Priya's formatted briefing into a Telegram message as it is written.
         """
-        understanding_resp = self.brain.think(
+        message = ProgressiveMessage(bot, chat_id)
+        if briefing_data.get("mode") == "single":
+            await message.finish(briefing_data["formatted"])
+            return briefing_data["formatted"]
+        await message.start("📊 Preparing your briefing...")
+        return await message.stream(self.brain.astream_think(**self._briefing_prompt(briefing_data)))
+
+    def _understanding_prompt(self, message: str, context: dict) -> dict:
+        """What Priya is asked when working out a message's intent."""
+        memory = context.get('memory')
+        return dict(
             character=self.character,
             context=f"""
 PENDING ITEMS WE'RE WAITING FOR RESPONSE ON: {context.get('pending_actions', 'None')}
+CONVERSATION SO FAR: {memory.render() if memory else 'None'}
 LAST MESSAGE WE SENT: {context.get('last_message', 'None')}
 HUMAN'S MESSAGE: {message}
 """,
             question="""
-What is the human telling us? 
-Think about their intent. Are they approving, rejecting, asking a question, or giving instructions?
-
-Give your answer as a JSON object with keys:
-- "intent": (approval/rejection/question/instruction/acknowledgment)
-- "is_decision": (boolean)
-- "explanation": (what you understood)
-- "reply_suggestion": (how we should reply)
-"""
+What is the human telling us? Are they approving, rejecting, asking a
+question, or giving instructions?
+""",
+            schema=MessageUnderstanding
         )
-        return parse_json(understanding_resp.response)
+
+    def _misunderstood(self, error: Exception) -> dict:
+        """Safe reading of a message Priya couldn't parse: never treated as a decision."""
+        print(f"⚠️ Could not work out the message's intent: {error}")
+        return MessageUnderstanding(
+            intent="question",
+            is_decision=False,
+            explanation="Could not parse the message's intent",
+            reply_suggestion="Sorry sir, I didn't quite get that. Could you say it another way?"
+        ).model_dump()
+
+    @track(name="priya.understand_message")
+    def understand_message(self, message: str, context: dict) -> dict:
+        """
+        Priya figures out what the human is saying.
+        """
+        try:
+            return self.brain.think_structured(**self._understanding_prompt(message, context)).model_dump()
+        except (StructuredOutputError, BackendUnavailable) as e:
+            return self._misunderstood(e)
+
+    @track(name="priya.understand_message")
+    async def aunderstand_message(self, message: str, context: dict) -> dict:
+        """
+        Async understand_message for the Telegram handlers.
+        """
+        try:
+            understanding = await self.brain.athink_structured(**self._understanding_prompt(message, context))
+            return understanding.model_dump()
+        except (StructuredOutputError, BackendUnavailable) as e:
+            return self._misunderstood(e)
 
     def _is_decision(self, understanding: dict) -> bool:
         """Check if Priya thinks this is a decision."""
@@ -93,6 +145,8 @@ Give your answer as a JSON object with keys:
         # For implementation purposes, we'll assume an 'app' instance is provided or initialized
         print(f"TELEGRAM SEND -> {chat_id}: {text}")
 
+    @in_lane(Priority.INTERACTIVE)
+    @with_deadline(Settings.INTERACTIVE_DEADLINE_SECONDS)
     async def on_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle incoming message from human."""
         message = update.message.text
@@ -100,13 +154,19 @@ Give your answer as a JSON object with keys:
         
         # Get conversation context
         conv_context = self.get_context(chat_id)
+
+        # Show something straight away; the reply replaces it
+        reply = ProgressiveMessage(context.bot, chat_id)
+        await reply.start("💭 ...")
         
         # Priya understands the message
-        understanding = self.understand_message(message, conv_context)
+        understanding = await self.aunderstand_message(message, conv_context)
         
         # Route to CFOBrain if it's a decision
         if self._is_decision(understanding):
-            result = self.cfo_brain.process_human_response(
+            # Rajesh's pipeline is synchronous; keep it off the event loop
+            result = await asyncio.to_thread(
+                self.cfo_brain.process_human_response,
                 message, 
                 conv_context.get('pending')
             )
@@ -118,23 +178,35 @@ Give your answer as a JSON object with keys:
         # Update context
         conv_context["last_message"] = response
         
-        await update.message.reply_text(response)
+        await reply.finish(response)
 
+        # After replying: folding old turns may mean a summary call
+        memory = conv_context["memory"]
+        await asyncio.to_thread(memory.add, "User", message)
+        await asyncio.to_thread(memory.add, "Priya", response)
+
+    @with_deadline(Settings.DOCUMENT_DEADLINE_SECONDS)
     async def on_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle document/photo upload."""
         doc = update.message.document or update.message.photo[-1]
         file = await context.bot.get_file(doc.file_id)
         
         file_name = doc.file_name if hasattr(doc, 'file_name') else f"photo_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        file_path = os.path.join("data", file_name)
+        documents = self.cfo_brain.doc_processor.documents
+        download_path = documents.incoming_path(file_name)
         
-        await file.download_to_drive(file_path)
+        await file.download_to_drive(download_path)
+        # Stored once by content: a forwarded or renamed copy maps to the same file
+        stored = await asyncio.to_thread(documents.add, download_path, file_name)
         
         # Notify human we're processing
-        await update.message.reply_text("I've received the document. Meera and Rajesh are looking at it now...")
+        if stored.duplicate:
+            await update.message.reply_text("I've seen this exact document before, so this should be quick. Rajesh is looking at it now...")
+        else:
+            await update.message.reply_text("I've received the document. Meera and Rajesh are looking at it now...")
 
         # Send to CFOBrain for processing
-        result = self.cfo_brain.handle_new_document(file_path)
+        result = await asyncio.to_thread(self.cfo_brain.handle_new_document, stored.path)
         
         # Format response
         decision = result.get("cfo_decision", "The CFO is still reviewing this.")
@@ -142,11 +214,14 @@ Give your answer as a JSON object with keys:
         await update.message.reply_text(f"Update on {file_name}:\n\n{decision}")
 
     @track(name="priya.send_alert")
+    @in_lane(Priority.ALERT)
+    @with_deadline(Settings.INTERACTIVE_DEADLINE_SECONDS)
     async def send_alert(self, chat_id: int, alert_data: dict, bot):
         """
         Priya sends an urgent alert.
         """
-        formatted = self.brain.think(
+        message = ProgressiveMessage(bot, chat_id)
+        await message.stream(self.brain.astream_think(
             character=self.character,
             context=f"ALERT DATA: {alert_data}",
             question="""
@@ -158,9 +233,7 @@ Format this as an URGENT alert message. Make it:
 
 Use 🚨 emoji to grab attention.
 """
-        )
-        
-        await bot.send_message(chat_id=chat_id, text=formatted.response)
+        ))
 
     def handle_directly(self, message: str, understanding: dict) -> str:
         """Priya answers simple things directly."""
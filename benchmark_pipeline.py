@@ -0,0 +1,150 @@
+"""
+Benchmark the agent pipeline offline, repeatably.
+
+    python3 benchmark_pipeline.py                           # fake backend, no network or key
+    LLM_BACKEND=replay python3 benchmark_pipeline.py --runs 5
+    python3 benchmark_pipeline.py --profile                 # plus a cProfile of the whole run
+    python3 benchmark_pipeline.py --ab                      # briefing modes: pipeline vs single call
+
+Record a cassette for replay with a live key first:
+    LLM_BACKEND=record python3 benchmark_pipeline.py --runs 1
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Settings are read at import time, so choose the offline setup first
+os.environ.setdefault("LLM_BACKEND", "fake")
+# Measure the real path, not response cache or agent memo hits
+os.environ.setdefault("LLM_CACHE_ENABLED", "False")
+os.environ.setdefault("AGENT_MEMO_ENABLED", "False")
+# Pacing for the live quota would dominate offline timings
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+# Keep benchmark calls out of the usage log (metrics stay in memory)
+os.environ.setdefault("METRICS_PATH", "")
+
+from config.settings import Settings
+from agents.cfo_brain import CFOBrainAgent
+from agents.human_interface import HumanInterfaceAgent
+from tools.briefing_state import BriefingState
+from tools.call_metrics import CallMetrics, get_shared_metrics
+from tools.data_store import DataStore
+from tools.query_engine import QueryEngine
+
+
+def sandboxed_rajesh(state_dir: Path) -> CFOBrainAgent:
+    """
+    Rajesh and Arjun on a copy of the ledger in `state_dir`, so the daily
+    snapshot, the briefing state and any writes stay out of data/.
+    """
+    rajesh = CFOBrainAgent()
+    shutil.copy(rajesh.data_store.db_path, state_dir / "database.json")
+    store = DataStore(db_path=str(state_dir / "database.json"))
+    rajesh.data_store = rajesh.finance_manager.data_store = store
+    rajesh.finance_manager.query_engine = QueryEngine(store)
+    rajesh.briefing_state = BriefingState(state_dir / "briefing_state.json")
+    return rajesh
+
+
+def build_stages(state_dir: Path) -> dict:
+    rajesh = sandboxed_rajesh(state_dir)
+    arjun = rajesh.finance_manager
+    priya = HumanInterfaceAgent()
+    priya.cfo_brain = rajesh
+    pending = {"pending_actions": "Approve GST payment", "actions_needed": "Pay Vendor A? (Yes/No)"}
+
+    return {
+        "briefing (full)": lambda: rajesh.create_daily_briefing(full=True),
+        "cash analysis": arjun.analyze_cash_position,
+        "answer question": lambda: arjun.answer_question("How much do we owe vendors this week?"),
+        "understand message": lambda: priya.understand_message("Yes, pay the GST now.", pending),
+        "process response": lambda: rajesh.process_human_response("Yes, go ahead with Vendor A.", pending),
+    }
+
+
+def run(runs: int) -> dict:
+    """Wall-clock seconds per stage, one entry per run"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        stages = build_stages(Path(state_dir))
+        timings = {name: [] for name in stages}
+        for _ in range(runs):
+            for name, stage in stages.items():
+                started = time.perf_counter()
+                stage()
+                timings[name].append(time.perf_counter() - started)
+    return timings
+
+
+def run_ab(runs: int) -> dict:
+    """Briefing plus Priya's formatting, per briefing mode: latency and tokens"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        rajesh = sandboxed_rajesh(Path(state_dir))
+        priya = HumanInterfaceAgent()
+        metrics = get_shared_metrics()
+        results = {}
+        for mode in ("pipeline", "single"):
+            seen = len(metrics.records())
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                priya.format_for_human(rajesh._create_full_briefing(mode))
+                samples.append(time.perf_counter() - started)
+            calls = metrics.records()[seen:]
+            results[mode] = {
+                'seconds': samples,
+                'calls': len(calls) / runs,
+                'prompt_tokens': sum(r.prompt_tokens for r in calls) / runs,
+                'completion_tokens': sum(r.completion_tokens for r in calls) / runs,
+            }
+    return results
+
+
+def print_ab(results: dict):
+    print(f"\n--- BRIEFING MODES (backend: {Settings.LLM_BACKEND}, per briefing) ---")
+    print(f"{'mode':<10} {'calls':>6} {'median ms':>10} {'prompt tok':>11} {'output tok':>11}")
+    for mode, r in results.items():
+        print(f"{mode:<10} {r['calls']:>6.1f} {statistics.median(r['seconds']) * 1000:>10.1f} "
+              f"{r['prompt_tokens']:>11.0f} {r['completion_tokens']:>11.0f}")
+
+
+def print_timings(timings: dict):
+    print(f"\n--- PIPELINE BENCHMARK (backend: {Settings.LLM_BACKEND}) ---")
+    print(f"{'stage':<22} {'runs':>4} {'min ms':>9} {'median ms':>10} {'max ms':>9}")
+    for name, samples in timings.items():
+        print(f"{name:<22} {len(samples):>4} {min(samples) * 1000:>9.1f} "
+              f"{statistics.median(samples) * 1000:>10.1f} {max(samples) * 1000:>9.1f}")
+    print("\n" + CallMetrics.format_report(CallMetrics.report(get_shared_metrics().records())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent pipeline without the network")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--profile", action="store_true", help="print the top functions by cumulative time")
+    parser.add_argument("--ab", action="store_true", help="compare the pipeline and single-call briefing modes")
+    args = parser.parse_args()
+
+    if args.ab:
+        print_ab(run_ab(args.runs))
+        return
+
+    if not args.profile:
+        print_timings(run(args.runs))
+        return
+
+    profiler = cProfile.Profile()
+    timings = profiler.runcall(run, args.runs)
+    print_timings(timings)
+    print("\n--- PROFILE (top 25 by cumulative time) ---")
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,5 +13,109 @@ class Settings:
 
     # App Config
     DEBUG = os.getenv("DEBUG", "False").lower() == "true"
-    MODEL_NAME = "gemini-flash-latest"
-    VISION_MODEL_NAME = "gemini-flash-latest"
+    MODEL_NAME = os.getenv("MODEL_NAME", "gemini-flash-latest")
+    VISION_MODEL_NAME = os.getenv("VISION_MODEL_NAME", "gemini-flash-latest")
+
+    # Where model calls go: gemini (live), record (live + save to the cassette),
+    # replay (answer from the cassette, no network) or fake (made-up, schema-valid answers)
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+    LLM_CASSETTE = os.getenv("LLM_CASSETTE", "data/cassettes/llm.jsonl")
+    LLM_REPLAY_LATENCY_SCALE = float(os.getenv("LLM_REPLAY_LATENCY_SCALE", "1.0"))
+    LLM_REPLAY_STRICT = os.getenv("LLM_REPLAY_STRICT", "False").lower() == "true"
+    LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "0"))
+
+    # Model routing: each agent method maps to a tier (lite / standard / heavy).
+    # Standard is MODEL_NAME. Override single call sites with e.g.
+    # MODEL_ROUTES="rajesh.daily_briefing=gemini-pro-latest,arjun.answer_question=lite"
+    MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "True").lower() == "true"
+    MODEL_TIER_LITE = os.getenv("MODEL_TIER_LITE", "gemini-flash-lite-latest")
+    MODEL_TIER_HEAVY = os.getenv("MODEL_TIER_HEAVY", MODEL_NAME)
+    MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+
+    # Daily briefing: send only overnight changes unless the last full
+    # briefing is too old or too much has changed
+    BRIEFING_FULL_REFRESH_DAYS = int(os.getenv("BRIEFING_FULL_REFRESH_DAYS", "7"))
+    BRIEFING_MAX_DELTA_CHANGES = int(os.getenv("BRIEFING_MAX_DELTA_CHANGES", "30"))
+    # Briefing steps that don't depend on each other run in parallel
+    BRIEFING_MAX_WORKERS = int(os.getenv("BRIEFING_MAX_WORKERS", "4"))
+    # "pipeline": Arjun's analyses, Rajesh's synthesis and Priya's formatting
+    # as separate calls; "single": one structured call on a precomputed package
+    BRIEFING_MODE = os.getenv("BRIEFING_MODE", "pipeline").lower()
+    # Token budgets for the payables / receivables tables in that package
+    BRIEFING_PACKAGE_PAYABLES_TOKENS = int(os.getenv("BRIEFING_PACKAGE_PAYABLES_TOKENS", "2000"))
+    BRIEFING_PACKAGE_RECEIVABLES_TOKENS = int(os.getenv("BRIEFING_PACKAGE_RECEIVABLES_TOKENS", "1500"))
+
+    # Gemini response cache (memory LRU + disk)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+    LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "data/cache/llm")
+    LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+    LLM_CACHE_DISK_MB = int(os.getenv("LLM_CACHE_DISK_MB", "50"))
+
+    # Max Gemini calls in flight at once from async code
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+    # Client-side Gemini budget (requests and tokens per minute)
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+    GEMINI_RPM = int(os.getenv("GEMINI_RPM", "15"))
+    GEMINI_TPM = int(os.getenv("GEMINI_TPM", "250000"))
+
+    # Explicit context caching of stable prompt prefixes (character + ledger snapshot).
+    # Gemini refuses caches below a minimum size, so small prefixes go inline.
+    CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "True").lower() == "true"
+    CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "600"))
+    CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+    # Time limits: one API attempt, and the whole of a request from each entry point
+    GEMINI_CALL_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "45"))
+    INTERACTIVE_DEADLINE_SECONDS = float(os.getenv("INTERACTIVE_DEADLINE_SECONDS", "30"))
+    DOCUMENT_DEADLINE_SECONDS = float(os.getenv("DOCUMENT_DEADLINE_SECONDS", "90"))
+    BRIEFING_DEADLINE_SECONDS = float(os.getenv("BRIEFING_DEADLINE_SECONDS", "240"))
+
+    # Hedging: send a duplicate request when a call runs past the usual latency
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "False").lower() == "true"
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+    # Identical requests made at the same time share one API call
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+
+    # Chat memory: recent turns kept verbatim, older ones folded into a summary
+    CHAT_WINDOW_TURNS = int(os.getenv("CHAT_WINDOW_TURNS", "8"))
+    CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+    CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+
+    # Most model round trips for one tool-using answer (each round can fetch data)
+    TOOL_MAX_ROUNDS = int(os.getenv("TOOL_MAX_ROUNDS", "4"))
+
+    # Uploads, stored once per content hash with their extractions
+    DOCUMENT_CACHE_ENABLED = os.getenv("DOCUMENT_CACHE_ENABLED", "True").lower() == "true"
+    UPLOAD_DIR = os.getenv("UPLOAD_DIR", "data/uploads")
+    UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "500"))
+    UPLOAD_RETENTION_DAYS = float(os.getenv("UPLOAD_RETENTION_DAYS", "90"))
+
+    # PDF text sent with a document: pages are read until PDF_MAX_CHARS is met;
+    # documents of PDF_PARALLEL_MIN_PAGES or more are read across a process pool
+    PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "30000"))
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+    PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+    PDF_PAGE_CACHE_ENTRIES = int(os.getenv("PDF_PAGE_CACHE_ENTRIES", "2048"))
+
+    # Token budgets for the payables / receivables tables in Arjun's ledger context
+    PAYABLES_CONTEXT_TOKENS = int(os.getenv("PAYABLES_CONTEXT_TOKENS", "4000"))
+    RECEIVABLES_CONTEXT_TOKENS = int(os.getenv("RECEIVABLES_CONTEXT_TOKENS", "3000"))
+
+    # Agent analyses are reused until the ledger collections they read change
+    AGENT_MEMO_ENABLED = os.getenv("AGENT_MEMO_ENABLED", "True").lower() == "true"
+    AGENT_MEMO_MAX_ENTRIES = int(os.getenv("AGENT_MEMO_MAX_ENTRIES", "32"))
+
+    # Circuit breaker: after this many failures in a row, stop calling Gemini for a while
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+    # Minimum seconds between edits of a streaming Telegram message
+    TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.5"))
+
+    # Per-call token/latency log (JSON lines)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    METRICS_PATH = os.getenv("METRICS_PATH", "data/metrics/llm_calls.jsonl")
@@ -11,6 +11,12 @@ from agents.cfo_brain import CFOBrainAgent
 from agents.human_interface import HumanInterfaceAgent
 from agents.finance_manager import FinanceManagerAgent
 from tools.data_store import DataStore
+from tools.query_engine import QueryEngine
+from tools.call_metrics import CallMetrics, get_shared_metrics
+from tools.resilience import deadline, get_shared_breaker, get_shared_hedger
+from tools.single_flight import get_shared_flights
+from tools.memo import memo_stats
+from config.settings import Settings
 
 # Configure logging
 logging.basicConfig(
@@ -48,37 +54,76 @@ async def run_telegram_bot():
     while True:
         await asyncio.sleep(1)
 
-def run_daily_briefing(chat_id: str):
+def run_daily_briefing(chat_id: str, full: bool = False):
     """Generate and send daily briefing."""
     logger.info("Rajesh is preparing the daily briefing...")
     cfo_brain = CFOBrainAgent()
     human_interface = HumanInterfaceAgent()
     
-    briefing_data = cfo_brain.create_daily_briefing()
-    formatted = human_interface.format_for_human(briefing_data)
+    briefing_data = cfo_brain.create_daily_briefing(full=full)
+    logger.info(f"Briefing mode: {briefing_data.get('mode')}, step timings: {briefing_data.get('timings')}")
     
-    logger.info("Briefing prepared. Sending to Telegram...")
+    logger.info("Briefing prepared. Streaming to Telegram...")
     
     # In a real async environment, this would be part of an event loop
     async def send():
         app = ApplicationBuilder().token(human_interface.token).build()
-        await app.bot.send_message(chat_id=chat_id, text=formatted)
+        # Priya's formatting streams into the chat as she writes it
+        try:
+            await human_interface.send_briefing(app.bot, chat_id, briefing_data)
+        except Exception as e:
+            # The message already says it broke off; keep the run's metrics
+            logger.error(f"Briefing stream failed part way: {e}")
+            return
         logger.info("Briefing sent successfully.")
 
     asyncio.run(send())
+    log_run_metrics()
+
+def log_run_metrics():
+    """Token/latency summary of this run's Gemini calls."""
+    metrics = get_shared_metrics()
+    logger.info("Gemini usage this run:\n" + CallMetrics.format_report(CallMetrics.report(metrics.records())))
+    logger.info(f"Gemini breaker: {get_shared_breaker().stats()}, hedging: {get_shared_hedger().stats()}, "
+                f"single-flight: {get_shared_flights().stats()}, agent memo: {memo_stats()}")
 
-def check_status():
+def show_metrics(all_runs: bool = False):
+    """Per-call-site token and latency report from the metrics file (last run by default)."""
+    metrics = get_shared_metrics()
+    run_id = None if all_runs else metrics.last_run_id()
+    records = metrics.records(run_id)
+    print(f"\n--- GEMINI USAGE ({'all runs' if all_runs else f'run {run_id}'}) ---")
+    print(CallMetrics.format_report(CallMetrics.report(records)))
+    print("--------------------------------\n")
+
+def check_status(fast: bool = False):
     """Quick status check of the system."""
+    if fast:
+        # Straight from the ledger, no LLM call
+        print("\n--- CURRENT FINANCIAL STATUS ---")
+        print(QueryEngine(DataStore()).status_report())
+        print("--------------------------------\n")
+        return
+
     logger.info("Arjun is analyzing the cash position...")
     fm = FinanceManagerAgent()
     try:
-        analysis = fm.analyze_cash_position()
+        with deadline(Settings.INTERACTIVE_DEADLINE_SECONDS):
+            analysis = fm.analyze_cash_position()
         print("\n--- CURRENT FINANCIAL STATUS ---")
         print(analysis.response)
         print("--------------------------------\n")
+        log_run_metrics()
     except Exception as e:
         logger.error(f"Error checking status: {e}")
 
+def record_snapshot():
+    """Append today's position to the snapshot history (run daily, e.g. from cron)."""
+    ds = DataStore()
+    if ds.record_snapshot():
+        print(f"Snapshot recorded for {date.today()} ({len(ds.snapshots)} days of history).")
+        print(ds.get_trend_summary())
+
 def verify_connections():
     """Verify all external connections."""
     logger.info("Verifying connections...")
@@ -90,7 +135,7 @@ def verify_connections():
         # Check Gemini (via an agent)
         fm = FinanceManagerAgent()
         # Simple think call to verify API key
-        fm.brain.model.generate_content("Ping")
+        fm.brain.backend.generate("Ping", model_name=fm.brain.model_name)
         logger.info("✅ Google Gemini connection verified.")
         
         # Check Telegram token
@@ -107,7 +152,7 @@ def verify_connections():
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python main.py [bot|briefing|status|verify]")
+        print("Usage: python main.py [bot|briefing [--full]|status [--fast]|snapshot|metrics [--all]|verify]")
         sys.exit(1)
 
     command = sys.argv[1]
@@ -125,10 +170,16 @@ if __name__ == "__main__":
         if not chat_id:
             print("Error: CFO_CHAT_ID not found in .env")
         else:
-            run_daily_briefing(chat_id)
+            run_daily_briefing(chat_id, full="--full" in sys.argv[2:])
             
     elif command == "status":
-        check_status()
+        check_status(fast="--fast" in sys.argv[2:])
+        
+    elif command == "snapshot":
+        record_snapshot()
+
+    elif command == "metrics":
+        show_metrics(all_runs="--all" in sys.argv[2:])
         
     elif command == "verify":
         if verify_connections():
@@ -138,4 +189,4 @@ if __name__ == "__main__":
             
     else:
         print(f"Unknown command: {command}")
-        print("Usage: python main.py [bot|briefing|status|verify]")
+        print("Usage: python main.py [bot|briefing [--full]|status [--fast]|snapshot|metrics [--all]|verify]")
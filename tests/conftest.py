@@ -0,0 +1,11 @@
+import shutil
+import pytest
+from tools.data_store import DataStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """DataStore over a throwaway copy of the sample database."""
+    db_path = tmp_path / "database.json"
+    shutil.copy("data/database.json", db_path)
+    return DataStore(db_path=str(db_path))
@@ -0,0 +1,74 @@
+from datetime import date
+from tools.briefing_state import ledger_state, compute_diff, diff_size, format_diff
+
+
+def test_ledger_diff_picks_up_overnight_changes(store):
+    before = ledger_state(store)
+
+    store.update_payable("PUR001", {"status": "Paid"})
+    store.update_bank_balance("BA001", 2000000)
+    store.add_receivable({
+        "invoice_id": "INV010", "client_id": "CLI006", "client_name": "XYZ Manufacturing",
+        "project_id": "PRJ006", "invoice_number": "SC-PROG-002-PRJ006",
+        "invoice_date": "2025-01-15", "due_date": "2025-02-14",
+        "base_amount": 500000, "gst_amount": 90000, "total_amount": 590000,
+        "tds_deducted": 10000, "retention_held": 0, "net_receivable": 580000,
+        "amount_received": 0, "balance_due": 580000, "status": "Pending"
+    })
+
+    diff = compute_diff(before, ledger_state(store), since=date(2025, 1, 15), today=date(2025, 1, 17))
+
+    assert [c['invoice_id'] for c in diff['status_changes']] == ["PUR001"]
+    assert [n['invoice_id'] for n in diff['new_invoices']] == ["INV010"]
+    assert diff['balance_moves'][0]['change'] == 2000000 - 2865935
+    # Due on the 16th and still unpaid on the 17th
+    assert {o['invoice_id'] for o in diff['newly_overdue']} == {"PUR005", "PUR006"}
+
+    text = format_diff(diff)
+    assert "STATUS payable: PUR001 ABC Steel Traders Pending -> Paid" in text
+
+
+def test_identical_ledgers_have_empty_diff(store):
+    state = ledger_state(store)
+    diff = compute_diff(state, state, since=date(2025, 1, 15), today=date(2025, 1, 15))
+    assert diff_size(diff) == 0
+    assert format_diff(diff) == "No changes."
+
+
+def test_task_graph_runs_independent_steps_concurrently():
+    import threading
+    from tools.task_graph import TaskGraph
+
+    barrier = threading.Barrier(2, timeout=2)
+
+    def independent(value):
+        # Both steps must be in flight at once to pass the barrier
+        barrier.wait()
+        return value
+
+    graph = TaskGraph(max_workers=4)
+    graph.add("a", lambda: independent(1))
+    graph.add("b", lambda: independent(2))
+    graph.add("total", lambda a, b: a + b, depends_on=["a", "b"])
+    results, timings = graph.run()
+
+    assert results["total"] == 3
+    assert set(timings) == {"a", "b", "total", "wall_seconds"}
+    assert timings["total"]["start"] >= max(timings["a"]["start"], timings["b"]["start"])
+
+
+def test_delta_briefing_drops_the_full_briefings_analyses():
+    from types import SimpleNamespace
+    from agents.cfo_brain import CFOBrainAgent
+
+    rajesh = CFOBrainAgent.__new__(CFOBrainAgent)
+    rajesh.character = "You are Rajesh."
+    rajesh.brain = SimpleNamespace(think=lambda **kwargs: SimpleNamespace(response="Pay PUR001 today."))
+    last = {"mode": "single", "briefing": "Old", "actions_needed": "Old actions", "cash_analysis": "Old cash",
+            "payment_reco": "Old plan", "collection_status": "Old", "goals_status": "Old", "formatted": "Old text"}
+
+    result = rajesh._create_delta_briefing({"result": last}, {}, since=date(2025, 1, 15))
+
+    assert result["mode"] == "delta" and result["based_on"] == "2025-01-15"
+    assert result["briefing"] == "Pay PUR001 today."
+    assert not {"cash_analysis", "payment_reco", "collection_status", "goals_status", "formatted"} & set(result)
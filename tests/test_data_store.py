@@ -0,0 +1,119 @@
+import pytest
+from tools.data_store import DataStore
+
+
+def _scan_project(store, project_id):
+    """Reference figures computed the slow way, by scanning the ledger."""
+    payables = [p for p in store.get_all_payables()
+                if p.get('project_id') == project_id and p.get('status') != 'Cancelled']
+    receivables = [r for r in store.get_all_receivables()
+                   if r.get('project_id') == project_id and r.get('status') != 'Cancelled']
+    return {
+        'billed_to_date': sum(r['total_amount'] for r in receivables),
+        'received': sum(r['amount_received'] for r in receivables),
+        'outstanding': sum(r['balance_due'] for r in receivables if r['status'] != 'Paid'),
+        'committed_cost': sum(p['total_amount'] for p in payables),
+    }
+
+
+def test_project_views_match_full_scan(store):
+    for project in store.get_all_projects():
+        view = store.get_project_financials(project['project_id'])
+        expected = _scan_project(store, project['project_id'])
+        for key, value in expected.items():
+            assert view[key] == pytest.approx(value), (project['project_id'], key)
+
+
+def test_project_views_follow_writes(store):
+    before = store.get_project_financials("PRJ001")
+
+    store.add_payable({
+        "invoice_id": "PUR999", "vendor_id": "VND001", "vendor_name": "ABC Steel Traders",
+        "project_id": "PRJ001", "invoice_number": "AST-2025-9999",
+        "invoice_date": "2025-01-14", "due_date": "2025-02-13",
+        "base_amount": 100000, "gst_amount": 18000, "total_amount": 118000,
+        "tds_deducted": 2000, "net_payable": 116000, "status": "Pending"
+    })
+    store.update_payable("PUR999", {"status": "Paid"})
+    store.update_receivable("INV001", {"amount_received": 1000000, "balance_due": 2306000})
+
+    after = store.get_project_financials("PRJ001")
+    assert after['committed_cost'] == pytest.approx(before['committed_cost'] + 118000)
+    assert after['paid_cost'] == pytest.approx(before['paid_cost'] + 116000)
+    assert after['received'] == pytest.approx(before['received'] + 1000000)
+    assert after['outstanding'] == pytest.approx(before['outstanding'] - 1000000)
+    assert after['cash_burn'] == pytest.approx(before['cash_burn'] + 116000 - 1000000)
+
+    # Incremental view agrees with a fresh rebuild from disk
+    reloaded = DataStore(db_path=str(store.db_path))
+    assert reloaded.get_project_financials("PRJ001") == after
+
+
+def test_anomaly_flags_on_add_payable(store):
+    assert store.get_payable_flags() == []
+
+    # Same vendor, same invoice number as PUR001, wrong GST
+    store.add_payable({
+        "invoice_id": "PUR998", "vendor_id": "VND001", "vendor_name": "ABC Steel Traders",
+        "project_id": "PRJ001", "invoice_number": "AST-2025-0145",
+        "invoice_date": "2025-01-03", "due_date": "2025-02-02",
+        "base_amount": 750000, "gst_amount": 90000, "total_amount": 885000,
+        "tds_deducted": 15000, "net_payable": 870000, "status": "Pending"
+    })
+
+    flag_types = {f['type'] for f in store.get_payable_flags("PUR998")}
+    assert flag_types == {'duplicate_invoice_number', 'near_duplicate', 'gst_mismatch'}
+
+    # A full rescan reaches the same verdict as the incremental check
+    reloaded = DataStore(db_path=str(store.db_path))
+    assert reloaded.get_payable_flags() == store.get_payable_flags()
+
+
+def test_updates_move_records_between_lookups_and_recheck_only_themselves(store, monkeypatch):
+    store.add_payable({
+        "invoice_id": "PUR998", "vendor_id": "VND001", "vendor_name": "ABC Steel Traders",
+        "project_id": "PRJ001", "invoice_number": "AST-2025-0145",
+        "invoice_date": "2025-01-03", "due_date": "2025-02-02",
+        "base_amount": 750000, "gst_amount": 90000, "total_amount": 885000,
+        "tds_deducted": 15000, "net_payable": 870000, "status": "Pending"
+    })
+    monkeypatch.setattr(store.anomaly_detector, "scan", lambda payables: pytest.fail("full rescan on update"))
+
+    # Billed to another vendor under its own number, with the GST corrected: no flags left
+    store.update_payable("PUR998", {"vendor_id": "VND002", "invoice_number": "X-1", "gst_amount": 135000,
+                                    "total_amount": 885000 + 45000})
+    assert "PUR998" not in [p['invoice_id'] for p in store.get_payables_for_vendor("VND001")]
+    assert "PUR998" in [p['invoice_id'] for p in store.get_payables_for_vendor("VND002")]
+    assert store.get_payable_flags() == []
+
+    receivable = store.get_all_receivables()[0]
+    old_client = receivable['client_id']
+    store.update_receivable(receivable['invoice_id'], {"client_id": "CLI999"})
+    assert store.get_receivables_for_client("CLI999") == [receivable]
+    assert receivable not in store.get_receivables_for_client(old_client)
+
+    reloaded = DataStore(db_path=str(store.db_path))
+    assert reloaded.get_payables_for_vendor("VND002") == store.get_payables_for_vendor("VND002")
+    assert reloaded.get_payable_flags() == store.get_payable_flags()
+
+
+def test_snapshot_history(store):
+    from datetime import date, timedelta
+    start = date(2025, 1, 1)
+    for offset in range(21):
+        store.get_bank_account("BA004")['balance'] = 550000 + offset * 10000
+        store.record_snapshot(start + timedelta(days=offset))
+    # Same-day re-record replaces rather than appends; going back in time is refused
+    store.record_snapshot(start + timedelta(days=20))
+    assert not store.record_snapshot(start)
+    assert len(store.snapshots) == 21
+
+    window = store.snapshots.range(date(2025, 1, 8), date(2025, 1, 14), ['balance:BA004'])
+    assert window['balance:BA004'] == [620000 + i * 10000 for i in range(7)]
+
+    weekly = store.snapshots.downsample(fields=['balance:BA004'], period='week')
+    assert weekly['balance:BA004'][-1] == 750000
+    assert len(weekly['date']) == 4
+
+    summary = store.snapshots.trend_summary(days=30, as_of=date(2025, 1, 21))
+    assert "21 snapshots" in summary
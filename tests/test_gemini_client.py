@@ -0,0 +1,817 @@
+import time
+import pytest
+from tools.gemini_client import GeminiBrain
+from tools.llm_backend import LLMBackend, ContextCacheRegistry
+from tools.response_cache import ResponseCache
+from tools.rate_limiter import RateLimiter, Priority, llm_priority
+from tools.call_metrics import CallMetrics, call_site
+from tools.model_router import ModelRouter, parse_routes
+from tools.models import MessageUnderstanding, VendorMatch
+from tools.gemini_client import StructuredOutputError, DEGRADED_REPLY
+from tools.resilience import CircuitBreaker, CircuitOpenError, Hedger, deadline
+from tools.single_flight import SingleFlight
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text]
+
+
+class FakeBackend(LLMBackend):
+    """Records every request; `respond` maps contents to a response"""
+
+    def __init__(self):
+        self.respond = lambda contents: FakeResponse(f"Thinking...\n\nAnswer {len(str(contents))}")
+        self.arespond = None
+        self.calls = []
+        self.cached_prefixes = []
+
+    def generate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        self.calls.append({'contents': contents, 'model_name': model_name, 'system_instruction': system_instruction,
+                           'cached_content': cached_content, 'response_schema': response_schema})
+        return self.respond(contents)
+
+    async def agenerate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        self.calls.append({'contents': contents, 'model_name': model_name, 'system_instruction': system_instruction,
+                           'cached_content': cached_content, 'response_schema': response_schema})
+        if self.arespond:
+            return await self.arespond(contents)
+        return self.respond(contents)
+
+    def cache_prefix(self, model_name, system_instruction, prefix, ttl_seconds):
+        self.cached_prefixes.append(prefix)
+        return f"cachedContents/{len(self.cached_prefixes)}"
+
+    supports_tools = True
+
+    def generate_with_tools(self, turns, model_name, system_instruction=None, declarations=None):
+        self.calls.append({'turns': list(turns), 'model_name': model_name, 'declarations': declarations})
+        return self.respond(turns)
+
+
+@pytest.fixture
+def brain(monkeypatch, tmp_path):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    brain = GeminiBrain(
+        cache=ResponseCache(cache_dir=str(tmp_path / "llm")),
+        limiter=RateLimiter(rpm=10000, tpm=10_000_000),
+        metrics=CallMetrics(str(tmp_path / "metrics.jsonl")),
+        backend=FakeBackend(),
+        context_caches=ContextCacheRegistry(ttl_seconds=600, min_tokens=0),
+        breaker=CircuitBreaker(failure_threshold=2, reset_seconds=30),
+        hedger=Hedger(enabled=False),
+        flights=SingleFlight()
+    )
+    return brain
+
+
+def test_think_is_served_from_cache(brain):
+    first = brain.think("You are Arjun.", "Cash: 10L", "How are we doing?")
+    second = brain.think("You are Arjun.", "Cash: 10L", "How are we doing?")
+    assert first.response == second.response
+    assert len(brain.backend.calls) == 1
+
+    brain.think("You are Arjun.", "Cash: 10L", "How are we doing?", use_cache=False)
+    brain.think("You are Arjun.", "Cash: 9L", "How are we doing?")
+    assert len(brain.backend.calls) == 3
+    assert brain.cache.stats()['hits'] == 1
+
+
+def test_cache_tiers_ttl_and_eviction(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_memory_entries=2, ttls={'think': 60})
+    keys = [cache.make_key("model", "prompt", str(i)) for i in range(3)]
+    for key in keys:
+        cache.put(key, 'think', key[:6])
+
+    # Oldest entry fell out of memory but is still on disk
+    assert cache.stats()['memory_entries'] == 2
+    assert cache.get(keys[0], 'think') == keys[0][:6]
+    assert cache.stats()['disk_hits'] == 1
+
+    # A fresh process sees the disk tier
+    assert ResponseCache(cache_dir=str(tmp_path)).get(keys[1], 'think') == keys[1][:6]
+
+    # Image bytes are part of the address
+    assert cache.make_key("model", "prompt", b"\x89PNG1") != cache.make_key("model", "prompt", b"\x89PNG2")
+
+    cache.ttls['think'] = 0
+    time.sleep(0.01)
+    assert cache.get(keys[2], 'think') is None
+
+
+def test_async_calls_overlap_up_to_the_concurrency_cap(brain, monkeypatch):
+    import asyncio
+    from config.settings import Settings
+    monkeypatch.setattr(Settings, "GEMINI_MAX_CONCURRENCY", 2)
+
+    in_flight = {"now": 0, "peak": 0}
+
+    async def generate_content_async(contents):
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        await asyncio.sleep(0.05)
+        in_flight["now"] -= 1
+        return FakeResponse(f"Answer {len(str(contents))}")
+
+    brain.backend.arespond = generate_content_async
+
+    async def run():
+        return await asyncio.gather(*[
+            brain.athink("You are Arjun.", f"Cash: {i}L", "How are we doing?") for i in range(6)
+        ])
+
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert len(responses) == 6
+    assert in_flight["peak"] == 2
+    # Six 50ms calls, two at a time: at least three rounds (no upper bound, a loaded machine is slower)
+    assert elapsed > 0.14
+
+
+def test_rate_limiter_reserves_budget_for_higher_lanes():
+    now = [0.0]
+    limiter = RateLimiter(rpm=10, tpm=100_000, clock=lambda: now[0])
+
+    # Bulk work stops while 40% of the request bucket is left...
+    admitted = 0
+    while limiter._try_admit(Priority.BULK, 100) == 0:
+        admitted += 1
+    assert admitted == 6
+
+    # ...which interactive replies can still use straight away
+    assert limiter._try_admit(Priority.INTERACTIVE, 100) == 0
+
+    # A waiting interactive caller holds back lower lanes even once refilled
+    now[0] += 60
+    limiter._enqueue(Priority.INTERACTIVE)
+    assert limiter._try_admit(Priority.BRIEFING, 100) > 0
+    limiter._dequeue(Priority.INTERACTIVE)
+    assert limiter._try_admit(Priority.BRIEFING, 100) == 0
+
+
+def test_rate_limiter_backs_off_on_429_and_recovers(brain):
+    calls = []
+
+    def flaky(contents):
+        calls.append(contents)
+        if len(calls) == 1:
+            raise Exception("429 Resource exhausted")
+        return FakeResponse("Answer")
+
+    brain.backend.respond = flaky
+    brain.BASE_DELAY = 0
+    with llm_priority(Priority.INTERACTIVE):
+        brain.think("You are Arjun.", "Cash: 10L", "Retry me", use_cache=False)
+
+    stats = brain.limiter.stats()
+    assert len(calls) == 2
+    assert stats['rate_limited'] == 1
+    # Halved by the 429, nudged back up by the success
+    assert stats['scale'] == 0.55
+
+
+def test_calls_are_metered_per_call_site(brain):
+    class Usage:
+        prompt_token_count = 120
+        candidates_token_count = 30
+
+    def respond(contents):
+        response = FakeResponse("Answer")
+        response.usage_metadata = Usage()
+        return response
+
+    brain.backend.respond = respond
+    with call_site("arjun.recommend_payments"):
+        brain.think("You are Arjun.", "Payables: ...", "What should we pay?")
+        brain.think("You are Arjun.", "Payables: ...", "What should we pay?")
+    brain.think("You are Rajesh.", "Cash: 10L", "Briefing")
+
+    report = CallMetrics.report(brain.metrics.records())
+    site = report["arjun.recommend_payments"]
+    assert site['calls'] == 2 and site['cache_hits'] == 1
+    assert site['prompt_tokens'] == 120 and site['completion_tokens'] == 30
+    assert report["unattributed"]['calls'] == 1
+
+    # Written to disk for later runs
+    assert len(brain.metrics.load()) == 3
+    assert "arjun.recommend_payments" in CallMetrics.format_report(report)
+
+
+def test_character_is_the_system_instruction(brain):
+    brain.think("You are Arjun.", "Cash: 10L", "How are we doing?")
+    call = brain.backend.calls[-1]
+    assert call['system_instruction'] == "You are Arjun."
+    assert "You are Arjun." not in call['contents'][0]
+    assert call['cached_content'] is None
+
+
+def test_briefing_steps_reuse_one_cached_ledger_prefix(brain, store):
+    from agents.finance_manager import FinanceManagerAgent
+
+    fm = FinanceManagerAgent.__new__(FinanceManagerAgent)
+    fm.character = "You are Arjun."
+    fm.brain = brain
+    fm.data_store = store
+
+    fm.analyze_cash_position()
+    fm.recommend_payments("Cash is tight.")
+    fm.analyze_collections()
+    fm.analyze_financial_goals()
+
+    # The ledger snapshot is registered once and every step points at it
+    assert len(brain.backend.cached_prefixes) == 1
+    assert "VND001" in brain.backend.cached_prefixes[0]
+    calls = brain.backend.calls
+    assert len(calls) == 4
+    assert {c['cached_content'] for c in calls} == {"cachedContents/1"}
+    # Only the volatile part is sent per call
+    assert all("VND001" not in c['contents'][0] for c in calls)
+    assert brain.context_caches.stats()['reused'] == 3
+
+
+def test_analyses_are_reused_until_their_collections_change(brain, store):
+    from agents.finance_manager import FinanceManagerAgent
+
+    fm = FinanceManagerAgent.__new__(FinanceManagerAgent)
+    fm.character = "You are Arjun."
+    fm.brain = brain
+    fm.data_store = store
+    brain.cache = None
+
+    first = fm.analyze_collections()
+    assert fm.analyze_collections() is first
+    assert len(brain.backend.calls) == 1
+
+    # Every payable is in the ledger prefix, so a payable write is seen too
+    store.update_payable("PUR001", {"net_payable": 99999999})
+    second = fm.analyze_collections()
+    assert second is not first
+    store.update_receivable(store.get_all_receivables()[0]['invoice_id'], {"status": "Paid"})
+    assert fm.analyze_collections() is not second
+    assert len(brain.backend.calls) == 3
+
+    # Settling a bill changes the goals analysis's prefix as well
+    fm.analyze_financial_goals()
+    store.update_payable("PUR001", {"status": "Paid"})
+    fm.analyze_financial_goals()
+    # Reloading from disk invalidates everything
+    store.refresh()
+    fm.analyze_financial_goals()
+    assert len(brain.backend.calls) == 6
+
+
+def test_a_requested_full_briefing_is_rebuilt(brain, store, tmp_path):
+    from agents.cfo_brain import CFOBrainAgent
+    from agents.finance_manager import FinanceManagerAgent
+    from tools.briefing_state import BriefingState
+
+    fm = FinanceManagerAgent.__new__(FinanceManagerAgent)
+    fm.character = "You are Arjun."
+    fm.brain = brain
+    fm.data_store = store
+    rajesh = CFOBrainAgent.__new__(CFOBrainAgent)
+    rajesh.character = "You are Rajesh."
+    rajesh.brain = brain
+    rajesh.finance_manager = fm
+    rajesh.data_store = store
+    rajesh.briefing_state = BriefingState(tmp_path / "briefing_state.json")
+    brain.cache = None
+
+    first = rajesh.create_daily_briefing(full=True)
+    calls = len(brain.backend.calls)
+    second = rajesh.create_daily_briefing(full=True)
+    # Arjun's unchanged analyses are reused; Rajesh's synthesis and actions are asked again
+    assert second is not first
+    assert len(brain.backend.calls) == calls + 2
+
+
+def test_answers_given_during_an_outage_are_not_memoized(brain, store):
+    from agents.cfo_brain import CFOBrainAgent
+    from agents.finance_manager import FinanceManagerAgent
+
+    fm = FinanceManagerAgent.__new__(FinanceManagerAgent)
+    fm.character = "You are Arjun."
+    fm.brain = brain
+    fm.data_store = store
+    rajesh = CFOBrainAgent.__new__(CFOBrainAgent)
+    rajesh.character = "You are Rajesh."
+    rajesh.brain = brain
+    rajesh.finance_manager = fm
+    rajesh.data_store = store
+    brain.cache = None
+    clock = [0.0]
+    brain.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, clock=lambda: clock[0])
+    brain.BASE_DELAY = 0
+
+    def down(contents):
+        raise Exception("503 Service Unavailable")
+
+    brain.backend.respond = down
+    assert fm.analyze_collections().response == DEGRADED_REPLY
+    # Apologies from the briefing's worker threads count too
+    assert rajesh._create_full_briefing()["briefing"] == DEGRADED_REPLY
+
+    # Gemini is back: nothing from the outage is served again, though no ledger write happened
+    clock[0] = 31
+    brain.backend.respond = lambda contents: FakeResponse("Thinking...\n\nAll good")
+    assert fm.analyze_collections().response == "All good"
+    assert fm.analyze_collections() is fm.analyze_collections()
+    briefing = rajesh._create_full_briefing()
+    assert DEGRADED_REPLY not in briefing.values()
+
+
+def test_model_router_sends_each_call_site_to_its_tier(brain):
+    router = ModelRouter(
+        tiers={"lite": "flash-lite", "standard": "flash", "heavy": "pro"},
+        routes=parse_routes("arjun.answer_question=lite, rajesh.handle_unusual=custom-model,bad")
+    )
+    assert router.resolve("priya.understand_message") == ("lite", "flash-lite")
+    assert router.resolve("rajesh.daily_briefing") == ("heavy", "pro")
+    assert router.resolve("arjun.answer_question") == ("lite", "flash-lite")
+    assert router.resolve("rajesh.handle_unusual") == ("custom", "custom-model")
+    assert router.resolve("somewhere.else") == ("standard", "flash")
+
+    brain.router = router
+    with call_site("priya.understand_message"):
+        brain.think("You are Priya.", "hi", "Intent?")
+    assert brain.backend.calls[-1]['model_name'] == "flash-lite"
+    with call_site("rajesh.daily_briefing"):
+        brain.think("You are Rajesh.", "ledger", "Brief me")
+    assert brain.backend.calls[-1]['model_name'] == "pro"
+    assert [r.model_name for r in brain.metrics.records()] == ["flash-lite", "pro"]
+
+    # A brain built with an explicit model ignores routing
+    pinned = GeminiBrain("pinned-model", backend=brain.backend, cache=brain.cache,
+                         limiter=brain.limiter, metrics=brain.metrics)
+    with call_site("priya.understand_message"):
+        pinned.think("You are Priya.", "hi again", "Intent?")
+    assert brain.backend.calls[-1]['model_name'] == "pinned-model"
+
+
+def test_small_prefix_is_sent_inline_ahead_of_the_question(brain):
+    brain.context_caches.min_tokens = 10_000
+    brain.think("You are Arjun.", "Today", "Status?", prefix="LEDGER: tiny")
+    call = brain.backend.calls[-1]
+    assert call['cached_content'] is None
+    assert call['contents'][0] == "LEDGER: tiny"
+    assert brain.backend.cached_prefixes == []
+
+
+def test_stream_think_yields_chunks_and_fills_the_cache(brain):
+    import asyncio
+
+    def stream(contents, model_name, system_instruction=None, cached_content=None):
+        for text in ["Cash ", "is ", "tight."]:
+            yield FakeResponse(text)
+
+    async def astream(contents, model_name, system_instruction=None, cached_content=None):
+        for chunk in stream(contents, model_name):
+            yield chunk
+
+    brain.backend.stream = stream
+    brain.backend.astream = astream
+
+    assert list(brain.stream_think("You are Arjun.", "Cash: 10L", "Status?")) == ["Cash ", "is ", "tight."]
+    # Same request again: one chunk, straight from the cache
+    assert list(brain.stream_think("You are Arjun.", "Cash: 10L", "Status?")) == ["Cash is tight."]
+
+    async def collect():
+        return [text async for text in brain.astream_think("You are Arjun.", "Cash: 9L", "Status?")]
+
+    assert asyncio.run(collect()) == ["Cash ", "is ", "tight."]
+
+    records = brain.metrics.records()
+    assert [r.cache_hit for r in records] == [False, True, False]
+    assert records[0].first_chunk_ms is not None
+
+    # A reader that stops after the first chunk still gets its call recorded, once
+    chunks = brain.stream_think("You are Arjun.", "Cash: 8L", "Status?")
+    assert next(chunks) == "Cash "
+    chunks.close()
+    records = brain.metrics.records()
+    assert len(records) == 4 and records[-1].error == "Stream closed before it finished"
+
+
+def test_progressive_message_rate_limits_edits():
+    import asyncio
+    from types import SimpleNamespace
+    from tools.progressive_message import ProgressiveMessage, STREAM_FAILED
+
+    class FakeBot:
+        def __init__(self):
+            self.sent, self.edits = [], []
+
+        async def send_message(self, chat_id, text):
+            self.sent.append(text)
+            return SimpleNamespace(message_id=len(self.sent))
+
+        async def edit_message_text(self, chat_id, message_id, text):
+            self.edits.append(text)
+
+    now = [0.0]
+    bot = FakeBot()
+    message = ProgressiveMessage(bot, chat_id=1, min_interval=1.0, clock=lambda: now[0])
+
+    async def chunks():
+        for i in range(10):
+            now[0] += 0.25
+            yield f"part{i} "
+
+    text = asyncio.run(message.stream(chunks()))
+
+    assert bot.sent == ["…"]
+    # 2.5s of streaming at most one edit per second, plus the final text
+    assert len(bot.edits) == 3
+    assert bot.edits[0].endswith("▌")
+    assert bot.edits[-1] == text
+
+    # A stream that breaks off leaves the partial text and a notice, not the cursor
+    async def broken():
+        yield "Cash is "
+        raise ConnectionError("stream reset")
+
+    bot = FakeBot()
+    with pytest.raises(ConnectionError):
+        asyncio.run(ProgressiveMessage(bot, chat_id=1, min_interval=0, clock=lambda: 0.0).stream(broken()))
+    assert bot.edits[-1].startswith("Cash is") and STREAM_FAILED in bot.edits[-1]
+    assert "▌" not in bot.edits[-1]
+
+
+def test_think_structured_validates_and_repairs_once(brain):
+    replies = iter([
+        # Missing confidence: fails validation, so one repair is requested
+        '{"matched_vendor": "VND001", "notes": "Same GSTIN"}',
+        '{"matched_vendor": "VND001", "confidence": 0.9, "notes": "Same GSTIN"}',
+    ])
+    brain.backend.respond = lambda contents: FakeResponse(next(replies))
+
+    match = brain.think_structured("You are Meera.", "Vendor: ABC Steels", "Known vendor?", schema=VendorMatch)
+    assert match == VendorMatch(matched_vendor="VND001", confidence=0.9, notes="Same GSTIN")
+    first, repair = brain.backend.calls
+    assert first['response_schema'] is VendorMatch
+    assert "step by step" not in first['contents'][0]
+    assert "confidence" in repair['contents'][0] and "ABC Steels" not in repair['contents'][0]
+    assert brain.metrics.records()[-1].retries == 1
+
+    # Only the validated reply was cached
+    again = brain.think_structured("You are Meera.", "Vendor: ABC Steels", "Known vendor?", schema=VendorMatch)
+    assert again == match and len(brain.backend.calls) == 2
+
+
+def test_think_structured_raises_when_repair_fails(brain):
+    import asyncio
+
+    brain.backend.respond = lambda contents: FakeResponse("Approval, I think.")
+    with pytest.raises(StructuredOutputError) as error:
+        brain.think_structured("You are Priya.", "Yes pay it", "Intent?", schema=MessageUnderstanding)
+    assert error.value.raw == "Approval, I think."
+    assert len(brain.backend.calls) == 2
+
+    # Nothing is cached, and the async path behaves the same
+    async def reply(contents):
+        return FakeResponse('Sure: {"intent": "approval", "is_decision": true, '
+                            '"explanation": "Pay GST", "reply_suggestion": "Done"}')
+    brain.backend.arespond = reply
+    understanding = asyncio.run(
+        brain.athink_structured("You are Priya.", "Yes pay it", "Intent?", schema=MessageUnderstanding)
+    )
+    assert understanding.intent == "approval" and understanding.is_decision
+
+
+def test_deadline_cuts_a_hung_call_short_and_serves_stale_answers(brain):
+    def hung(contents):
+        time.sleep(1)
+        return FakeResponse("Too late")
+
+    brain.think("You are Arjun.", "Cash: 10L", "Status?")
+    brain.cache.ttls['think'] = 0
+    brain.backend.respond = hung
+
+    with deadline(0.1):
+        stale = brain.think("You are Arjun.", "Cash: 10L", "Status?")
+        degraded = brain.think("You are Arjun.", "Cash: 10L", "Something new?")
+    # Neither waited for the hung reply ("Too late")
+    assert stale.response.startswith("Answer")
+    assert degraded.response == DEGRADED_REPLY and degraded.needs_human_review
+
+
+def test_circuit_breaker_fails_fast_then_probes(brain):
+    clock = [0.0]
+    brain.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=lambda: clock[0])
+    brain.BASE_DELAY = 0
+    brain.backend.respond = lambda contents: (_ for _ in ()).throw(Exception("503 Service Unavailable"))
+
+    first = brain.think("You are Arjun.", "Cash", "Q1", use_cache=False)
+    assert first.response == DEGRADED_REPLY
+    assert brain.breaker.state == CircuitBreaker.OPEN
+
+    calls = len(brain.backend.calls)
+    brain.think("You are Arjun.", "Cash", "Q2", use_cache=False)
+    assert len(brain.backend.calls) == calls
+
+    # After the reset period one probe goes through and closes the breaker
+    clock[0] = 31
+    brain.backend.respond = lambda contents: FakeResponse("Back")
+    assert brain.think("You are Arjun.", "Cash", "Q3", use_cache=False).response == "Back"
+    assert brain.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_that_never_reaches_gemini_doesnt_wedge_the_breaker(brain):
+    clock = [0.0]
+    brain.breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, clock=lambda: clock[0])
+    brain.breaker.record_failure()
+    clock[0] = 31
+
+    # The probe is admitted, then runs out of time waiting in the rate limiter
+    brain.limiter = RateLimiter(rpm=1, tpm=10_000_000)
+    brain.limiter.acquire(10)
+    with deadline(0.05):
+        assert brain.think("You are Arjun.", "Cash", "Q1", use_cache=False).response == DEGRADED_REPLY
+    assert brain.backend.calls == []
+    assert brain.breaker.stats()['probes_released'] == 1
+
+    # The next call is let through as the probe and closes the breaker
+    brain.limiter = RateLimiter(rpm=10000, tpm=10_000_000)
+    assert brain.think("You are Arjun.", "Cash", "Q2", use_cache=False).response.startswith("Answer")
+    assert brain.breaker.state == CircuitBreaker.CLOSED
+
+    # A probe lost without any release is presumed dead after a reset period
+    brain.breaker.record_failure()
+    clock[0] = 62
+    assert brain.breaker.before_call() is not None
+    with pytest.raises(CircuitOpenError):
+        brain.breaker.before_call()
+    clock[0] = 93
+    assert brain.breaker.before_call() is not None
+
+
+def test_slow_call_is_hedged_and_the_faster_reply_wins(brain):
+    brain.hedger = Hedger(enabled=True, percentile=0.95, min_samples=3)
+    for _ in range(3):
+        brain.hedger.record(brain.model_name, 0.02)
+    replies = iter([0.5, 0.0])
+
+    def respond(contents):
+        time.sleep(next(replies))
+        return FakeResponse("Answer")
+
+    brain.backend.respond = respond
+    brain.think("You are Arjun.", "Cash", "Hedge me", use_cache=False)
+    assert brain.hedger.stats()['hedge_wins'] == 1
+
+
+def test_record_then_replay_without_the_network(tmp_path):
+    from tools.offline_backend import RecordingBackend, ReplayBackend, CassetteMiss
+    cassette = str(tmp_path / "llm.jsonl")
+    live = FakeBackend()
+    live.respond = lambda contents: FakeResponse(f"Recorded for {contents[-1]}")
+    recorder = RecordingBackend(live, cassette)
+    recorder.generate(["Cash: 10L", "How are we doing?"], "gemini-test", "You are Arjun.")
+
+    replay = ReplayBackend(cassette, latency_scale=0)
+    assert replay.generate(["Cash: 10L", "How are we doing?"], "gemini-test", "You are Arjun.").text == \
+        "Recorded for How are we doing?"
+    # A drifted prompt falls back to the recording with the same model and instruction
+    assert replay.generate(["Cash: 9L", "How are we doing?"], "gemini-test", "You are Arjun.").text == \
+        "Recorded for How are we doing?"
+    assert replay.counters == {'exact': 1, 'loose': 1, 'misses': 0}
+
+    strict = ReplayBackend(cassette, latency_scale=0, strict=True)
+    with pytest.raises(CassetteMiss):
+        strict.generate(["Cash: 9L", "How are we doing?"], "gemini-test", "You are Arjun.")
+
+
+def test_fake_backend_answers_match_the_schema(tmp_path):
+    from tools.offline_backend import FakeBackend as OfflineFakeBackend
+    brain = GeminiBrain(
+        cache=ResponseCache(cache_dir=str(tmp_path / "llm")), limiter=None,
+        metrics=CallMetrics(str(tmp_path / "metrics.jsonl")),
+        backend=OfflineFakeBackend(), breaker=CircuitBreaker(), hedger=Hedger(enabled=False)
+    )
+    understanding = brain.think_structured("You are Priya.", "", "Pay the GST", MessageUnderstanding)
+    assert isinstance(understanding, MessageUnderstanding)
+    assert "Pay the GST" in brain.think("You are Priya.", "", "Pay the GST").response
+
+
+def test_identical_concurrent_calls_share_one_request(brain):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow(contents):
+        time.sleep(0.1)
+        return FakeResponse("Thinking...\n\nCash is fine.")
+
+    brain.backend.respond = slow
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(brain.think, "You are Arjun.", "Cash: 10L", "status?", use_cache=False)
+                   for _ in range(3)]
+        responses = [f.result() for f in futures]
+    assert len(brain.backend.calls) == 1
+    assert {r.response for r in responses} == {"Cash is fine."}
+
+    async def aslow(contents):
+        await asyncio.sleep(0.1)
+        return FakeResponse("Thinking...\n\nCash is tight.")
+
+    brain.backend.arespond = aslow
+
+    async def run():
+        return await asyncio.gather(*[
+            brain.athink("You are Arjun.", "Cash: 9L", "status?", use_cache=False) for _ in range(3)
+        ])
+
+    assert {r.response for r in asyncio.run(run())} == {"Cash is tight."}
+    assert len(brain.backend.calls) == 2
+    assert brain.flights.stats() == {'leaders': 2, 'coalesced': 4, 'in_flight': 0}
+    site = CallMetrics.report(brain.metrics.records())['unattributed']
+    assert site['calls'] == 6 and site['coalesced'] == 4
+
+
+def test_answer_question_fetches_records_through_tools(brain, store):
+    from types import SimpleNamespace
+    from agents.finance_manager import FinanceManagerAgent
+
+    fm = FinanceManagerAgent.__new__(FinanceManagerAgent)
+    fm.character = "You are Arjun."
+    fm.brain = brain
+    fm.data_store = store
+    fm.query_engine = SimpleNamespace(answer=lambda question: None)
+
+    def respond(turns):
+        if turns[-1]['role'] == 'user':
+            call = SimpleNamespace(name="find_payables", args={'vendor': "ABC Steel", 'limit': 5.0})
+            return SimpleNamespace(parts=[SimpleNamespace(function_call=call)], text="")
+        return FakeResponse(f"Thinking...\n\n{turns[-1]['results'][0][1]['result']}")
+
+    brain.backend.respond = respond
+    answer = fm.answer_question("Should we worry about ABC Steel this month?")
+
+    # One round trip to ask for the bills, one to answer; nothing else was sent
+    assert len(brain.backend.calls) == 2
+    assert "PUR001" in answer.response and "PUR003" not in answer.response
+    assert {d['name'] for d in brain.backend.calls[0]['declarations']} >= {"find_payables", "get_cash_position"}
+
+
+def test_bad_tool_arguments_go_back_to_the_model(store):
+    from tools.data_tools import DataTools
+    tools = DataTools(store)
+
+    # A number where a string belongs is reported, not raised into answer_question
+    assert "error" in tools.execute("get_uncleared_cheques", {'direction': 3.0})
+    assert "error" in tools.execute("find_payables", {'vendor': 42})
+    # Status is compared case-insensitively both when filtering and when hiding settled bills
+    rows = [{'status': "paid"}, {'status': "CANCELLED"}, {'status': "Pending"}]
+    assert DataTools._filtered(rows, None, None) == [{'status': "Pending"}]
+    assert DataTools._filtered(rows, "PAID", None) == [{'status': "paid"}]
+
+
+def test_conversation_memory_keeps_discuss_prompts_bounded(brain):
+    from tools.conversation_memory import ConversationMemory
+    folds = []
+
+    def summarize(summary, turns, max_tokens):
+        # Only the turns leaving the window are summarized, on top of the last summary
+        folds.append((summary, len(turns)))
+        return f"notes after {len(folds)} folds"
+
+    memory = ConversationMemory(window_turns=4, max_tokens=200, summary_tokens=40, summarize=summarize)
+    for i in range(40):
+        memory.add("User" if i % 2 == 0 else "Priya", f"message {i} about the GST payment of vendor {i}")
+        assert memory.tokens() <= 200
+
+    # The window overflows its token budget at five turns and keeps two, so three leave per fold
+    assert len(folds) == 12
+    assert all(count == 3 for _, count in folds)
+    assert folds[-1][0] == "notes after 11 folds"
+
+    brain.discuss("You are Priya.", memory, "And the cement bill?")
+    prompt = brain.backend.calls[-1]['contents'][0]
+    assert "notes after 12 folds" in prompt and "message 39" in prompt
+    assert "message 1 " not in prompt
+
+
+def test_model_summaries_keep_every_paragraph_and_survive_an_outage(brain):
+    import json
+    from tools.conversation_memory import brain_summarizer
+    summarize = brain_summarizer(brain)
+    notes = "Decisions:\n- Approved GST payment Rs 4.2L\n\nOpen questions:\n- ABC Steel hold?"
+    brain.backend.respond = lambda contents: FakeResponse(json.dumps({"notes": notes}))
+
+    summary = summarize("", [{'role': "User", 'content': "YES GST"}], 200)
+    assert summary == notes
+
+    # Gemini is down: the notes so far stay, with the new turns clipped on
+    brain.BASE_DELAY = 0
+    brain.backend.respond = lambda contents: (_ for _ in ()).throw(Exception("503 Service Unavailable"))
+    summary = summarize(summary, [{'role': "User", 'content': "Hold ABC Steel"}], 200)
+    assert summary.startswith(notes) and "Hold ABC Steel" in summary
+    assert DEGRADED_REPLY not in summary
+
+
+def test_single_call_briefing_needs_one_request(brain, store, monkeypatch):
+    import json
+    from agents.cfo_brain import CFOBrainAgent
+    from agents.finance_manager import FinanceManagerAgent
+    from agents.human_interface import HumanInterfaceAgent
+
+    fm = FinanceManagerAgent.__new__(FinanceManagerAgent)
+    fm.character = "You are Arjun."
+    fm.brain = brain
+    fm.data_store = store
+    rajesh = CFOBrainAgent.__new__(CFOBrainAgent)
+    rajesh.character = "You are Rajesh."
+    rajesh.brain = brain
+    rajesh.finance_manager = fm
+    rajesh.data_store = store
+    priya = HumanInterfaceAgent.__new__(HumanInterfaceAgent)
+    priya.character = "You are Priya."
+    priya.brain = brain
+
+    reply = {
+        "cash_assessment": "Tight: overdrawn until NHAI pays.",
+        "payment_plan": [{"invoice_id": "PUR007", "vendor_name": "HP Petroleum", "amount": 328000,
+                          "decision": "pay_now", "reason": "Critical fuel supplier, overdue"}],
+        "cash_after_payments": -4130000,
+        "collections": "Chase NHAI for the overdue RA bill.",
+        "goals": "Emergency fund on hold this month.",
+        "action_items": [{"decision": "Pay HP Petroleum", "recommendation": "Pay today, fuel is critical.",
+                          "how_to_reply": "YES HP"}],
+        "phone_text": "📊 Good morning sir. Pay HP Petroleum today? Reply YES HP",
+    }
+    brain.backend.respond = lambda contents: FakeResponse(json.dumps(reply))
+    result = rajesh._create_full_briefing("single")
+
+    # The numbers are worked out locally and sent once
+    assert len(brain.backend.calls) == 1
+    assert "Bank balance:" in brain.backend.calls[0]['contents'][0]
+    assert result["mode"] == "single"
+    assert "PUR007" in result["payment_reco"] and "YES HP" in result["actions_needed"]
+    # Priya sends it as written, without another call
+    assert priya.format_for_human(result) == reply["phone_text"]
+    assert len(brain.backend.calls) == 1
+
+    # A reply that won't validate falls back to the step-by-step briefing
+    brain.cache = None
+    from config.settings import Settings
+    monkeypatch.setattr(Settings, "AGENT_MEMO_ENABLED", False)
+    brain.backend.respond = lambda contents: FakeResponse("Thinking...\n\nnot json")
+    assert rajesh._create_full_briefing("single")["mode"] == "full"
+
+
+def test_repeat_upload_is_stored_once_and_not_read_again(brain, tmp_path):
+    import json
+    import os
+    import random
+    from PIL import Image
+    from agents.doc_processor import DocProcessorAgent
+    from tools.document_cache import DocumentStore
+
+    meera = DocProcessorAgent.__new__(DocProcessorAgent)
+    meera.character = "You are Meera."
+    meera.brain = brain
+    meera.documents = DocumentStore(root=str(tmp_path / "uploads"), max_bytes=10_000)
+    brain.cache = None
+    brain.backend.respond = lambda contents: FakeResponse(json.dumps({
+        "document_type": "invoice", "readable": True, "validation_notes": "Totals add up",
+        "confidence_score": 0.9, "extracted_data": {"vendor_name": "ABC Steel Traders", "total_amount": 870000},
+    }))
+
+    def upload(name, seed=0):
+        # Random pixels, so each file is ~5 KB and doesn't compress away
+        pixels = random.Random(seed).randbytes(40 * 40 * 3)
+        path = meera.documents.incoming_path(name)
+        Image.frombytes("RGB", (40, 40), pixels).save(path, "PNG")
+        return meera.documents.add(path, name)
+
+    first = upload("invoice.png")
+    extraction = meera.process(first.path)
+    assert extraction.extracted_data["vendor_name"] == "ABC Steel Traders"
+    assert len(brain.backend.calls) == 1
+
+    # Same bytes under another name: one file on disk, no second model call
+    again = upload("Fwd_ invoice copy.PNG")
+    assert again.duplicate and again.path == first.path
+    assert meera.process(again.path).document_id == extraction.document_id
+    assert len(brain.backend.calls) == 1
+    assert len(meera.documents._blobs()) == 1
+
+    # A prompt change retires the cached extraction
+    meera.character = "You are Meera, now stricter."
+    meera.process(first.path)
+    assert len(brain.backend.calls) == 2
+
+    # So does routing Meera's extraction to another model tier
+    brain.router = ModelRouter(tiers={"lite": "flash-lite", "standard": "flash"},
+                               routes={"meera.process_document": "lite"})
+    meera.process(first.path)
+    assert len(brain.backend.calls) == 3
+
+    # Over the size budget the least recently used files go, with their extractions
+    upload("statement.png", seed=1)
+    upload("receipt.png", seed=2)
+    assert meera.documents.stats()['bytes'] <= 10_000
+    assert not os.path.exists(first.path)
+    assert not list((tmp_path / "uploads" / "extractions").rglob("*.json"))
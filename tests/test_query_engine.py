@@ -0,0 +1,26 @@
+from tools.query_engine import QueryEngine
+
+
+def test_vendor_and_client_totals(store):
+    engine = QueryEngine(store)
+
+    answer = engine.answer("How much do we owe ABC Steel?")
+    assert answer.startswith("We owe ABC Steel Traders ₹12.41 L across 2 open invoice(s).")
+
+    answer = engine.answer("how much does NHAI owe us?")
+    assert answer.startswith("NHAI owes us ₹70.18 L")
+
+
+def test_balance_and_project_questions(store):
+    engine = QueryEngine(store)
+
+    assert "ICICI Bank (CC)" in engine.answer("What's our total bank balance?")
+    assert engine.answer("HDFC balance?").startswith("HDFC Bank Current account balance: ₹28.66 L")
+    assert "Margin on billed work" in engine.answer("What is the margin on PRJ001?")
+
+
+def test_open_ended_questions_fall_back_to_llm(store):
+    engine = QueryEngine(store)
+
+    assert engine.answer("Should we pay ABC Steel today?") is None
+    assert engine.answer("How do we improve our working capital cycle?") is None
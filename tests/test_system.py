@@ -1,6 +1,5 @@
 import os
 import pytest
-import asyncio
 from datetime import datetime
 from agents.finance_manager import FinanceManagerAgent
 from agents.doc_processor import DocProcessorAgent
@@ -14,9 +13,10 @@ load_dotenv()
 
 # Utility to check for API Keys
 def has_keys():
-    return os.getenv("GEMINI_API_KEY") is not None
+    # Replay and fake backends (LLM_BACKEND=replay/fake) run without a key
+    return os.getenv("GEMINI_API_KEY") is not None or os.getenv("LLM_BACKEND", "gemini") != "gemini"
 
-pytestmark = pytest.mark.skipif(not has_keys(), reason="GEMINI_API_KEY not found in environment")
+pytestmark = pytest.mark.skipif(not has_keys(), reason="GEMINI_API_KEY not found in environment (or set LLM_BACKEND=fake)")
 
 def test_agent_thinking():
     """Verify agents can think using Gemini."""
@@ -95,8 +95,8 @@ def test_human_communication():
     assert "intent" in understanding
     assert understanding["intent"] in ["approval", "instruction"]
 
-@pytest.mark.asyncio
-async def test_full_workflow():
+# Nothing here awaits, and pytest-asyncio isn't a dependency, so this stays a plain test
+def test_full_workflow():
     """Test integrated workflow logic."""
     print("\nTesting Full Workflow Logic...")
     rajesh = CFOBrainAgent()
@@ -122,6 +122,6 @@ if __name__ == "__main__":
         test_agent_thinking()
         test_briefing_generation()
         test_human_communication()
-        asyncio.run(test_full_workflow())
+        test_full_workflow()
     else:
         print("GEMINI_API_KEY not found. Please set it in .env to run tests.")
@@ -0,0 +1,125 @@
+import json
+from tools.utils import format_table, format_detailed, format_cheques_issued, extract_json, LLM_FIELDS
+
+
+def test_format_table_is_compact_and_drops_empty_columns():
+    rows = [
+        {'invoice_id': 'PUR001', 'net_payable': 870000, 'priority': None, 'is_critical': True,
+         'due_date': '2025-12-31 00:00:00', 'description': 'Steel | TMT'},
+        {'invoice_id': 'PUR002', 'net_payable': -1500, 'priority': None, 'is_critical': False,
+         'due_date': '2025-02-04', 'description': None},
+    ]
+    assert format_table(rows).splitlines() == [
+        "invoice_id|net_payable|is_critical|due_date|description",
+        "PUR001|₹8.70 L|Y|2025-12-31|Steel / TMT",
+        "PUR002|-₹1,500|N|2025-02-04|-",
+    ]
+    assert format_table([]) == "None"
+
+
+def test_ledger_context_shrinks_several_fold(store):
+    payables = store.get_all_payables()
+    compact = format_detailed(payables, LLM_FIELDS['payables'])
+    assert len(json.dumps(payables, indent=2)) > 3 * len(compact)
+    assert all(p['invoice_id'] in compact for p in payables)
+
+    # Register stores 'Issued'/'Pending'; matching is case-insensitive
+    assert "123456" in format_cheques_issued(store.get_cheque_register())
+
+
+def test_extract_json_finds_the_first_balanced_object():
+    reply = 'I {think} so.\n```json\n{"notes": "a } in a string", "items": [1, {"x": 2}]}\n```\n{"second": 1}'
+    assert extract_json(reply) == {"notes": "a } in a string", "items": [1, {"x": 2}]}
+    assert extract_json('see [1], then {"a": 1}', object_only=True) == {"a": 1}
+    assert extract_json('{"a": 1') is None
+    assert extract_json("no json here") is None
+
+
+def test_ranked_context_keeps_urgent_invoices_and_rolls_up_the_rest():
+    from datetime import date, timedelta
+    from tools.context_builder import payables_context, _tokens
+    today = date.today()
+    vendors = [{'vendor_id': f"VND{i}", 'category': 'Material', 'is_critical': False} for i in range(50)]
+    payables = [
+        {'invoice_id': f"PUR{i:04d}", 'vendor_id': f"VND{i % 50}", 'vendor_name': f"Vendor {i % 50}",
+         'due_date': (today + timedelta(days=20 + i % 40)).isoformat(), 'description': "Routine supplies",
+         'net_payable': 10000 + i, 'status': 'Pending'}
+        for i in range(2000)
+    ]
+    payables.append({'invoice_id': "PUR_GST", 'vendor_id': "VND0", 'vendor_name': "Vendor 0",
+                     'due_date': (today - timedelta(days=3)).isoformat(), 'description': "GST for December",
+                     'net_payable': 5000, 'status': 'Overdue'})
+    # A settled bill from the largest vendor is neither ranked nor rolled up
+    payables.append({'invoice_id': "PUR_PAID", 'vendor_id': "VND1", 'vendor_name': "Vendor 1",
+                     'due_date': (today - timedelta(days=30)).isoformat(), 'description': "Old steel order",
+                     'net_payable': 9000000, 'status': 'Paid'})
+
+    context = payables_context(payables, vendors, budget_tokens=1500)
+    assert _tokens(context) <= 1500 * 1.1
+    lines = context.splitlines()
+    # Overdue statutory payment leads despite its small amount
+    assert lines[1].startswith("PUR_GST|")
+    assert "OTHER" in context and "Vendor" in context.split("OTHER")[1]
+    head = context.split("OTHER")[0].splitlines()
+    assert "PUR_PAID" not in context and "|41|" not in context
+    assert f"OTHER {2001 - (len(head) - 1)} INVOICES" in context
+
+    # A ledger that fits is sent whole
+    assert len(payables_context(payables[:5], vendors, budget_tokens=1500).splitlines()) == 6
+
+
+def _text_pdf(path, pages):
+    """A minimal PDF with one line of text per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for i in range(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td (Statement page {i + 1} balance {i * 1000}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    body, offsets = b"%PDF-1.4\n", []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{obj}\nendobj\n".encode()
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(body)
+    return str(path)
+
+
+def test_pdf_pages_are_read_only_up_to_the_budget(tmp_path, monkeypatch):
+    from config.settings import Settings
+    from tools import pdf_extract
+
+    path = _text_pdf(tmp_path / "statement.pdf", 300)
+    before = pdf_extract.pdf_stats()['pages_parsed']
+    pdf = pdf_extract.extract_text(path, max_chars=400)
+
+    # ~30 characters a page: 14 pages cover the budget, the other 286 are never parsed
+    assert pdf.page_count == 300 and pdf.truncated
+    assert pdf.pages_read == 14 and len(pdf.text) == 400
+    assert pdf.text.startswith("Statement page 1 balance 0")
+    assert pdf_extract.pdf_stats()['pages_parsed'] - before == 14
+
+    # Read again: every page comes from the cache
+    hits = pdf_extract.pdf_stats()['cache_hits']
+    assert pdf_extract.extract_text(path, max_chars=400) == pdf
+    assert pdf_extract.pdf_stats()['cache_hits'] - hits == 14
+
+    # Across the process pool the pages come back in order, the same as read locally
+    monkeypatch.setattr(Settings, "PDF_WORKERS", 2)
+    monkeypatch.setattr(Settings, "PDF_PARALLEL_MIN_PAGES", 20)
+    monkeypatch.setattr(Settings, "PDF_PAGES_PER_TASK", 5)
+    short = _text_pdf(tmp_path / "short.pdf", 30)
+    parallel = pdf_extract.extract_text(short, max_chars=100_000)
+    assert pdf_extract._pool is not None
+    monkeypatch.setattr(Settings, "PDF_WORKERS", 1)
+    pdf_extract._page_cache.clear()
+    assert pdf_extract.extract_text(short, max_chars=100_000) == parallel
+    assert not parallel.truncated and parallel.text.splitlines()[-1] == "Statement page 30 balance 29000"
@@ -0,0 +1,259 @@
+"""
+Anomaly Detector - Local fraud and error checks over payables
+Flags duplicates, GST mismatches, amount outliers and inactive vendors
+without needing the LLM to see the whole ledger.
+"""
+
+import bisect
+import statistics
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+
+# GST slabs in force; used when a vendor category has no known rate
+STANDARD_GST_RATES = (0.0, 0.05, 0.12, 0.18, 0.28)
+
+# Expected GST rate by vendor category (a vendor's own 'gst_rate' wins)
+CATEGORY_GST_RATES = {
+    'Steel': 0.18,
+    'Cement': 0.18,
+    'Equipment': 0.18,
+    'Subcontractor': 0.18,
+    'Labour': 0.0,
+}
+
+
+def _to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def _normalize_invoice_number(number) -> str:
+    return ''.join(ch for ch in str(number or '').upper() if ch.isalnum())
+
+
+def _flag(flag_type: str, severity: str, detail: str, related: Optional[List[str]] = None) -> Dict:
+    return {
+        'type': flag_type,
+        'severity': severity,
+        'detail': detail,
+        'related': related or [],
+    }
+
+
+class PayableAnomalyDetector:
+    """
+    Checks payables for signs of fraud or data entry errors.
+    `scan` runs one pass over the whole ledger; `check` adds a single new
+    payable to the running indexes and returns its flags, and `remove`
+    takes one back out (an updated payable is removed, then checked again).
+    """
+
+    def __init__(
+        self,
+        vendors: List[Dict],
+        amount_tolerance: float = 0.01,
+        near_duplicate_days: int = 7,
+        gst_tolerance: float = 0.005,
+        outlier_threshold: float = 3.5,
+        min_vendor_history: int = 5
+    ):
+        self.vendors = {v['vendor_id']: v for v in vendors}
+        self.amount_tolerance = amount_tolerance
+        self.near_duplicate_days = near_duplicate_days
+        self.gst_tolerance = gst_tolerance
+        self.outlier_threshold = outlier_threshold
+        self.min_vendor_history = min_vendor_history
+        self._reset()
+
+    def _reset(self):
+        self.flags: Dict[str, List[Dict]] = {}
+        self._by_number: Dict[Tuple[str, str], List[str]] = {}
+        # Per vendor: amounts kept sorted, with (invoice_id, invoice_date) alongside
+        self._amounts: Dict[str, List[float]] = {}
+        self._entries: Dict[str, List[Tuple[str, Optional[date]]]] = {}
+
+    # ============ ENTRY POINTS ============
+
+    def scan(self, payables: List[Dict]) -> Dict[str, List[Dict]]:
+        """Flag the whole ledger in one pass. Returns invoice_id -> flags."""
+        self._reset()
+        for payable in payables:
+            self._index(payable)
+        for vendor_id in self._amounts:
+            self._flag_vendor_outliers(vendor_id)
+        return self.flags
+
+    def check(self, payable: Dict) -> List[Dict]:
+        """Flag one new payable against everything seen so far"""
+        if payable.get('status') == 'Cancelled':
+            return []
+        self._index(payable)
+        vendor_id = payable.get('vendor_id')
+        if vendor_id in self._amounts:
+            self._flag_outlier(payable, self._amounts[vendor_id])
+        return self.flags.get(payable.get('invoice_id'), [])
+
+    def remove(self, payable: Dict):
+        """Forget a payable, along with duplicate flags that pointed only at it"""
+        invoice_id = payable.get('invoice_id')
+        vendor_id = payable.get('vendor_id')
+        self.flags.pop(invoice_id, None)
+
+        seen = self._by_number.get((vendor_id, _normalize_invoice_number(payable.get('invoice_number'))), [])
+        if invoice_id in seen:
+            seen.remove(invoice_id)
+        entries = self._entries.get(vendor_id, [])
+        for pos, (other_id, _) in enumerate(entries):
+            if other_id == invoice_id:
+                del entries[pos]
+                del self._amounts[vendor_id][pos]
+                break
+
+        for other_id in list(self.flags):
+            kept = []
+            for flag in self.flags[other_id]:
+                if invoice_id in flag['related']:
+                    flag = dict(flag, related=[r for r in flag['related'] if r != invoice_id])
+                    if not flag['related']:
+                        continue
+                kept.append(flag)
+            if kept:
+                self.flags[other_id] = kept
+            else:
+                del self.flags[other_id]
+
+    def get_flags(self, invoice_id: Optional[str] = None) -> List[Dict]:
+        """Flags for one invoice, or every flag with its invoice_id attached"""
+        if invoice_id is not None:
+            return self.flags.get(invoice_id, [])
+        return [
+            {'invoice_id': inv_id, **flag}
+            for inv_id, flags in self.flags.items()
+            for flag in flags
+        ]
+
+    # ============ CHECKS ============
+
+    def _index(self, payable: Dict):
+        if payable.get('status') == 'Cancelled':
+            return
+        invoice_id = payable.get('invoice_id')
+        vendor_id = payable.get('vendor_id')
+        amount = float(payable.get('total_amount') or 0)
+        invoice_date = _to_date(payable.get('invoice_date'))
+
+        self._check_duplicate_number(invoice_id, vendor_id, payable.get('invoice_number'))
+        self._check_near_duplicate(invoice_id, vendor_id, amount, invoice_date)
+        self._check_gst(invoice_id, vendor_id, payable)
+        self._check_vendor_active(invoice_id, vendor_id)
+
+        amounts = self._amounts.setdefault(vendor_id, [])
+        entries = self._entries.setdefault(vendor_id, [])
+        pos = bisect.bisect(amounts, amount)
+        amounts.insert(pos, amount)
+        entries.insert(pos, (invoice_id, invoice_date))
+
+    def _add(self, invoice_id: str, flag: Dict):
+        self.flags.setdefault(invoice_id, []).append(flag)
+
+    def _check_duplicate_number(self, invoice_id: str, vendor_id: str, invoice_number):
+        number = _normalize_invoice_number(invoice_number)
+        if not number:
+            return
+        seen = self._by_number.setdefault((vendor_id, number), [])
+        if seen:
+            self._add(invoice_id, _flag(
+                'duplicate_invoice_number', 'high',
+                f"Invoice number {invoice_number} already recorded for this vendor",
+                list(seen)
+            ))
+        seen.append(invoice_id)
+
+    def _check_near_duplicate(self, invoice_id: str, vendor_id: str, amount: float, invoice_date: Optional[date]):
+        amounts = self._amounts.get(vendor_id)
+        if not amounts or not amount or invoice_date is None:
+            return
+        low = bisect.bisect_left(amounts, amount * (1 - self.amount_tolerance))
+        high = bisect.bisect_right(amounts, amount * (1 + self.amount_tolerance))
+        related = [
+            other_id
+            for other_id, other_date in self._entries[vendor_id][low:high]
+            if other_date is not None and abs((invoice_date - other_date).days) <= self.near_duplicate_days
+        ]
+        if related:
+            self._add(invoice_id, _flag(
+                'near_duplicate', 'medium',
+                f"Same vendor billed a near-identical amount within {self.near_duplicate_days} days",
+                related
+            ))
+
+    def _expected_gst_rates(self, vendor_id: str) -> Tuple[float, ...]:
+        vendor = self.vendors.get(vendor_id, {})
+        if vendor.get('gst_rate') is not None:
+            return (float(vendor['gst_rate']),)
+        if vendor.get('category') in CATEGORY_GST_RATES:
+            return (CATEGORY_GST_RATES[vendor['category']],)
+        return STANDARD_GST_RATES
+
+    def _check_gst(self, invoice_id: str, vendor_id: str, payable: Dict):
+        base = float(payable.get('base_amount') or 0)
+        gst = float(payable.get('gst_amount') or 0)
+        if base <= 0:
+            return
+        rates = self._expected_gst_rates(vendor_id)
+        if any(abs(gst - base * rate) <= base * self.gst_tolerance + 1 for rate in rates):
+            return
+        expected = ', '.join(f"{rate:.0%}" for rate in rates)
+        self._add(invoice_id, _flag(
+            'gst_mismatch', 'medium',
+            f"GST {gst:,.0f} is {gst / base:.1%} of base; expected {expected}"
+        ))
+
+    def _check_vendor_active(self, invoice_id: str, vendor_id: str):
+        vendor = self.vendors.get(vendor_id)
+        if vendor is not None and not vendor.get('is_active', True):
+            self._add(invoice_id, _flag(
+                'inactive_vendor', 'high',
+                f"Invoice from inactive vendor {vendor.get('name', vendor_id)}"
+            ))
+
+    def _flag_vendor_outliers(self, vendor_id: str):
+        amounts = self._amounts[vendor_id]
+        stats = self._robust_stats(amounts)
+        if stats is None:
+            return
+        for amount, (invoice_id, _) in zip(amounts, self._entries[vendor_id]):
+            self._flag_if_outlier(invoice_id, amount, *stats)
+
+    def _flag_outlier(self, payable: Dict, amounts: List[float]):
+        stats = self._robust_stats(amounts)
+        if stats is not None:
+            self._flag_if_outlier(payable.get('invoice_id'), float(payable.get('total_amount') or 0), *stats)
+
+    def _robust_stats(self, amounts: List[float]) -> Optional[Tuple[float, float]]:
+        """Median and MAD of a vendor's amounts, or None if history is too thin"""
+        if len(amounts) < self.min_vendor_history:
+            return None
+        median = statistics.median(amounts)
+        mad = statistics.median(abs(a - median) for a in amounts)
+        if mad == 0:
+            return None
+        return median, mad
+
+    def _flag_if_outlier(self, invoice_id: str, amount: float, median: float, mad: float):
+        # 0.6745 scales MAD to be comparable with a standard deviation
+        score = 0.6745 * (amount - median) / mad
+        if abs(score) >= self.outlier_threshold:
+            self._add(invoice_id, _flag(
+                'amount_outlier', 'medium',
+                f"Amount {amount:,.0f} is unusual for this vendor (robust z-score {score:.1f}, median {median:,.0f})"
+            ))
@@ -0,0 +1,183 @@
+"""
+Briefing State - Remembers what the last briefing saw
+Lets the morning briefing send the model only what changed overnight
+instead of the whole ledger.
+"""
+
+import hashlib
+import json
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from tools.data_store import format_currency
+
+
+def _to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def ledger_state(data_store) -> Dict:
+    """The parts of the ledger a briefing cares about, keyed by ID"""
+    return {
+        'bank_accounts': {
+            a['account_id']: {'name': a.get('bank_name'), 'balance': a.get('balance')}
+            for a in data_store.get_all_bank_accounts()
+        },
+        'payables': {
+            p['invoice_id']: {
+                'party': p.get('vendor_name'), 'amount': p.get('net_payable'),
+                'due_date': p.get('due_date'), 'status': p.get('status'),
+            }
+            for p in data_store.get_all_payables()
+        },
+        'receivables': {
+            r['invoice_id']: {
+                'party': r.get('client_name'), 'amount': r.get('balance_due'),
+                'due_date': r.get('due_date'), 'status': r.get('status'),
+            }
+            for r in data_store.get_all_receivables()
+        },
+        'financial_goals': {
+            g['goal_id']: {'name': g.get('description'), 'current_amount': g.get('current_amount'),
+                           'status': g.get('status')}
+            for g in data_store.get_financial_goals()
+        },
+    }
+
+
+def fingerprint(state: Dict) -> str:
+    """Stable hash of a ledger state"""
+    payload = json.dumps(state, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _is_open(record: Dict) -> bool:
+    return record.get('status') not in ['Paid', 'Cancelled']
+
+
+def compute_diff(previous: Dict, current: Dict, since: date, today: date) -> Dict[str, List]:
+    """Structured list of what changed between two ledger states"""
+    diff = {
+        'new_invoices': [],
+        'removed_invoices': [],
+        'status_changes': [],
+        'amount_changes': [],
+        'newly_overdue': [],
+        'balance_moves': [],
+        'goal_changes': [],
+    }
+
+    for kind in ('payables', 'receivables'):
+        before, after = previous.get(kind, {}), current.get(kind, {})
+        for invoice_id, record in after.items():
+            old = before.get(invoice_id)
+            if old is None:
+                diff['new_invoices'].append({'kind': kind, 'invoice_id': invoice_id, **record})
+                continue
+            if old.get('status') != record.get('status'):
+                diff['status_changes'].append({
+                    'kind': kind, 'invoice_id': invoice_id, 'party': record.get('party'),
+                    'from': old.get('status'), 'to': record.get('status'),
+                })
+            if old.get('amount') != record.get('amount'):
+                diff['amount_changes'].append({
+                    'kind': kind, 'invoice_id': invoice_id, 'party': record.get('party'),
+                    'from': old.get('amount'), 'to': record.get('amount'),
+                })
+            due = _to_date(record.get('due_date'))
+            # Crossed its due date since the last briefing and still unpaid
+            if _is_open(record) and due is not None and since <= due < today:
+                diff['newly_overdue'].append({'kind': kind, 'invoice_id': invoice_id, **record})
+        for invoice_id, record in before.items():
+            if invoice_id not in after:
+                diff['removed_invoices'].append({'kind': kind, 'invoice_id': invoice_id, **record})
+
+    before_accounts = previous.get('bank_accounts', {})
+    for account_id, account in current.get('bank_accounts', {}).items():
+        old_balance = before_accounts.get(account_id, {}).get('balance', 0) or 0
+        new_balance = account.get('balance') or 0
+        if old_balance != new_balance:
+            diff['balance_moves'].append({
+                'account_id': account_id, 'name': account.get('name'),
+                'from': old_balance, 'to': new_balance, 'change': new_balance - old_balance,
+            })
+
+    before_goals = previous.get('financial_goals', {})
+    for goal_id, goal in current.get('financial_goals', {}).items():
+        if before_goals.get(goal_id) != goal:
+            diff['goal_changes'].append({'goal_id': goal_id, **goal})
+
+    return diff
+
+
+def diff_size(diff: Dict[str, List]) -> int:
+    return sum(len(items) for items in diff.values())
+
+
+def format_diff(diff: Dict[str, List]) -> str:
+    """Compact, readable rendering of a ledger diff for the LLM"""
+    if diff_size(diff) == 0:
+        return "No changes."
+
+    def money(value) -> str:
+        return format_currency(value or 0)
+
+    lines = []
+    for item in diff['new_invoices']:
+        lines.append(f"NEW {item['kind'][:-1]}: {item['invoice_id']} {item['party']} "
+                     f"{money(item['amount'])} due {item['due_date']} [{item['status']}]")
+    for item in diff['removed_invoices']:
+        lines.append(f"REMOVED {item['kind'][:-1]}: {item['invoice_id']} {item['party']}")
+    for item in diff['status_changes']:
+        lines.append(f"STATUS {item['kind'][:-1]}: {item['invoice_id']} {item['party']} "
+                     f"{item['from']} -> {item['to']}")
+    for item in diff['amount_changes']:
+        lines.append(f"AMOUNT {item['kind'][:-1]}: {item['invoice_id']} {item['party']} "
+                     f"{money(item['from'])} -> {money(item['to'])}")
+    for item in diff['newly_overdue']:
+        lines.append(f"NOW OVERDUE {item['kind'][:-1]}: {item['invoice_id']} {item['party']} "
+                     f"{money(item['amount'])} (was due {item['due_date']})")
+    for item in diff['balance_moves']:
+        lines.append(f"BALANCE {item['name']}: {money(item['from'])} -> {money(item['to'])} "
+                     f"({'+' if item['change'] >= 0 else '-'}{money(abs(item['change']))})")
+    for item in diff['goal_changes']:
+        lines.append(f"GOAL {item['name']}: {money(item['current_amount'])} [{item['status']}]")
+    return "\n".join(lines)
+
+
+class BriefingState:
+    """
+    Persists the last briefing's date, ledger state, fingerprint and output.
+    """
+
+    def __init__(self, path: str = "data/briefing_state.json"):
+        self.path = Path(path)
+
+    def load(self) -> Optional[Dict]:
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read briefing state, starting fresh: {e}")
+            return None
+
+    def save(self, state: Dict, result: Dict, as_of: Optional[date] = None):
+        as_of = as_of or date.today()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'date': as_of.isoformat(),
+                'fingerprint': fingerprint(state),
+                'ledger': state,
+                'result': result,
+            }, f, indent=2, ensure_ascii=False, default=str)
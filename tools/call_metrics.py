@@ -0,0 +1,208 @@
+"""
+Call Metrics - Token and latency accounting for every Gemini call
+Each call is tagged with the agent method that made it (the call site), so a
+run's report shows which prompts are expensive. Records are appended to a
+JSON-lines file for comparing runs.
+"""
+
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config.settings import Settings
+from tools.models import LLMCallRecord
+
+# One ID per process: every call made by this run shares it
+RUN_ID = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+_call_site: ContextVar[str] = ContextVar("llm_call_site", default="unattributed")
+_current_call: ContextVar[Optional[Dict]] = ContextVar("llm_current_call", default=None)
+
+
+@contextmanager
+def call_site(name: str):
+    """Attribute the block's Gemini calls to an agent method"""
+    token = _call_site.set(name)
+    try:
+        yield
+    finally:
+        _call_site.reset(token)
+
+
+def current_call_site() -> str:
+    return _call_site.get()
+
+
+def note_attempt(response=None, error: Optional[Exception] = None, call: Optional[Dict] = None):
+    """Called by the transport after each API attempt of the current call"""
+    call = call if call is not None else _current_call.get()
+    if call is None:
+        return
+    call['attempts'] += 1
+    if error is not None:
+        call['error'] = str(error)[:200]
+        return
+    call['error'] = None
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    completion_tokens = getattr(usage, "candidates_token_count", None)
+    cached_tokens = getattr(usage, "cached_content_token_count", None)
+    if isinstance(cached_tokens, int):
+        call['cached_tokens'] = cached_tokens
+    if isinstance(prompt_tokens, int):
+        call['prompt_tokens'] = prompt_tokens
+    if isinstance(completion_tokens, int):
+        call['completion_tokens'] = completion_tokens
+
+
+class CallMetrics:
+    """
+    with metrics.measure("think", model_name, prompt_bytes) as call:
+        ...                         # call['cache_hit'] = True on a hit, call['coalesced'] if shared
+    metrics.report(metrics.records())
+    """
+
+    def __init__(self, path: Optional[str] = "data/metrics/llm_calls.jsonl"):
+        self.path = Path(path) if path else None
+        self._records: List[LLMCallRecord] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, call_type: str, model_name: str, prompt_bytes: int):
+        call = self.start(call_type, model_name, prompt_bytes)
+        token = _current_call.set(call)
+        try:
+            yield call
+        except Exception as e:
+            call['error'] = str(e)[:200]
+            raise
+        finally:
+            _current_call.reset(token)
+            self.finish(call)
+
+    def start(self, call_type: str, model_name: str, prompt_bytes: int) -> Dict:
+        """Open a call record by hand (for streams, which outlive a with-block)"""
+        return {
+            'call_type': call_type, 'model_name': model_name, 'prompt_bytes': prompt_bytes,
+            'call_site': current_call_site(), 'started': time.perf_counter(), 'first_chunk_ms': None,
+            'attempts': 0, 'cache_hit': False, 'coalesced': False, 'error': None,
+            'prompt_tokens': None, 'completion_tokens': None, 'cached_tokens': None,
+        }
+
+    def finish(self, call: Dict):
+        self.record(LLMCallRecord(
+            run_id=RUN_ID,
+            call_site=call['call_site'],
+            call_type=call['call_type'],
+            model_name=call['model_name'],
+            prompt_bytes=call['prompt_bytes'],
+            prompt_tokens=call['prompt_tokens'],
+            completion_tokens=call['completion_tokens'],
+            cached_tokens=call['cached_tokens'],
+            latency_ms=round((time.perf_counter() - call['started']) * 1000, 1),
+            first_chunk_ms=call['first_chunk_ms'],
+            retries=max(call['attempts'] - 1, 0),
+            cache_hit=call['cache_hit'],
+            coalesced=call['coalesced'],
+            error=call['error'],
+            timestamp=datetime.now()
+        ))
+
+    def record(self, record: LLMCallRecord):
+        with self._lock:
+            self._records.append(record)
+            if not self.path:
+                return
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(record.model_dump_json() + "\n")
+            except OSError as e:
+                print(f"⚠️ Could not write call metrics: {e}")
+
+    def records(self, run_id: Optional[str] = RUN_ID) -> List[LLMCallRecord]:
+        """Calls from one run (this one by default), or every logged call if run_id is None"""
+        if run_id == RUN_ID:
+            with self._lock:
+                return list(self._records)
+        return [r for r in self.load() if run_id is None or r.run_id == run_id]
+
+    def load(self) -> List[LLMCallRecord]:
+        if not self.path or not self.path.exists():
+            return []
+        loaded = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    loaded.append(LLMCallRecord.model_validate_json(line))
+                except ValueError:
+                    continue
+        return loaded
+
+    def last_run_id(self) -> Optional[str]:
+        logged = self.load()
+        return logged[-1].run_id if logged else None
+
+    # ============ REPORTS ============
+
+    @staticmethod
+    def report(records: List[LLMCallRecord]) -> Dict[str, Dict]:
+        """Totals per call site, most expensive (by prompt tokens) first"""
+        sites: Dict[str, Dict] = defaultdict(lambda: {
+            'calls': 0, 'cache_hits': 0, 'coalesced': 0, 'errors': 0, 'retries': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0, 'prompt_bytes': 0, 'latency_ms': 0.0,
+        })
+        for r in records:
+            site = sites[r.call_site]
+            site['calls'] += 1
+            site['cache_hits'] += int(r.cache_hit)
+            site['coalesced'] += int(r.coalesced)
+            site['errors'] += int(r.error is not None)
+            site['retries'] += r.retries
+            site['prompt_tokens'] += r.prompt_tokens or 0
+            site['completion_tokens'] += r.completion_tokens or 0
+            site['cached_tokens'] += r.cached_tokens or 0
+            site['prompt_bytes'] += r.prompt_bytes
+            site['latency_ms'] += r.latency_ms
+        for site in sites.values():
+            site['avg_latency_ms'] = round(site['latency_ms'] / site['calls'], 1)
+            site['latency_ms'] = round(site['latency_ms'], 1)
+        return dict(sorted(sites.items(), key=lambda item: item[1]['prompt_tokens'], reverse=True))
+
+    @staticmethod
+    def format_report(report: Dict[str, Dict]) -> str:
+        if not report:
+            return "No Gemini calls recorded."
+        lines = [f"{'call site':<32} {'calls':>5} {'hits':>4} {'shared':>6} {'prompt tok':>10} {'cached':>7} {'compl tok':>9} "
+                 f"{'prompt KB':>9} {'avg ms':>8} {'retries':>7}"]
+        for name, site in report.items():
+            lines.append(
+                f"{name:<32} {site['calls']:>5} {site['cache_hits']:>4} {site['coalesced']:>6} {site['prompt_tokens']:>10} "
+                f"{site['cached_tokens']:>7} {site['completion_tokens']:>9} {site['prompt_bytes'] / 1024:>9.1f} "
+                f"{site['avg_latency_ms']:>8.0f} {site['retries']:>7}"
+            )
+        total_prompt = sum(s['prompt_tokens'] for s in report.values())
+        total_completion = sum(s['completion_tokens'] for s in report.values())
+        lines.append(f"TOTAL: {sum(s['calls'] for s in report.values())} calls, "
+                     f"{total_prompt} prompt + {total_completion} completion tokens")
+        return "\n".join(lines)
+
+
+_shared_metrics: Optional[CallMetrics] = None
+
+
+def get_shared_metrics() -> CallMetrics:
+    """Process-wide metrics log shared by every GeminiBrain"""
+    global _shared_metrics
+    if _shared_metrics is None:
+        _shared_metrics = CallMetrics(Settings.METRICS_PATH or None)
+    return _shared_metrics
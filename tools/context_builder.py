@@ -0,0 +1,178 @@
+"""
+Context Builder - Fits large payable/receivable ledgers into a token budget
+Records are scored by urgency (days to or past due), materiality (amount),
+statutory nature and how much the counterparty matters. The highest scoring
+ones are listed in full; the rest are rolled up into one line per vendor or
+client. K is whatever fits the budget, so small ledgers are sent whole.
+"""
+
+import re
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+
+from tools.data_store import format_currency
+from tools.utils import format_table, LLM_FIELDS
+
+# Share of the budget kept for the rolled-up tail when some records don't fit
+TAIL_SHARE = 0.25
+
+CLOSED_STATUSES = {'paid', 'cancelled'}
+PRIORITY_WEIGHT = {'critical': 1.0, 'high': 0.5}
+_STATUTORY = re.compile(r'\b(gst|tds|pf|epf|esi|esic|tax|taxes|statutory|salary|salaries|wages|payroll)\b', re.IGNORECASE)
+
+
+def _tokens(text: str) -> int:
+    # Same ~4 characters per token estimate as the rate limiter
+    return len(text) // 4 + 1
+
+
+def _due(record: Dict) -> Optional[date]:
+    value = record.get('due_date')
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _urgency(record: Dict, today: date) -> float:
+    """0 (far off) .. 1 (due today) .. 2 (60+ days overdue)"""
+    due = _due(record)
+    if due is None:
+        return 0.0
+    days = (due - today).days
+    if days <= 0:
+        return 1.0 + min(-days, 60) / 60
+    return max(0.0, 1.0 - days / 30)
+
+
+def is_statutory(record: Dict) -> bool:
+    """Taxes, PF/ESI and wages: late payment costs penalties, not goodwill"""
+    if record.get('is_statutory'):
+        return True
+    return bool(_STATUTORY.search(f"{record.get('description', '')} {record.get('category', '')}"))
+
+
+def payable_scorer(vendors: List[Dict], today: Optional[date] = None) -> Callable[[Dict, float], float]:
+    """score(payable, largest amount) -> higher means more important to show"""
+    today = today or date.today()
+    by_id = {v.get('vendor_id'): v for v in vendors}
+
+    def score(payable: Dict, largest: float) -> float:
+        if str(payable.get('status', '')).lower() in CLOSED_STATUSES:
+            return 0.0
+        vendor = by_id.get(payable.get('vendor_id'), {})
+        amount = float(payable.get('net_payable') or payable.get('total_amount') or 0)
+        return (
+            2.0 * _urgency(payable, today)
+            + 1.5 * (amount / largest if largest else 0.0)
+            + (1.0 if is_statutory(dict(payable, category=vendor.get('category', ''))) else 0.0)
+            + (0.5 if vendor.get('is_critical') else 0.0)
+            + PRIORITY_WEIGHT.get(str(payable.get('priority') or '').lower(), 0.0)
+        )
+    return score
+
+
+def receivable_scorer(clients: List[Dict], today: Optional[date] = None) -> Callable[[Dict, float], float]:
+    """score(receivable, largest amount): overdue, large and slow-paying clients first"""
+    today = today or date.today()
+    by_id = {c.get('client_id'): c for c in clients}
+
+    def score(receivable: Dict, largest: float) -> float:
+        if str(receivable.get('status', '')).lower() in CLOSED_STATUSES:
+            return 0.0
+        client = by_id.get(receivable.get('client_id'), {})
+        amount = float(receivable.get('balance_due') or receivable.get('net_receivable') or 0)
+        slow = (client.get('avg_payment_days') or 0) > (client.get('payment_terms_days') or 0)
+        return (
+            2.0 * _urgency(receivable, today)
+            + 1.5 * (amount / largest if largest else 0.0)
+            + (0.5 if slow else 0.0)
+        )
+    return score
+
+
+def _roll_up(records: List[Dict], group_key: str, amount_key: str, today: date) -> List[Dict]:
+    """One row per counterparty: invoice count, total, overdue count, earliest due date"""
+    groups: Dict[str, Dict] = {}
+    for record in records:
+        name = record.get(group_key) or "Unknown"
+        group = groups.setdefault(name, {group_key: name, 'invoices': 0, amount_key: 0.0,
+                                         'overdue': 0, 'earliest_due': None})
+        group['invoices'] += 1
+        group[amount_key] += float(record.get(amount_key) or 0)
+        due = _due(record)
+        if due is not None:
+            if due < today and str(record.get('status', '')).lower() not in CLOSED_STATUSES:
+                group['overdue'] += 1
+            if group['earliest_due'] is None or due < group['earliest_due']:
+                group['earliest_due'] = due
+    return sorted(groups.values(), key=lambda g: g[amount_key], reverse=True)
+
+
+def build_ranked_context(
+    records: List[Dict],
+    score: Callable[[Dict, float], float],
+    fields: List[str],
+    group_key: str,
+    amount_key: str,
+    budget_tokens: int,
+    today: Optional[date] = None
+) -> str:
+    """
+    Table of the top-K open records by score, plus the rest rolled up by
+    `group_key`, all within roughly `budget_tokens`. Paid and cancelled
+    records are left out.
+    """
+    records = [r for r in records if str(r.get('status', '')).lower() not in CLOSED_STATUSES]
+    if not records:
+        return "None"
+    today = today or date.today()
+    largest = max(float(r.get(amount_key) or 0) for r in records)
+    ranked = sorted(records, key=lambda r: score(r, largest), reverse=True)
+
+    full = format_table(ranked, fields)
+    if _tokens(full) <= budget_tokens:
+        return full
+
+    # Fill the head row by row, leaving room for the roll-up of what's left
+    lines = full.split("\n")
+    head_budget = budget_tokens * (1 - TAIL_SHARE) - _tokens(lines[0])
+    k = 0
+    for line in lines[1:]:
+        head_budget -= _tokens(line)
+        if head_budget < 0:
+            break
+        k += 1
+
+    tail = _roll_up(ranked[k:], group_key, amount_key, today)
+    tail_lines = format_table(tail).split("\n")
+    tail_budget = budget_tokens * TAIL_SHARE - _tokens(tail_lines[0])
+    shown = 0
+    for line in tail_lines[1:]:
+        tail_budget -= _tokens(line)
+        if tail_budget < 0:
+            break
+        shown += 1
+
+    parts = [format_table(ranked[:k], fields) if k else "(none fit in full)",
+             f"OTHER {len(ranked) - k} INVOICES, BY {group_key.replace('_name', '').upper()}:",
+             "\n".join(tail_lines[:shown + 1])]
+    if shown < len(tail):
+        rest = tail[shown:]
+        parts.append(f"+{len(rest)} more with {sum(g['invoices'] for g in rest)} invoices, "
+                     f"{format_currency(sum(g[amount_key] for g in rest))} in total")
+    return "\n".join(parts)
+
+
+def payables_context(payables: List[Dict], vendors: List[Dict], budget_tokens: int) -> str:
+    return build_ranked_context(payables, payable_scorer(vendors), LLM_FIELDS['payables'],
+                                'vendor_name', 'net_payable', budget_tokens)
+
+
+def receivables_context(receivables: List[Dict], clients: List[Dict], budget_tokens: int) -> str:
+    return build_ranked_context(receivables, receivable_scorer(clients), LLM_FIELDS['receivables'],
+                                'client_name', 'balance_due', budget_tokens)
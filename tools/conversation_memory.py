@@ -0,0 +1,136 @@
+"""
+Conversation Memory - A bounded chat history for GeminiBrain.discuss
+The most recent turns are kept word for word; older ones are folded into a
+running summary that is updated incrementally (only the turns leaving the
+window are summarized, never the whole chat again). Every prompt built from
+it stays within a fixed token budget however long the chat runs.
+"""
+
+import threading
+from typing import Callable, Dict, List, Optional
+
+from config.settings import Settings
+from tools.call_metrics import call_site
+from tools.models import ChatNotes
+from tools.resilience import BackendUnavailable
+
+# summarize(summary so far, turns leaving the window, max tokens) -> new summary
+Summarizer = Callable[[str, List[Dict[str, str]], int], str]
+
+
+def _tokens(text: str) -> int:
+    # Same ~4 characters per token estimate as the rate limiter
+    return len(text) // 4 + 1
+
+
+def format_turns(turns: List[Dict[str, str]]) -> str:
+    return "".join(f"{t.get('role', 'User')}: {t.get('content', '')}\n" for t in turns)
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    limit = max_tokens * 4
+    return text if len(text) <= limit else "..." + text[-limit:]
+
+
+def clip_summary(summary: str, turns: List[Dict[str, str]], max_tokens: int) -> str:
+    """Summarizer without a model: keep the most recent text that fits"""
+    return _clip((summary + "\n" + format_turns(turns)).strip(), max_tokens)
+
+
+def brain_summarizer(brain) -> Summarizer:
+    """
+    Summaries written by the model (routed as memory.summarize, a lite-tier
+    call). The notes come back whole as structured output; if the call fails
+    the old summary is kept and the leaving turns are clipped onto it.
+    """
+    def summarize(summary: str, turns: List[Dict[str, str]], max_tokens: int) -> str:
+        try:
+            with call_site("memory.summarize"):
+                notes = brain.think_structured(
+                    character="You keep short, factual running notes of a chat between a company's CFO team and its executive.",
+                    context=f"NOTES SO FAR:\n{summary or 'None'}\n\nNEW MESSAGES:\n{format_turns(turns)}",
+                    question=f"""
+Update the notes with the new messages. Keep every decision, approval,
+amount, name, date and open question; drop greetings and small talk.
+Keep the updated notes under {max_tokens * 3 // 4} words.
+""",
+                    schema=ChatNotes
+                ).notes.strip()
+        except (BackendUnavailable, ValueError) as e:
+            print(f"⚠️ Could not update the chat summary: {e}")
+            notes = ""
+        if not notes:
+            return clip_summary(summary, turns, max_tokens)
+        # Never let a wordy summary break the budget
+        return _clip(notes, max_tokens)
+    return summarize
+
+
+class ConversationMemory:
+    """
+    memory.add("User", text)
+    brain.discuss(character, memory, new_message)
+    """
+
+    def __init__(
+        self,
+        window_turns: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        summary_tokens: Optional[int] = None,
+        summarize: Optional[Summarizer] = None
+    ):
+        self.window_turns = window_turns or Settings.CHAT_WINDOW_TURNS
+        self.max_tokens = max_tokens or Settings.CHAT_HISTORY_TOKENS
+        self.summary_tokens = summary_tokens or Settings.CHAT_SUMMARY_TOKENS
+        self.summarize = summarize or clip_summary
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self._lock = threading.Lock()
+        self._fold_lock = threading.Lock()
+        self.counters = {'turns': 0, 'folds': 0}
+
+    @classmethod
+    def from_history(cls, history: List[Dict[str, str]], **kwargs) -> "ConversationMemory":
+        memory = cls(**kwargs)
+        for turn in history:
+            memory.add(turn.get("role", "User"), turn.get("content", ""))
+        return memory
+
+    def _window_tokens(self) -> int:
+        return _tokens(format_turns(self.turns))
+
+    def add(self, role: str, content: str):
+        """Append a turn; if the window overflows, fold its older half into the summary"""
+        budget = self.max_tokens - self.summary_tokens
+        if _tokens(content) > budget:
+            # One pasted document shouldn't blow the budget on its own
+            content = content[:budget * 4 - 3] + "..."
+        # Folds happen one at a time, so each builds on the previous summary
+        with self._fold_lock:
+            with self._lock:
+                self.turns.append({'role': role, 'content': content})
+                self.counters['turns'] += 1
+                if len(self.turns) <= self.window_turns and self._window_tokens() <= budget:
+                    return
+                # Halving the window means one summary update per window_turns / 2 turns
+                keep = max(self.window_turns // 2, 1)
+                leaving, self.turns = self.turns[:-keep], self.turns[-keep:]
+                while len(self.turns) > 1 and self._window_tokens() > budget:
+                    leaving.append(self.turns.pop(0))
+
+            # The model call happens outside the lock, so render() isn't blocked by it
+            summary = self.summarize(self.summary, leaving, self.summary_tokens)
+            with self._lock:
+                self.summary = summary
+                self.counters['folds'] += 1
+
+    def render(self) -> str:
+        """Summary plus recent turns, for a prompt"""
+        with self._lock:
+            recent = format_turns(self.turns)
+            if not self.summary:
+                return recent
+            return f"[Summary of the earlier conversation: {self.summary}]\n{recent}"
+
+    def tokens(self) -> int:
+        return _tokens(self.render())
@@ -3,11 +3,19 @@ Data Store - Reads and writes to JSON database
 This replaces Google Sheets connector
 """
 
+import itertools
 import json
 from pathlib import Path
 from datetime import datetime, date
 from typing import List, Dict, Optional, Any
 
+from tools.project_views import ProjectViews
+from tools.anomaly_detector import PayableAnomalyDetector
+from tools.snapshot_store import SnapshotStore
+
+# Every load gets a new generation, so versions never repeat across reloads or stores
+_generations = itertools.count(1)
+
 
 class DataStore:
     """
@@ -17,6 +25,7 @@ class DataStore:
     
     def __init__(self, db_path: str = "data/database.json"):
         self.db_path = Path(db_path)
+        self.snapshots = SnapshotStore(self.db_path.parent / "snapshots.json.gz")
         self._load_data()
     
     def _load_data(self):
@@ -26,7 +35,43 @@ class DataStore:
                 self.data = json.load(f)
         else:
             raise FileNotFoundError(f"Database not found at {self.db_path}")
-    
+        self._generation = next(_generations)
+        self._versions: Dict[str, int] = {}
+        self._build_views()
+    
+    def _build_views(self):
+        """Build materialized views and lookup indexes over the loaded data"""
+        self._payables_by_vendor: Dict[str, List[Dict]] = {}
+        for payable in self.data.get('payables', []):
+            self._payables_by_vendor.setdefault(payable.get('vendor_id'), []).append(payable)
+        self._receivables_by_client: Dict[str, List[Dict]] = {}
+        for receivable in self.data.get('receivables', []):
+            self._receivables_by_client.setdefault(receivable.get('client_id'), []).append(receivable)
+        
+        self.project_views = ProjectViews()
+        self.project_views.rebuild(
+            self.data.get('projects', []),
+            self.data.get('payables', []),
+            self.data.get('receivables', [])
+        )
+        self._scan_payables()
+    
+    def _scan_payables(self):
+        """Run the anomaly checks over the whole payables ledger"""
+        self.anomaly_detector = PayableAnomalyDetector(self.data.get('vendors', []))
+        self.anomaly_detector.scan(self.data.get('payables', []))
+    
+    @staticmethod
+    def _rekey(index: Dict[str, List[Dict]], key: str, old: Dict, record: Dict):
+        """Move an updated record to its new bucket if its grouping key changed"""
+        if old.get(key) == record.get(key):
+            return
+        bucket = index.get(old.get(key), [])
+        bucket[:] = [r for r in bucket if r is not record]
+        if not bucket:
+            index.pop(old.get(key), None)
+        index.setdefault(record.get(key), []).append(record)
+
     def _save_data(self):
         """Save data back to JSON file"""
         # Update metadata
@@ -38,6 +83,17 @@ class DataStore:
     def refresh(self):
         """Reload data from file"""
         self._load_data()
+
+    # ============ VERSIONS ============
+
+    def _touch(self, *collections: str):
+        """Note a write to these collections, invalidating results that read them"""
+        for name in collections:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def version(self, *collections: str) -> tuple:
+        """Changes whenever one of the collections is written or the data is reloaded"""
+        return (self._generation,) + tuple(self._versions.get(name, 0) for name in collections)
     
     # ============ READ METHODS ============
     
@@ -113,10 +169,22 @@ class DataStore:
                 return project
         return None
     
+    def get_project_financials(self, project_id: str) -> Optional[Dict]:
+        """Get billed, received, outstanding, cost, margin and burn for a project"""
+        return self.project_views.get(project_id)
+    
+    def get_all_project_financials(self) -> List[Dict]:
+        """Get financial views for all projects"""
+        return self.project_views.get_all()
+    
     def get_all_payables(self) -> List[Dict]:
         """Get all payable invoices"""
         return self.data.get('payables', [])
     
+    def get_payables_for_vendor(self, vendor_id: str) -> List[Dict]:
+        """Get all payables for a vendor (indexed)"""
+        return self._payables_by_vendor.get(vendor_id, [])
+    
     def get_pending_payables(self) -> List[Dict]:
         """Get pending payables (not paid)"""
         return [p for p in self.data.get('payables', []) 
@@ -127,10 +195,18 @@ class DataStore:
         return [p for p in self.data.get('payables', []) 
                 if p.get('status') == 'Overdue']
     
+    def get_payable_flags(self, invoice_id: Optional[str] = None) -> List[Dict]:
+        """Get anomaly flags (duplicates, GST mismatch, outliers, inactive vendor)"""
+        return self.anomaly_detector.get_flags(invoice_id)
+    
     def get_all_receivables(self) -> List[Dict]:
         """Get all receivable invoices"""
         return self.data.get('receivables', [])
     
+    def get_receivables_for_client(self, client_id: str) -> List[Dict]:
+        """Get all receivables for a client (indexed)"""
+        return self._receivables_by_client.get(client_id, [])
+    
     def get_pending_receivables(self) -> List[Dict]:
         """Get pending receivables (not fully paid)"""
         return [r for r in self.data.get('receivables', []) 
@@ -183,12 +259,20 @@ class DataStore:
         """Get total pending receivables amount"""
         return sum(r.get('balance_due', 0) for r in self.get_pending_receivables())
     
+    def get_trend_summary(self, days: int = 90) -> str:
+        """Get how cash and dues have moved over the last N days"""
+        return self.snapshots.trend_summary(days)
+    
     # ============ WRITE METHODS ============
     
     def add_payable(self, payable: Dict) -> bool:
         """Add new payable invoice"""
         try:
             self.data['payables'].append(payable)
+            self._payables_by_vendor.setdefault(payable.get('vendor_id'), []).append(payable)
+            self.project_views.apply_payable(None, payable)
+            self.anomaly_detector.check(payable)
+            self._touch('payables')
             self._save_data()
             return True
         except Exception as e:
@@ -200,7 +284,13 @@ class DataStore:
         try:
             for i, p in enumerate(self.data['payables']):
                 if p['invoice_id'] == invoice_id:
+                    old = dict(p)
                     self.data['payables'][i].update(updates)
+                    self._rekey(self._payables_by_vendor, 'vendor_id', old, self.data['payables'][i])
+                    self.project_views.apply_payable(old, self.data['payables'][i])
+                    self.anomaly_detector.remove(old)
+                    self.anomaly_detector.check(self.data['payables'][i])
+                    self._touch('payables')
                     self._save_data()
                     return True
             return False
@@ -212,6 +302,9 @@ class DataStore:
         """Add new receivable invoice"""
         try:
             self.data['receivables'].append(receivable)
+            self._receivables_by_client.setdefault(receivable.get('client_id'), []).append(receivable)
+            self.project_views.apply_receivable(None, receivable)
+            self._touch('receivables')
             self._save_data()
             return True
         except Exception as e:
@@ -223,7 +316,11 @@ class DataStore:
         try:
             for i, r in enumerate(self.data['receivables']):
                 if r['invoice_id'] == invoice_id:
+                    old = dict(r)
                     self.data['receivables'][i].update(updates)
+                    self._rekey(self._receivables_by_client, 'client_id', old, self.data['receivables'][i])
+                    self.project_views.apply_receivable(old, self.data['receivables'][i])
+                    self._touch('receivables')
                     self._save_data()
                     return True
             return False
@@ -238,19 +335,33 @@ class DataStore:
                 if acc['account_id'] == account_id:
                     self.data['bank_accounts'][i]['balance'] = new_balance
                     self.data['bank_accounts'][i]['last_updated'] = date.today().isoformat()
+                    self._touch('bank_accounts')
                     self._save_data()
+                    self.record_snapshot()
                     return True
             return False
         except Exception as e:
             print(f"Error updating bank balance: {e}")
             return False
 
+    def record_snapshot(self, day: Optional[date] = None) -> bool:
+        """Append today's balances, dues and aging to the history"""
+        try:
+            recorded = self.snapshots.record(self, day)
+            if recorded:
+                self._touch('snapshots')
+            return recorded
+        except Exception as e:
+            print(f"Error recording snapshot: {e}")
+            return False
+
     def add_financial_goal(self, goal: Dict) -> bool:
         """Add new financial goal"""
         try:
             if 'financial_goals' not in self.data:
                 self.data['financial_goals'] = []
             self.data['financial_goals'].append(goal)
+            self._touch('financial_goals')
             self._save_data()
             return True
         except Exception as e:
@@ -265,6 +376,7 @@ class DataStore:
             for i, g in enumerate(self.data['financial_goals']):
                 if g['goal_id'] == goal_id:
                     self.data['financial_goals'][i].update(updates)
+                    self._touch('financial_goals')
                     self._save_data()
                     return True
             return False
@@ -277,6 +389,8 @@ class DataStore:
 
 def format_currency(amount: float) -> str:
     """Format amount in Indian style (lakhs/crores)"""
+    if amount < 0:
+        return f"-{format_currency(-amount)}"
     if amount >= 10000000:  # 1 crore
         return f"₹{amount/10000000:.2f} Cr"
     elif amount >= 100000:  # 1 lakh
@@ -290,6 +404,10 @@ def format_data_for_llm(data: Any) -> str:
     if isinstance(data, list):
         if len(data) == 0:
             return "No data"
+        if all(isinstance(item, dict) for item in data):
+            # Header + one row per record instead of one key per line
+            from tools.utils import format_table
+            return format_table(data)
         
         result = []
         for item in data:
@@ -0,0 +1,208 @@
+"""
+Data Tools - The ledger's read methods, declared for Gemini function calling
+Arjun asks for exactly the records a question needs (one vendor's bills, the
+overdue receivables of one project) instead of being sent whole collections.
+Every tool is answered locally from the DataStore's indexes and views, as a
+compact table.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+from tools.context_builder import CLOSED_STATUSES
+from tools.data_store import DataStore, format_currency
+from tools.utils import format_table, format_cheques_issued, format_cheques_received, LLM_FIELDS
+
+DEFAULT_LIMIT = 25
+
+
+def _string(description: str) -> Dict:
+    return {'type': 'string', 'description': description}
+
+
+_LEDGER_FILTERS = {
+    'status': _string("Pending, Overdue, Due Today or Paid. Omit for all open invoices."),
+    'project_id': _string("Only invoices of this project, e.g. PRJ001"),
+    'limit': {'type': 'integer', 'description': f"Most rows to return (default {DEFAULT_LIMIT})"},
+}
+
+# Gemini function declarations (name, description, JSON-schema parameters)
+DECLARATIONS: List[Dict] = [
+    {
+        'name': 'get_cash_position',
+        'description': "Bank balances, credit limits, uncleared cheque totals and the pending payables/receivables totals.",
+        'parameters': {'type': 'object', 'properties': {}},
+    },
+    {
+        'name': 'find_payables',
+        'description': "Bills we owe, most urgent first. Filter by vendor (name or part of it), status or project.",
+        'parameters': {'type': 'object', 'properties': dict(
+            vendor=_string("Vendor name or part of it, e.g. 'ABC Steel'"), **_LEDGER_FILTERS
+        )},
+    },
+    {
+        'name': 'find_receivables',
+        'description': "Invoices clients owe us, largest balance first. Filter by client (name or part of it), status or project.",
+        'parameters': {'type': 'object', 'properties': dict(
+            client=_string("Client name or part of it, e.g. 'NHAI'"), **_LEDGER_FILTERS
+        )},
+    },
+    {
+        'name': 'get_party',
+        'description': "Master data for a vendor or client: credit/payment terms, criticality, payment history notes.",
+        'parameters': {'type': 'object', 'properties': {'name': _string("Vendor or client name, or part of it")},
+                       'required': ['name']},
+    },
+    {
+        'name': 'get_project_financials',
+        'description': "Billed, received, outstanding, cost, margin and cash burn per project.",
+        'parameters': {'type': 'object', 'properties': {
+            'project_id': _string("One project, e.g. PRJ001. Omit for all projects.")
+        }},
+    },
+    {
+        'name': 'get_uncleared_cheques',
+        'description': "Cheques not yet cleared.",
+        'parameters': {'type': 'object', 'properties': {
+            'direction': {'type': 'string', 'enum': ['issued', 'received'], 'description': "issued (by us) or received"}
+        }, 'required': ['direction']},
+    },
+    {
+        'name': 'get_payable_flags',
+        'description': "Anomaly flags on bills: duplicate invoices, GST mismatches, outlier amounts, inactive vendors.",
+        'parameters': {'type': 'object', 'properties': {'invoice_id': _string("One invoice, or omit for all flags")}},
+    },
+    {
+        'name': 'get_financial_goals',
+        'description': "Savings/funding goals with target, current amount, deadline and strategy.",
+        'parameters': {'type': 'object', 'properties': {}},
+    },
+    {
+        'name': 'get_trend',
+        'description': "How cash, dues and aging moved over recent days.",
+        'parameters': {'type': 'object', 'properties': {
+            'days': {'type': 'integer', 'description': "How far back to look (default 90)"}
+        }},
+    },
+]
+
+
+class DataTools:
+    """
+    tools.declarations            -> for the model
+    tools.execute(name, args)     -> {'result': "<table>"} for the model's reply
+    """
+
+    declarations = DECLARATIONS
+
+    def __init__(self, data_store: DataStore):
+        self.data_store = data_store
+        self._handlers: Dict[str, Callable[..., str]] = {
+            d['name']: getattr(self, d['name']) for d in DECLARATIONS
+        }
+
+    def execute(self, name: str, args: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+        """Run one tool call. Errors go back to the model as text, so it can correct itself."""
+        handler = self._handlers.get(name)
+        if handler is None:
+            return {'error': f"Unknown tool '{name}'. Available: {', '.join(self._handlers)}"}
+        try:
+            return {'result': handler(**(args or {}))}
+        except Exception as e:
+            return {'error': f"{name} failed: {type(e).__name__}: {e}"}
+
+    # ============ TOOLS ============
+
+    @staticmethod
+    def _limited(rows: List[Dict], fields: List[str], limit: Any) -> str:
+        # Function-call arguments arrive as floats
+        limit = int(limit) if limit else DEFAULT_LIMIT
+        table = format_table(rows[:limit], fields)
+        if len(rows) > limit:
+            table += f"\n(showing {limit} of {len(rows)})"
+        return table
+
+    @staticmethod
+    def _filtered(rows: List[Dict], status: Optional[str], project_id: Optional[str]) -> List[Dict]:
+        def normalised(value: Any) -> str:
+            return str(value or '').strip().lower()
+
+        if status:
+            rows = [r for r in rows if normalised(r.get('status')) == normalised(status)]
+        else:
+            rows = [r for r in rows if normalised(r.get('status')) not in CLOSED_STATUSES]
+        if project_id:
+            rows = [r for r in rows if r.get('project_id') == project_id]
+        return rows
+
+    def get_cash_position(self) -> str:
+        ds = self.data_store
+        cheques = ds.get_pending_cheques_summary()
+        return "\n".join([
+            format_table(ds.get_all_bank_accounts(), LLM_FIELDS['bank_accounts']),
+            f"Total bank balance: {format_currency(ds.get_total_bank_balance())}",
+            f"Uncleared cheques issued: {format_currency(cheques['issued'])}, received: {format_currency(cheques['received'])}",
+            f"Pending payables: {format_currency(ds.get_total_pending_payables())}",
+            f"Pending receivables: {format_currency(ds.get_total_pending_receivables())}",
+        ])
+
+    def find_payables(self, vendor: Optional[str] = None, status: Optional[str] = None,
+                      project_id: Optional[str] = None, limit: Any = None) -> str:
+        ds = self.data_store
+        if vendor:
+            match = ds.get_vendor_by_name(vendor)
+            if match is None:
+                return f"No vendor matching '{vendor}'."
+            rows = ds.get_payables_for_vendor(match['vendor_id'])
+        else:
+            rows = ds.get_all_payables()
+        rows = sorted(self._filtered(rows, status, project_id), key=lambda p: str(p.get('due_date', '')))
+        return self._limited(rows, LLM_FIELDS['payables'], limit)
+
+    def find_receivables(self, client: Optional[str] = None, status: Optional[str] = None,
+                         project_id: Optional[str] = None, limit: Any = None) -> str:
+        ds = self.data_store
+        if client:
+            match = ds.get_client_by_name(client)
+            if match is None:
+                return f"No client matching '{client}'."
+            rows = ds.get_receivables_for_client(match['client_id'])
+        else:
+            rows = ds.get_all_receivables()
+        rows = sorted(self._filtered(rows, status, project_id),
+                      key=lambda r: r.get('balance_due') or 0, reverse=True)
+        return self._limited(rows, LLM_FIELDS['receivables'], limit)
+
+    def get_party(self, name: str) -> str:
+        ds = self.data_store
+        vendor, client = ds.get_vendor_by_name(name), ds.get_client_by_name(name)
+        parts = []
+        if vendor:
+            parts.append("VENDOR\n" + format_table([vendor], LLM_FIELDS['vendors']))
+        if client:
+            parts.append("CLIENT\n" + format_table([client], LLM_FIELDS['clients']))
+        return "\n".join(parts) or f"No vendor or client matching '{name}'."
+
+    def get_project_financials(self, project_id: Optional[str] = None) -> str:
+        ds = self.data_store
+        if project_id:
+            view = ds.get_project_financials(project_id)
+            rows = [view] if view else []
+        else:
+            rows = ds.get_all_project_financials()
+        return format_table(rows, LLM_FIELDS['projects']) if rows else f"No project '{project_id}'."
+
+    def get_uncleared_cheques(self, direction: str) -> str:
+        direction = str(direction).strip().lower()
+        if direction not in ('issued', 'received'):
+            raise ValueError("direction must be 'issued' or 'received'")
+        cheques = self.data_store.get_cheque_register()
+        return format_cheques_issued(cheques) if direction == 'issued' else format_cheques_received(cheques)
+
+    def get_payable_flags(self, invoice_id: Optional[str] = None) -> str:
+        return format_table(self.data_store.get_payable_flags(invoice_id), LLM_FIELDS['flags'])
+
+    def get_financial_goals(self) -> str:
+        return format_table(self.data_store.get_financial_goals(), LLM_FIELDS['goals'])
+
+    def get_trend(self, days: Any = 90) -> str:
+        return self.data_store.get_trend_summary(int(days or 90))
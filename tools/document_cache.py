@@ -0,0 +1,175 @@
+"""
+Document Cache - Uploads stored by content, and their finished extractions
+Every upload is kept once under the sha256 of its bytes, whatever it was
+called and however often it is forwarded. Meera's extraction of a file is
+kept too, keyed by the file's hash and the extraction prompt's version, so the same invoice sent again is answered without a model call.
+Files unused for UPLOAD_RETENTION_DAYS are deleted, and the least recently
+used go first when the store outgrows UPLOAD_MAX_MB.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from config.settings import Settings
+from tools.models import DocumentExtraction
+
+CHUNK_BYTES = 1024 * 1024
+
+
+class StoredDocument(NamedTuple):
+    path: str
+    digest: str
+    duplicate: bool
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentStore:
+    """
+    stored = store.add(downloaded_path, "invoice.pdf")   # moved to blobs/ab/abcd....pdf
+    store.get_extraction(stored.digest, version) / store.put_extraction(...)
+    """
+
+    def __init__(
+        self,
+        root: str = "data/uploads",
+        max_bytes: int = 500 * 1024 * 1024,
+        retention_days: float = 90
+    ):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.retention_seconds = retention_days * 24 * 3600
+        self._lock = threading.Lock()
+        self.counters = {'uploads': 0, 'duplicates': 0, 'extraction_hits': 0, 'extraction_misses': 0, 'evictions': 0}
+        self._bytes = sum(p.stat().st_size for p in self._blobs())
+
+    # ============ UPLOADS ============
+
+    def incoming_path(self, file_name: str) -> str:
+        """Where to download a new upload before add() files it away"""
+        incoming = self.root / "incoming"
+        incoming.mkdir(parents=True, exist_ok=True)
+        return str(incoming / f"{time.time_ns()}_{Path(file_name).name}")
+
+    def add(self, path: str, file_name: Optional[str] = None) -> StoredDocument:
+        """
+        File `path` under its content hash (keeping the extension, which
+        decides how it is read). The original is moved, or deleted if the
+        same bytes are already stored.
+        """
+        digest = file_digest(path)
+        suffix = Path(file_name or path).suffix.lower()
+        blob = self._blob_path(digest, suffix)
+        with self._lock:
+            self.counters['uploads'] += 1
+            if blob.exists():
+                self.counters['duplicates'] += 1
+                Path(path).unlink(missing_ok=True)
+                os.utime(blob)  # mark as recently used for eviction
+                return StoredDocument(str(blob), digest, True)
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(path, blob)
+            self._bytes += blob.stat().st_size
+        self.sweep(keep=blob)
+        return StoredDocument(str(blob), digest, False)
+
+    # ============ EXTRACTIONS ============
+
+    def get_extraction(self, digest: str, version: str) -> Optional[DocumentExtraction]:
+        path = self._extraction_path(digest, version)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                extraction = DocumentExtraction.model_validate_json(f.read())
+        except (OSError, ValueError):
+            with self._lock:
+                self.counters['extraction_misses'] += 1
+            return None
+        with self._lock:
+            self.counters['extraction_hits'] += 1
+        self._touch(digest)
+        return extraction
+
+    def put_extraction(self, digest: str, version: str, extraction: DocumentExtraction):
+        path = self._extraction_path(digest, version)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(extraction.model_dump_json())
+        except OSError as e:
+            print(f"⚠️ Could not cache the extraction of {digest[:12]}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, bytes=self._bytes)
+
+    # ============ RETENTION ============
+
+    def sweep(self, keep: Optional[Path] = None):
+        """
+        Delete files unused past retention, and least recently used ones
+        until back under 90% of the budget, with their extractions. `keep`
+        (the file just added) is never dropped.
+        """
+        now = time.time()
+        with self._lock:
+            target = self.max_bytes * 0.9 if self._bytes > self.max_bytes else self.max_bytes
+            for blob in sorted(self._blobs(), key=lambda p: p.stat().st_mtime):
+                # Oldest first: once one is kept, every later one is newer and fits
+                if now - blob.stat().st_mtime <= self.retention_seconds and self._bytes <= target:
+                    break
+                if blob != keep:
+                    self._drop(blob)
+
+    def _drop(self, blob: Path):
+        size = blob.stat().st_size
+        blob.unlink(missing_ok=True)
+        self._bytes -= size
+        self.counters['evictions'] += 1
+        digest = blob.name.split('.')[0]
+        for extraction in (self.root / "extractions" / digest[:2]).glob(f"{digest}.*.json"):
+            extraction.unlink(missing_ok=True)
+
+    # ============ PATHS ============
+
+    def _blobs(self):
+        blobs = self.root / "blobs"
+        if not blobs.exists():
+            return []
+        return list(blobs.glob('*/*'))
+
+    def _blob_path(self, digest: str, suffix: str) -> Path:
+        return self.root / "blobs" / digest[:2] / f"{digest}{suffix}"
+
+    def _extraction_path(self, digest: str, version: str) -> Path:
+        return self.root / "extractions" / digest[:2] / f"{digest}.{version}.json"
+
+    def _touch(self, digest: str):
+        for blob in (self.root / "blobs" / digest[:2]).glob(f"{digest}*"):
+            os.utime(blob)
+
+
+_shared_documents: Optional[DocumentStore] = None
+
+
+def get_shared_documents() -> DocumentStore:
+    """Process-wide upload store"""
+    global _shared_documents
+    if _shared_documents is None:
+        _shared_documents = DocumentStore(
+            root=Settings.UPLOAD_DIR,
+            max_bytes=Settings.UPLOAD_MAX_MB * 1024 * 1024,
+            retention_days=Settings.UPLOAD_RETENTION_DAYS
+        )
+    return _shared_documents
@@ -1,66 +1,572 @@
-import os
 import json
-import re
 import time
 import random
+import asyncio
+import weakref
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Optional, List, Dict, Any
-import google.generativeai as genai
+from typing import Optional, List, Dict, Any, Callable, Awaitable, Tuple, Type, TypeVar, Union, Iterator, AsyncIterator
 from PIL import Image
+from pydantic import BaseModel, ValidationError
 from opik import track
+from config.settings import Settings
 from tools.models import AgentResponse
+from tools.response_cache import ResponseCache, get_shared_cache
+from tools.rate_limiter import RateLimiter, get_shared_limiter, estimate_tokens
+from tools.call_metrics import CallMetrics, get_shared_metrics, note_attempt, current_call_site
+from tools.llm_backend import (
+    LLMBackend, ContextCacheRegistry, function_calls, get_shared_backend, get_shared_context_caches
+)
+from tools.model_router import ModelRouter, get_shared_router
+from tools.single_flight import SingleFlight, get_shared_flights
+from tools.conversation_memory import ConversationMemory
+from tools.utils import extract_json
+from tools.pdf_extract import extract_text
+from tools.resilience import (
+    BackendUnavailable, CircuitBreaker, DeadlineExceeded, Hedger,
+    call_timeout, check_deadline, remaining, note_degraded, get_shared_breaker, get_shared_hedger
+)
 from dotenv import load_dotenv
 
 load_dotenv()
 
+Schema = TypeVar("Schema", bound=BaseModel)
+
+# Shown when Gemini can't be reached in time and nothing is cached
+DEGRADED_REPLY = "I can't reach my analysis engine right now, sir. Please try again in a minute."
+
+
+class StructuredOutputError(ValueError):
+    """The model's reply didn't match the requested schema, even after a repair attempt"""
+
+    def __init__(self, message: str, raw: str):
+        super().__init__(message)
+        self.raw = raw
+
+# One concurrency limit per event loop, shared by every GeminiBrain
+_async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def _concurrency_slot() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slot = _async_slots.get(loop)
+    if slot is None:
+        slot = _async_slots[loop] = asyncio.Semaphore(Settings.GEMINI_MAX_CONCURRENCY)
+    return slot
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    error_str = str(error).lower()
+    return "429" in error_str or "resource exhausted" in error_str
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limit errors (429), Service Unavailable (503) or a timed-out attempt"""
+    if isinstance(error, BackendUnavailable):
+        return False
+    return _is_rate_limit(error) or "503" in str(error) or isinstance(error, TimeoutError)
+
+
+def _is_outage(error: Exception) -> bool:
+    """Failures that say the backend is unhealthy (not our request, not our budget)"""
+    return _is_retryable(error) and not _is_rate_limit(error)
+
+
+def _chunk_text(chunk) -> str:
+    # The closing chunk of a stream may carry only a finish reason
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _total_tokens(response) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) else None
+
+
 class GeminiBrain:
-    def __init__(self, model_name: str = "gemini-flash-latest"):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(model_name)
-        self.vision_model = genai.GenerativeModel("gemini-flash-latest") # or pro for vision too
+    MAX_RETRIES = 3
+    BASE_DELAY = 2
+    # Overridden in __init__; defaults keep partially built instances usable
+    cache: Optional[ResponseCache] = None
+    limiter: Optional[RateLimiter] = None
+    metrics: Optional[CallMetrics] = None
+    context_caches: Optional[ContextCacheRegistry] = None
+    router: Optional[ModelRouter] = None
+    breaker: Optional[CircuitBreaker] = None
+    hedger: Optional[Hedger] = None
+    flights: Optional[SingleFlight] = None
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        limiter: Optional[RateLimiter] = None,
+        metrics: Optional[CallMetrics] = None,
+        backend: Optional[LLMBackend] = None,
+        context_caches: Optional[ContextCacheRegistry] = None,
+        router: Optional[ModelRouter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedger: Optional[Hedger] = None,
+        flights: Optional[SingleFlight] = None
+    ):
+        # Raises if GEMINI_API_KEY is missing (unless LLM_BACKEND is replay or fake)
+        self.backend = backend or get_shared_backend()
+        self.model_name = model_name or Settings.MODEL_NAME
+        self.vision_model_name = Settings.VISION_MODEL_NAME
+        # An explicit model_name pins every text call to that model
+        if router is None and model_name is None and Settings.MODEL_ROUTING_ENABLED:
+            router = get_shared_router()
+        self.router = router
+        if cache is None and Settings.LLM_CACHE_ENABLED:
+            cache = get_shared_cache()
+        self.cache = cache
+        if limiter is None and Settings.RATE_LIMIT_ENABLED:
+            limiter = get_shared_limiter()
+        self.limiter = limiter
+        if metrics is None and Settings.METRICS_ENABLED:
+            metrics = get_shared_metrics()
+        self.metrics = metrics
+        if context_caches is None and Settings.CONTEXT_CACHE_ENABLED:
+            context_caches = get_shared_context_caches()
+        self.context_caches = context_caches
+        self.breaker = breaker or get_shared_breaker()
+        self.hedger = hedger or get_shared_hedger()
+        if flights is None and Settings.SINGLE_FLIGHT_ENABLED:
+            flights = get_shared_flights()
+        self.flights = flights
+
+    # ============ ROUTING ============
+
+    def model_for(self, call_site: str) -> str:
+        """Model a text call from `call_site` goes to"""
+        if self.router is None:
+            return self.model_name
+        return self.router.model_for(call_site)
+
+    def _text_model(self) -> str:
+        """Model for a text call, chosen by the calling agent method"""
+        return self.model_for(current_call_site())
+
+    # ============ CACHING ============
+
+    def _cache_key(self, call_type: str, model_name: str, key_parts: List[Union[str, bytes]], use_cache: bool) -> Optional[str]:
+        if not use_cache or self.cache is None:
+            return None
+        return self.cache.make_key(model_name, call_type, *key_parts)
+
+    def _measure(self, call_type: str, model_name: str, key_parts: List[Union[str, bytes]]):
+        """Record tokens, latency, retries and cache hits for one call"""
+        if self.metrics is None:
+            return nullcontext({})
+        prompt_bytes = sum(len(p) if isinstance(p, bytes) else len(str(p).encode('utf-8')) for p in key_parts)
+        return self.metrics.measure(call_type, model_name, prompt_bytes)
+
+    def _cached(
+        self,
+        call_type: str,
+        model_name: str,
+        key_parts: List[Union[str, bytes]],
+        produce: Callable[[], str],
+        use_cache: bool = True
+    ) -> str:
+        """
+        Return the cached response for this exact request, or produce and store it.
+        Identical requests already in flight share one API call.
+        """
+        key = self._cache_key(call_type, model_name, key_parts, use_cache)
+        with self._measure(call_type, model_name, key_parts) as call:
+            if key is not None:
+                cached = self.cache.get(key, call_type)
+                if cached is not None:
+                    call['cache_hit'] = True
+                    return cached
+            try:
+                if self.flights is None:
+                    text, shared = produce(), False
+                else:
+                    text, shared = self.flights.do(self._flight_key(call_type, model_name, key_parts), produce)
+            except BackendUnavailable as e:
+                return self._stale_or_raise(key, call, e)
+            return self._store(key, call_type, text, call, shared)
+
+    async def _acached(
+        self,
+        call_type: str,
+        model_name: str,
+        key_parts: List[Union[str, bytes]],
+        produce: Callable[[], Awaitable[str]],
+        use_cache: bool = True
+    ) -> str:
+        """Async version of _cached."""
+        key = self._cache_key(call_type, model_name, key_parts, use_cache)
+        with self._measure(call_type, model_name, key_parts) as call:
+            if key is not None:
+                cached = self.cache.get(key, call_type)
+                if cached is not None:
+                    call['cache_hit'] = True
+                    return cached
+            try:
+                if self.flights is None:
+                    text, shared = await produce(), False
+                else:
+                    text, shared = await self.flights.ado(self._flight_key(call_type, model_name, key_parts), produce)
+            except BackendUnavailable as e:
+                return self._stale_or_raise(key, call, e)
+            return self._store(key, call_type, text, call, shared)
+
+    @staticmethod
+    def _flight_key(call_type: str, model_name: str, key_parts: List[Union[str, bytes]]) -> str:
+        # Same address as the response cache, but used even when caching is off
+        return ResponseCache.make_key(model_name, call_type, *key_parts)
+
+    def _store(self, key: Optional[str], call_type: str, text: str, call: Dict, shared: bool) -> str:
+        """Cache a fresh answer; one shared from another caller's request is already cached by it"""
+        if shared:
+            call['coalesced'] = True
+        elif key is not None:
+            self.cache.put(key, call_type, text)
+        return text
+
+    def _stale_or_raise(self, key: Optional[str], call: Dict, error: BackendUnavailable) -> str:
+        """An expired answer to the same request beats no answer when Gemini is down"""
+        stale = self.cache.get_stale(key) if key is not None and self.cache is not None else None
+        if stale is None:
+            raise error
+        print(f"⚠️ {error}. Using an earlier answer to the same request.")
+        note_degraded()
+        call['cache_hit'] = True
+        call['error'] = f"served stale: {error}"[:200]
+        return stale
+
+    # ============ TRANSPORT ============
+
+    def _retry_delay(self, attempt: int) -> float:
+        # Exponential backoff with jitter
+        return (self.BASE_DELAY * (2 ** attempt)) + random.uniform(0, 1)
+
+    def _record_outcome(self, estimated: int, response=None, error: Optional[Exception] = None, call: Optional[Dict] = None):
+        """Feed the result of a call back into the rate limiter and call metrics"""
+        note_attempt(response, error, call)
+        if self.breaker is not None:
+            if error is None or not _is_outage(error):
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        if self.limiter is None:
+            return
+        if error is not None:
+            if _is_rate_limit(error):
+                self.limiter.on_rate_limited()
+            return
+        self.limiter.on_success()
+        self.limiter.record_usage(estimated, _total_tokens(response))
+
+    def _before_attempt(self) -> Optional[int]:
+        """
+        Fail fast when out of time or when Gemini is known to be down.
+        Returns the breaker's probe token if this attempt is its half-open probe.
+        """
+        check_deadline()
+        if self.breaker is not None:
+            return self.breaker.before_call()
+        return None
+
+    def _release_probe(self, probe: Optional[int]):
+        # No-op once the attempt recorded an outcome; frees the probe if it never did
+        if self.breaker is not None:
+            self.breaker.release_probe(probe)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Delay before the next attempt, unless it would run past the deadline"""
+        delay = self._retry_delay(attempt)
+        left = remaining()
+        if left is not None and delay >= left:
+            raise DeadlineExceeded(f"No time left to retry after: {error}") from error
+        print(f"⚠️ Rate limit hit. Retrying in {delay:.2f}s...")
+        return delay
+
+    def _allow_hedge(self, estimated: int) -> Callable[[], bool]:
+        # A hedge is only worth sending if the budget has room right now
+        return lambda: self.limiter is None or self.limiter.try_acquire(estimated)
+
+    def _attempt(self, func, *args, **kwargs):
+        """One API call, with a timeout and (if enabled) a hedged duplicate"""
+        if self.hedger is None:
+            return func(*args, **kwargs)
+        return self.hedger.call(
+            kwargs.get('model_name', ''), lambda: func(*args, **kwargs), call_timeout(),
+            self._allow_hedge(estimate_tokens(args[0] if args else ""))
+        )
+
+    async def _aattempt(self, func, *args, **kwargs):
+        async def attempt():
+            async with _concurrency_slot():
+                return await func(*args, **kwargs)
+
+        if self.hedger is None:
+            return await attempt()
+        return await self.hedger.acall(
+            kwargs.get('model_name', ''), attempt, call_timeout(),
+            self._allow_hedge(estimate_tokens(args[0] if args else ""))
+        )
 
     def _generate_with_retry(self, func, *args, **kwargs):
         """
         Execute a generation function with exponential backoff retry.
+        Each attempt is admitted by the shared rate limiter first, and none
+        starts or waits past the caller's deadline.
         """
-        max_retries = 3
-        base_delay = 2
-        
-        for attempt in range(max_retries):
+        estimated = estimate_tokens(args[0] if args else "")
+        for attempt in range(self.MAX_RETRIES):
+            probe = self._before_attempt()
             try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                # Check for rate limit errors (429) or Service Unavailable (503)
-                error_str = str(e).lower()
-                if "429" in error_str or "resource exhausted" in error_str or "503" in error_str:
-                    if attempt == max_retries - 1:
+                if self.limiter is not None:
+                    self.limiter.acquire(estimated)
+                try:
+                    response = self._attempt(func, *args, **kwargs)
+                except Exception as e:
+                    self._record_outcome(estimated, error=e)
+                    if not _is_retryable(e) or attempt == self.MAX_RETRIES - 1:
                         raise e
-                    
-                    # Exponential backoff with jitter
-                    delay = (base_delay * (2 ** attempt)) + random.uniform(0, 1)
-                    print(f"⚠️ Rate limit hit. Retrying in {delay:.2f}s...")
-                    time.sleep(delay)
-                else:
-                    raise e
-                    
-    @track(name="gemini_brain.think")
-    def think(
-        self, 
-        character: str, 
-        context: str, 
-        question: str, 
-        response_format: str = "text"
-    ) -> AgentResponse:
+                    time.sleep(self._backoff(attempt, e))
+                    continue
+                self._record_outcome(estimated, response)
+                return response
+            finally:
+                self._release_probe(probe)
+
+    async def _agenerate_with_retry(self, func, *args, **kwargs):
         """
-        This is how agents THINK.
+        Await an async generation function with exponential backoff retry,
+        holding one of the shared concurrency slots while the call is in flight.
         """
-        prompt = f"""
-{character}
+        estimated = estimate_tokens(args[0] if args else "")
+        for attempt in range(self.MAX_RETRIES):
+            probe = self._before_attempt()
+            try:
+                if self.limiter is not None:
+                    await self.limiter.aacquire(estimated)
+                try:
+                    response = await self._aattempt(func, *args, **kwargs)
+                except Exception as e:
+                    self._record_outcome(estimated, error=e)
+                    if not _is_retryable(e) or attempt == self.MAX_RETRIES - 1:
+                        raise e
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    continue
+                self._record_outcome(estimated, response)
+                return response
+            finally:
+                self._release_probe(probe)
+
+    def _request(
+        self,
+        model_name: str,
+        system_instruction: Optional[str],
+        contents: list,
+        prefix: Optional[str] = None
+    ) -> Tuple[list, Dict[str, Any]]:
+        """
+        Backend arguments for a call. A stable prefix goes through a context
+        cache when one can be made, otherwise it is sent inline ahead of the
+        volatile contents.
+        """
+        kwargs = {'model_name': model_name, 'system_instruction': system_instruction}
+        if not prefix:
+            return contents, kwargs
+        handle = None
+        if self.context_caches is not None:
+            handle = self.context_caches.handle(self.backend, model_name, system_instruction, prefix)
+        if handle is None:
+            return [prefix, *contents], kwargs
+        kwargs['cached_content'] = handle
+        return contents, kwargs
+
+    def _generate(
+        self,
+        model_name: str,
+        system_instruction: Optional[str],
+        contents: list,
+        prefix: Optional[str] = None,
+        response_schema: Optional[Type[BaseModel]] = None
+    ):
+        contents, kwargs = self._request(model_name, system_instruction, contents, prefix)
+        if response_schema is not None:
+            kwargs['response_schema'] = response_schema
+        return self._generate_with_retry(self.backend.generate, contents, **kwargs)
+
+    async def _agenerate(
+        self,
+        model_name: str,
+        system_instruction: Optional[str],
+        contents: list,
+        prefix: Optional[str] = None,
+        response_schema: Optional[Type[BaseModel]] = None
+    ):
+        # Creating a context cache is a blocking API call
+        contents, kwargs = await asyncio.to_thread(self._request, model_name, system_instruction, contents, prefix)
+        if response_schema is not None:
+            kwargs['response_schema'] = response_schema
+        return await self._agenerate_with_retry(self.backend.agenerate, contents, **kwargs)
+
+    # ============ STREAMING ============
+    # A stream can't be retried once text has been shown, so only failures
+    # before the first chunk are retried.
+
+    def _stream_call(self, call_type: str, model_name: str, key_parts: List[Union[str, bytes]], use_cache: bool):
+        """(cache key, cached text or None, metrics call record or None)"""
+        key = self._cache_key(call_type, model_name, key_parts, use_cache)
+        call = None
+        if self.metrics is not None:
+            prompt_bytes = sum(len(p) if isinstance(p, bytes) else len(str(p).encode('utf-8')) for p in key_parts)
+            call = self.metrics.start(call_type, model_name, prompt_bytes)
+        cached = self.cache.get(key, call_type) if key is not None else None
+        if cached is not None and call is not None:
+            call['cache_hit'] = True
+        return key, cached, call
+
+    def _finish_stream(self, call: Optional[Dict]):
+        """Record a stream's call exactly once, however it ended"""
+        if call is not None and not call.get('finished'):
+            call['finished'] = True
+            self.metrics.finish(call)
+
+    def _stream_fallback(self, key: Optional[str], call: Optional[Dict], error: BackendUnavailable) -> str:
+        """Stale answer or apology to show instead of a stream that can't start"""
+        try:
+            text = self._stale_or_raise(key, call if call is not None else {}, error)
+        except BackendUnavailable:
+            print(f"⚠️ {error}")
+            text = DEGRADED_REPLY
+            note_degraded()
+            if call is not None:
+                call['error'] = str(error)[:200]
+        self._finish_stream(call)
+        return text
+
+    def _stream_done(self, call_type: str, key: Optional[str], text: str, call: Optional[Dict]):
+        if key is not None:
+            self.cache.put(key, call_type, text)
+        self._finish_stream(call)
+
+    def _stream(self, call_type: str, model_name: str, system_instruction: str, prompt: str, prefix: Optional[str],
+                key_parts: List[Union[str, bytes]], use_cache: bool) -> Iterator[str]:
+        key, cached, call = self._stream_call(call_type, model_name, key_parts, use_cache)
+        try:
+            if cached is not None:
+                self._stream_done(call_type, None, cached, call)
+                yield cached
+                return
 
+            contents, kwargs = self._request(model_name, system_instruction, [prompt], prefix)
+            estimated = estimate_tokens(contents)
+            parts: List[str] = []
+            for attempt in range(self.MAX_RETRIES):
+                last, probe = None, None
+                try:
+                    probe = self._before_attempt()
+                    if self.limiter is not None:
+                        self.limiter.acquire(estimated)
+                    for chunk in self.backend.stream(contents, **kwargs):
+                        last = chunk
+                        text = _chunk_text(chunk)
+                        if text:
+                            if not parts and call is not None:
+                                call['first_chunk_ms'] = round((time.perf_counter() - call['started']) * 1000, 1)
+                            parts.append(text)
+                            yield text
+                except BackendUnavailable as e:
+                    # Out of time or breaker open before anything was sent
+                    yield self._stream_fallback(key, call, e)
+                    return
+                except Exception as e:
+                    self._record_outcome(estimated, error=e, call=call)
+                    if parts or not _is_retryable(e) or attempt == self.MAX_RETRIES - 1:
+                        self._finish_stream(call)
+                        raise e
+                    try:
+                        time.sleep(self._backoff(attempt, e))
+                    except BackendUnavailable as timeout:
+                        yield self._stream_fallback(key, call, timeout)
+                        return
+                    continue
+                else:
+                    # Usage totals arrive on the last chunk
+                    self._record_outcome(estimated, last, call=call)
+                finally:
+                    self._release_probe(probe)
+                break
+            self._stream_done(call_type, key, "".join(parts), call)
+        finally:
+            # A consumer that stops reading early closes the generator here
+            if call is not None and not call.get('finished'):
+                call['error'] = call['error'] or "Stream closed before it finished"
+                self._finish_stream(call)
+
+    async def _astream(self, call_type: str, model_name: str, system_instruction: str, prompt: str, prefix: Optional[str],
+                       key_parts: List[Union[str, bytes]], use_cache: bool) -> AsyncIterator[str]:
+        key, cached, call = self._stream_call(call_type, model_name, key_parts, use_cache)
+        try:
+            if cached is not None:
+                self._stream_done(call_type, None, cached, call)
+                yield cached
+                return
+
+            contents, kwargs = await asyncio.to_thread(self._request, model_name, system_instruction, [prompt], prefix)
+            estimated = estimate_tokens(contents)
+            parts: List[str] = []
+            for attempt in range(self.MAX_RETRIES):
+                last, probe = None, None
+                try:
+                    probe = self._before_attempt()
+                    if self.limiter is not None:
+                        await self.limiter.aacquire(estimated)
+                    async with _concurrency_slot():
+                        async for chunk in self.backend.astream(contents, **kwargs):
+                            last = chunk
+                            text = _chunk_text(chunk)
+                            if text:
+                                if not parts and call is not None:
+                                    call['first_chunk_ms'] = round((time.perf_counter() - call['started']) * 1000, 1)
+                                parts.append(text)
+                                yield text
+                except BackendUnavailable as e:
+                    yield self._stream_fallback(key, call, e)
+                    return
+                except Exception as e:
+                    self._record_outcome(estimated, error=e, call=call)
+                    if parts or not _is_retryable(e) or attempt == self.MAX_RETRIES - 1:
+                        self._finish_stream(call)
+                        raise e
+                    try:
+                        delay = self._backoff(attempt, e)
+                    except BackendUnavailable as timeout:
+                        yield self._stream_fallback(key, call, timeout)
+                        return
+                    await asyncio.sleep(delay)
+                    continue
+                else:
+                    self._record_outcome(estimated, last, call=call)
+                finally:
+                    self._release_probe(probe)
+                break
+            self._stream_done(call_type, key, "".join(parts), call)
+        finally:
+            # A consumer that stops reading early closes the generator here
+            if call is not None and not call.get('finished'):
+                call['error'] = call['error'] or "Stream closed before it finished"
+                self._finish_stream(call)
+
+    # ============ PROMPTS ============
+
+    # The character goes in as the system instruction, so prompts only carry
+    # the per-call part
+
+    def _think_prompt(self, context: str, question: str, response_format: str) -> str:
+        prompt = f"""
 CURRENT SITUATION:
 {context}
 
@@ -71,136 +577,521 @@ Think through this step by step, then give your answer.
 """
         if response_format == "json":
             prompt += "\nYour final answer MUST be a valid JSON object."
+        return prompt
+
+    def _schema_text(self, schema: Type[BaseModel]) -> str:
+        return json.dumps(schema.model_json_schema(), separators=(',', ':'))
+
+    def _json_instruction(self, schema: Type[BaseModel]) -> str:
+        """Closing line of a structured prompt. The schema itself only goes in
+        the prompt when the backend can't enforce it."""
+        instruction = "Reply with a single JSON object and nothing else."
+        if not self.backend.supports_response_schema:
+            instruction += f"\nIt must match this JSON schema: {self._schema_text(schema)}"
+        return instruction
+
+    def _structured_prompt(self, context: str, question: str, schema: Type[BaseModel]) -> str:
+        # No "think step by step": the schema fields carry the reasoning we need
+        return f"""
+CURRENT SITUATION:
+{context}
+
+QUESTION FOR YOU:
+{question}
+
+{self._json_instruction(schema)}
+"""
+
+    def _repair_prompt(self, reply: str, error: StructuredOutputError, schema: Type[BaseModel]) -> str:
+        return f"""
+Your previous reply did not match the required format.
+
+ERROR: {str(error)[:500]}
+
+PREVIOUS REPLY:
+{reply[:4000]}
+
+Return the corrected answer. {self._json_instruction(schema)}
+"""
+
+    def _discuss_prompt(self, conversation_history: Union[List[Dict[str, str]], ConversationMemory], new_message: str) -> str:
+        # A plain list is bounded too: turns beyond the window are clipped, not summarized
+        if not isinstance(conversation_history, ConversationMemory):
+            conversation_history = ConversationMemory.from_history(conversation_history)
+        history_str = conversation_history.render()
+
+        return f"""
+CONVERSATION HISTORY:
+{history_str}
+
+USER MESSAGE:
+{new_message}
+
+Think step-by-step about the context, then respond.
+"""
+
+    def _prepare_document(
+        self,
+        image_path: str,
+        question: str,
+        is_pdf: bool,
+        instruction: str = "Analyze this document and think step-by-step."
+    ) -> Tuple[str, list]:
+        """Read the document and build the model input. Returns (model name, contents)."""
+        content_input = []
+        
+        if is_pdf:
+            # Pages are read only until the character budget is met
+            pdf = extract_text(image_path)
+            print(f"📄 Extracted text from {pdf.pages_read} of {pdf.page_count} PDF pages: {image_path}")
+            text_content = pdf.text
+            if pdf.truncated:
+                text_content += f"\n[... stopped at page {pdf.pages_read} of {pdf.page_count}, text limit reached]"
+
+            # Append extracted text to the question/prompt
+            question = f"{question}\n\nDOCUMENT CONTENT:\n{text_content}"
+            # content_input remains empty as we put text in prompt
+
+            # Use a text model since there's no image
+            model_to_use = self._text_model()
+        else:
+            # Handle Image with Vision Model
+            img = Image.open(image_path)
+            content_input = [img]
+            model_to_use = self.vision_model_name
+
+        prompt = f"QUESTION: {question}\n\n{instruction}"
+        return model_to_use, [prompt, *content_input]
 
-        response = self._generate_with_retry(self.model.generate_content, prompt)
-        full_text = response.text
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
 
+    @staticmethod
+    def _document_text(response) -> str:
+        if not response.parts:
+             raise ValueError("Gemini returned an empty response.")
+        return response.text
+
+    # ============ RESPONSES ============
+
+    def _agent_response(self, agent_name: str, query: str, full_text: str, confidence: float) -> AgentResponse:
         # Try to split thinking and final response
         thinking, final_answer = self._split_response(full_text)
-
         return AgentResponse(
-            agent_name="GeminiBrain", # This will be overridden by the calling agent usually
-            query=question,
+            agent_name=agent_name,
+            query=query,
             thinking=thinking,
             response=final_answer,
-            confidence=0.9, # Placeholder, LLM doesn't natively return confidence unless asked
+            confidence=confidence,
             needs_human_review=False,
             timestamp=datetime.now()
         )
 
+    def _document_error(self, question: str, error: Exception) -> AgentResponse:
+        return AgentResponse(
+            agent_name="GeminiVisionBrain",
+            query=question,
+            thinking=f"Error processing document: {str(error)}",
+            response=f"I encountered an error while trying to read the document: {str(error)}",
+            confidence=0.0,
+            needs_human_review=True,
+            timestamp=datetime.now()
+        )
+
+    def _degraded_response(self, agent_name: str, query: str, error: BackendUnavailable) -> AgentResponse:
+        print(f"⚠️ {error}")
+        note_degraded()
+        return AgentResponse(
+            agent_name=agent_name,
+            query=query,
+            thinking=f"Gemini unavailable: {error}",
+            response=DEGRADED_REPLY,
+            confidence=0.0,
+            needs_human_review=True,
+            timestamp=datetime.now()
+        )
+
+    # ============ STRUCTURED OUTPUT ============
+
+    def _validated(self, schema: Type[Schema], text: str) -> Schema:
+        data = extract_json(text, object_only=True)
+        if data is None:
+            raise StructuredOutputError(f"No JSON object in {schema.__name__} reply", text)
+        try:
+            return schema.model_validate(data)
+        except ValidationError as e:
+            raise StructuredOutputError(f"{schema.__name__} reply failed validation: {e}", text)
+
+    def _produce_structured(self, schema: Type[Schema], generate: Callable[[list, Optional[str]], Any],
+                            contents: list, prefix: Optional[str]) -> str:
+        """
+        Generate, validate, and on failure ask once for a repair. Only the
+        repaired JSON goes back (no prefix), so the retry is cheap. Returns
+        normalised JSON, so the response cache only ever holds valid replies.
+        """
+        text = self._document_text(generate(contents, prefix))
+        try:
+            return self._validated(schema, text).model_dump_json()
+        except StructuredOutputError as e:
+            print(f"⚠️ {e}. Asking for a repair...")
+            repaired = self._document_text(generate([self._repair_prompt(text, e, schema)], None))
+            return self._validated(schema, repaired).model_dump_json()
+
+    async def _aproduce_structured(self, schema: Type[Schema], agenerate: Callable[[list, Optional[str]], Awaitable[Any]],
+                                   contents: list, prefix: Optional[str]) -> str:
+        """Async version of _produce_structured."""
+        text = self._document_text(await agenerate(contents, prefix))
+        try:
+            return self._validated(schema, text).model_dump_json()
+        except StructuredOutputError as e:
+            print(f"⚠️ {e}. Asking for a repair...")
+            repaired = self._document_text(await agenerate([self._repair_prompt(text, e, schema)], None))
+            return self._validated(schema, repaired).model_dump_json()
+
+    # ============ SYNC API ============
+
+    @track(name="gemini_brain.think")
+    def think(
+        self, 
+        character: str, 
+        context: str, 
+        question: str, 
+        response_format: str = "text",
+        use_cache: bool = True,
+        prefix: Optional[str] = None
+    ) -> AgentResponse:
+        """
+        This is how agents THINK.
+        `prefix` is stable data shared by several calls (e.g. a ledger
+        snapshot); it is sent once as a context cache and reused.
+        """
+        prompt = self._think_prompt(context, question, response_format)
+        model_name = self._text_model()
+        try:
+            full_text = self._cached(
+                "think", model_name, [character, prefix or "", prompt],
+                lambda: self._generate(model_name, character, [prompt], prefix).text,
+                use_cache
+            )
+        except BackendUnavailable as e:
+            return self._degraded_response("GeminiBrain", question, e)
+        # agent_name will be overridden by the calling agent usually;
+        # confidence is a placeholder, LLM doesn't natively return it unless asked
+        return self._agent_response("GeminiBrain", question, full_text, 0.9)
+
     @track(name="gemini_brain.see_and_think")
     def see_and_think(
         self, 
         character: str, 
         image_path: str, 
-        question: str
+        question: str,
+        use_cache: bool = True
     ) -> AgentResponse:
         """
         For agents that need to look at images/documents.
-        Supports Images (via PIL) and PDFs (via PyPDF2 text extraction).
+        Supports Images (via PIL) and PDFs (via PyPDF2 text extraction, see tools.pdf_extract).
         """
         try:
             # Check file extension
             is_pdf = image_path.lower().endswith('.pdf')
-            content_input = []
-            
-            if is_pdf:
-                # Always use PyPDF2 for PDFs as requested
-                print(f"📄 Extracting text from PDF (PyPDF2): {image_path}")
-                import PyPDF2
-                text_content = ""
-                with open(image_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    for page in reader.pages:
-                        extracted = page.extract_text()
-                        if extracted:
-                            text_content += extracted + "\n"
-                
-                # Append extracted text to the question/prompt
-                question = f"{question}\n\nDOCUMENT CONTENT:\n{text_content[:30000]}" # Limit to ~30k chars
-                # content_input remains empty as we put text in prompt
-                
-                # Use standard model for text processing since there's no image
-                model_to_use = self.model 
-            else:
-                # Handle Image with Vision Model
-                img = Image.open(image_path)
-                content_input = [img]
-                model_to_use = self.vision_model
-
-            prompt = f"{character}\n\nQUESTION: {question}\n\nAnalyze this document and think step-by-step."
-            
-            # Call Gemini
-            response = self._generate_with_retry(model_to_use.generate_content, [prompt, *content_input])
-            
-            if not response.parts:
-                 raise ValueError("Gemini returned an empty response.")
-
-            full_text = response.text
-            
-            thinking, final_answer = self._split_response(full_text)
-            
-            return AgentResponse(
-                agent_name="GeminiVisionBrain" if not is_pdf else "GeminiTextBrain",
-                query=question,
-                thinking=thinking,
-                response=final_answer,
-                confidence=0.85,
-                needs_human_review=False,
-                timestamp=datetime.now()
+            file_bytes = self._read_file(image_path)
+
+            def produce() -> str:
+                model_to_use, contents = self._prepare_document(image_path, question, is_pdf)
+                return self._document_text(self._generate(model_to_use, character, contents))
+
+            # Keyed on the raw file, so a cache hit skips extraction entirely
+            full_text = self._cached(
+                "see_and_think",
+                self._text_model() if is_pdf else self.vision_model_name,
+                [character, question, file_bytes],
+                produce,
+                use_cache
             )
-        except Exception as e:
-            return AgentResponse(
-                agent_name="GeminiVisionBrain",
-                query=question,
-                thinking=f"Error processing document: {str(e)}",
-                response=f"I encountered an error while trying to read the document: {str(e)}",
-                confidence=0.0,
-                needs_human_review=True,
-                timestamp=datetime.now()
+            return self._agent_response(
+                "GeminiVisionBrain" if not is_pdf else "GeminiTextBrain", question, full_text, 0.85
             )
+        except Exception as e:
+            return self._document_error(question, e)
 
     @track(name="gemini_brain.discuss")
     def discuss(
         self, 
         character: str, 
-        conversation_history: List[Dict[str, str]], 
-        new_message: str
+        conversation_history: Union[List[Dict[str, str]], ConversationMemory],
+        new_message: str,
+        use_cache: bool = True
     ) -> AgentResponse:
         """
-        For ongoing conversations with context.
+        For ongoing conversations with context. Pass a ConversationMemory to
+        keep long chats at a fixed cost per turn.
         """
-        history_str = ""
-        for msg in conversation_history:
-            role = msg.get("role", "User")
-            content = msg.get("content", "")
-            history_str += f"{role}: {content}\n"
+        prompt = self._discuss_prompt(conversation_history, new_message)
+        model_name = self._text_model()
+        try:
+            full_text = self._cached(
+                "discuss", model_name, [character, prompt],
+                lambda: self._generate(model_name, character, [prompt]).text,
+                use_cache
+            )
+        except BackendUnavailable as e:
+            return self._degraded_response("GeminiChatBrain", new_message, e)
+        return self._agent_response("GeminiChatBrain", new_message, full_text, 0.95)
 
-        prompt = f"""
-{character}
+    @track(name="gemini_brain.think_structured")
+    def think_structured(
+        self,
+        character: str,
+        context: str,
+        question: str,
+        schema: Type[Schema],
+        use_cache: bool = True,
+        prefix: Optional[str] = None
+    ) -> Schema:
+        """
+        think, for calls that need data back: the reply is constrained to
+        `schema` (a pydantic model) and returned validated. Raises
+        StructuredOutputError if it still doesn't fit after one repair, and
+        BackendUnavailable if Gemini can't answer in time.
+        """
+        prompt = self._structured_prompt(context, question, schema)
+        model_name = self._text_model()
+        text = self._cached(
+            "think_structured", model_name, [character, prefix or "", prompt, self._schema_text(schema)],
+            lambda: self._produce_structured(
+                schema, lambda contents, pfx: self._generate(model_name, character, contents, pfx, schema),
+                [prompt], prefix
+            ),
+            use_cache
+        )
+        return self._validated(schema, text)
 
-CONVERSATION HISTORY:
-{history_str}
+    @track(name="gemini_brain.see_structured")
+    def see_structured(
+        self,
+        character: str,
+        image_path: str,
+        question: str,
+        schema: Type[Schema],
+        use_cache: bool = True
+    ) -> Schema:
+        """
+        see_and_think with a schema-constrained reply. Unlike see_and_think,
+        unreadable files and invalid replies raise instead of returning an
+        error response.
+        """
+        is_pdf = image_path.lower().endswith('.pdf')
+        file_bytes = self._read_file(image_path)
+        model_name = self._text_model() if is_pdf else self.vision_model_name
 
-USER MESSAGE:
-{new_message}
+        def produce() -> str:
+            model_to_use, contents = self._prepare_document(
+                image_path, question, is_pdf, instruction=self._json_instruction(schema)
+            )
+            return self._produce_structured(
+                schema, lambda parts, pfx: self._generate(model_to_use, character, parts, pfx, schema),
+                contents, None
+            )
 
-Think step-by-step about the context, then respond.
-"""
-        response = self._generate_with_retry(self.model.generate_content, prompt)
-        full_text = response.text
-        
-        thinking, final_answer = self._split_response(full_text)
+        text = self._cached(
+            "see_structured", model_name, [character, question, self._schema_text(schema), file_bytes],
+            produce, use_cache
+        )
+        return self._validated(schema, text)
 
-        return AgentResponse(
-            agent_name="GeminiChatBrain",
-            query=new_message,
-            thinking=thinking,
-            response=final_answer,
-            confidence=0.95,
-            needs_human_review=False,
-            timestamp=datetime.now()
+    def _tool_turn(self, model_name: str, character: str, turns: List[Dict], declarations: List[Dict]):
+        """One round of a tool conversation, metered and retried like any other call"""
+        with self._measure("tools", model_name, [character, json.dumps(turns, default=str)]):
+            return self._generate_with_retry(
+                self.backend.generate_with_tools, turns,
+                model_name=model_name, system_instruction=character, declarations=declarations
+            )
+
+    @track(name="gemini_brain.think_with_tools")
+    def think_with_tools(
+        self,
+        character: str,
+        context: str,
+        question: str,
+        tools: Any,
+        max_rounds: Optional[int] = None
+    ) -> AgentResponse:
+        """
+        Answer with the model fetching the data it needs through `tools`
+        (.declarations for the model, .execute(name, args) run locally).
+        Each round is one API call; the model's function calls are answered
+        and sent back until it replies in text. Not cached: the data is live.
+        """
+        model_name = self._text_model()
+        max_rounds = max_rounds or Settings.TOOL_MAX_ROUNDS
+        turns: List[Dict] = [{'role': 'user', 'text': self._think_prompt(context, question, "text")}]
+        try:
+            for round_number in range(max_rounds):
+                # Last round offers no tools, so the model answers with what it has
+                declarations = tools.declarations if round_number < max_rounds - 1 else []
+                response = self._tool_turn(model_name, character, turns, declarations)
+                calls = function_calls(response)
+                if not calls:
+                    return self._agent_response("GeminiBrain", question, self._document_text(response), 0.9)
+                turns.append({'role': 'model', 'calls': calls})
+                turns.append({'role': 'tool', 'results': [(call.name, tools.execute(call.name, call.args))
+                                                          for call in calls]})
+        except BackendUnavailable as e:
+            return self._degraded_response("GeminiBrain", question, e)
+        raise ValueError(f"Gemini kept calling tools after {max_rounds} rounds")
+
+    # ============ ASYNC API ============
+
+    @track(name="gemini_brain.athink")
+    async def athink(
+        self, 
+        character: str, 
+        context: str, 
+        question: str, 
+        response_format: str = "text",
+        use_cache: bool = True,
+        prefix: Optional[str] = None
+    ) -> AgentResponse:
+        """
+        Async think: doesn't block the event loop while Gemini works.
+        """
+        prompt = self._think_prompt(context, question, response_format)
+        model_name = self._text_model()
+
+        async def produce() -> str:
+            return (await self._agenerate(model_name, character, [prompt], prefix)).text
+
+        try:
+            full_text = await self._acached("think", model_name, [character, prefix or "", prompt], produce, use_cache)
+        except BackendUnavailable as e:
+            return self._degraded_response("GeminiBrain", question, e)
+        return self._agent_response("GeminiBrain", question, full_text, 0.9)
+
+    @track(name="gemini_brain.asee_and_think")
+    async def asee_and_think(
+        self, 
+        character: str, 
+        image_path: str, 
+        question: str,
+        use_cache: bool = True
+    ) -> AgentResponse:
+        """
+        Async see_and_think. Document reading runs in a worker thread.
+        """
+        try:
+            is_pdf = image_path.lower().endswith('.pdf')
+            file_bytes = await asyncio.to_thread(self._read_file, image_path)
+
+            async def produce() -> str:
+                model_to_use, contents = await asyncio.to_thread(
+                    self._prepare_document, image_path, question, is_pdf
+                )
+                response = await self._agenerate(model_to_use, character, contents)
+                return self._document_text(response)
+
+            full_text = await self._acached(
+                "see_and_think",
+                self._text_model() if is_pdf else self.vision_model_name,
+                [character, question, file_bytes],
+                produce,
+                use_cache
+            )
+            return self._agent_response(
+                "GeminiVisionBrain" if not is_pdf else "GeminiTextBrain", question, full_text, 0.85
+            )
+        except Exception as e:
+            return self._document_error(question, e)
+
+    @track(name="gemini_brain.adiscuss")
+    async def adiscuss(
+        self, 
+        character: str, 
+        conversation_history: Union[List[Dict[str, str]], ConversationMemory],
+        new_message: str,
+        use_cache: bool = True
+    ) -> AgentResponse:
+        """
+        Async discuss.
+        """
+        prompt = self._discuss_prompt(conversation_history, new_message)
+        model_name = self._text_model()
+
+        async def produce() -> str:
+            return (await self._agenerate(model_name, character, [prompt])).text
+
+        try:
+            full_text = await self._acached("discuss", model_name, [character, prompt], produce, use_cache)
+        except BackendUnavailable as e:
+            return self._degraded_response("GeminiChatBrain", new_message, e)
+        return self._agent_response("GeminiChatBrain", new_message, full_text, 0.95)
+
+    @track(name="gemini_brain.athink_structured")
+    async def athink_structured(
+        self,
+        character: str,
+        context: str,
+        question: str,
+        schema: Type[Schema],
+        use_cache: bool = True,
+        prefix: Optional[str] = None
+    ) -> Schema:
+        """
+        Async think_structured.
+        """
+        prompt = self._structured_prompt(context, question, schema)
+        model_name = self._text_model()
+
+        async def produce() -> str:
+            return await self._aproduce_structured(
+                schema, lambda contents, pfx: self._agenerate(model_name, character, contents, pfx, schema),
+                [prompt], prefix
+            )
+
+        text = await self._acached(
+            "think_structured", model_name, [character, prefix or "", prompt, self._schema_text(schema)],
+            produce, use_cache
         )
+        return self._validated(schema, text)
+
+    # ============ STREAMING API ============
+
+    @track(name="gemini_brain.stream_think")
+    def stream_think(
+        self,
+        character: str,
+        context: str,
+        question: str,
+        response_format: str = "text",
+        use_cache: bool = True,
+        prefix: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        think, yielding text as it is generated instead of waiting for all of it.
+        Shares think's cache entries.
+        """
+        prompt = self._think_prompt(context, question, response_format)
+        yield from self._stream("think", self._text_model(), character, prompt, prefix,
+                                [character, prefix or "", prompt], use_cache)
+
+    @track(name="gemini_brain.astream_think")
+    async def astream_think(
+        self,
+        character: str,
+        context: str,
+        question: str,
+        response_format: str = "text",
+        use_cache: bool = True,
+        prefix: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Async stream_think, for sending partial answers to Telegram.
+        """
+        prompt = self._think_prompt(context, question, response_format)
+        async for text in self._astream("think", self._text_model(), character, prompt, prefix,
+                                        [character, prefix or "", prompt], use_cache):
+            yield text
 
     @track(name="gemini_brain.log_feedback")
     def log_feedback(self, feedback_type: str, score: float, comments: str) -> dict:
@@ -216,23 +1107,11 @@ Think step-by-step about the context, then respond.
 
     def extract_json(self, response: str) -> dict:
         """
-        Extracts JSON from response if present. Handles markdown code blocks.
+        Extracts the first JSON object from a free-text response, or {}.
+        Prefer think_structured for new code.
         """
-        try:
-            # Look for markdown code blocks
-            json_match = re.search(r'```json\s*(.*?)\s*```', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            
-            # If no code block, try finding anything that looks like { ... }
-            json_match = re.search(r'({.*})', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            
-            # Fallback to direct parse
-            return json.loads(response)
-        except Exception:
-            return {}
+        parsed = extract_json(response, object_only=True)
+        return parsed if parsed is not None else {}
 
     def _split_response(self, text: str) -> tuple:
         """
@@ -0,0 +1,329 @@
+"""
+LLM Backend - The seam between GeminiBrain and the model provider
+GeminiBrain builds prompts, caches and retries; a backend only turns
+(system instruction, contents) into a response. Long stable prompt prefixes
+can be registered as explicit context caches so repeated calls don't pay to
+reprocess them. Calls that expect JSON can pass a pydantic model as the
+response schema, and tool-using calls can declare functions for the model
+to call.
+"""
+
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from config.settings import Settings
+from tools.rate_limiter import estimate_tokens
+from tools.resilience import call_timeout
+
+# The subset of JSON schema Gemini's response_schema understands
+_SCHEMA_KEYS = ('type', 'format', 'description', 'nullable', 'enum', 'items', 'properties', 'required')
+
+
+def gemini_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    A pydantic model's JSON schema reduced to what Gemini accepts: nested
+    models inlined, Optional as nullable, defaults/titles/bounds dropped.
+    """
+    schema = model.model_json_schema()
+    defs = schema.pop('$defs', {})
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        description = node.get('description')
+        if '$ref' in node:
+            node = defs[node['$ref'].split('/')[-1]]
+        if 'anyOf' in node:
+            options = [o for o in node['anyOf'] if o.get('type') != 'null']
+            out = convert(options[0]) if len(options) == 1 else {'type': 'string'}
+            if len(options) < len(node['anyOf']):
+                out['nullable'] = True
+        else:
+            out = {k: v for k, v in node.items() if k in _SCHEMA_KEYS}
+            if 'properties' in node:
+                out['properties'] = {name: convert(p) for name, p in node['properties'].items()}
+            if 'items' in node:
+                out['items'] = convert(node['items'])
+            if 'enum' in node:
+                out.update(type='string', format='enum')
+        if description:
+            out['description'] = description
+        return out
+
+    return convert(schema)
+
+
+class FunctionCall(NamedTuple):
+    name: str
+    args: Dict[str, Any]
+
+
+def function_calls(response) -> List[FunctionCall]:
+    """Function calls the model asked for in a response (empty if it answered in text)"""
+    calls = []
+    for part in getattr(response, 'parts', None) or []:
+        call = getattr(part, 'function_call', None)
+        # Gemini parts always carry a function_call field; unset ones have no name
+        if call is not None and call.name:
+            calls.append(FunctionCall(call.name, dict(call.args or {})))
+    return calls
+
+
+class LLMBackend(ABC):
+    """
+    Interface every backend implements. Responses expose .text, .parts and
+    (optionally) .usage_metadata like google.generativeai responses do.
+    A response_schema asks for JSON matching that pydantic model; backends
+    that can't enforce it set supports_response_schema = False and the
+    caller describes the schema in the prompt instead.
+
+    Tool conversations are lists of turns:
+        {'role': 'user', 'text': ...}
+        {'role': 'model', 'calls': [FunctionCall, ...]}
+        {'role': 'tool', 'results': [(name, result dict), ...]}
+    """
+
+    supports_response_schema = False
+    supports_tools = False
+
+    @abstractmethod
+    def generate(
+        self,
+        contents: Any,
+        model_name: str,
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None,
+        response_schema: Optional[Type[BaseModel]] = None
+    ):
+        """One response for `contents`"""
+
+    @abstractmethod
+    async def agenerate(
+        self,
+        contents: Any,
+        model_name: str,
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None,
+        response_schema: Optional[Type[BaseModel]] = None
+    ):
+        """Async generate"""
+
+    def generate_with_tools(
+        self,
+        turns: List[Dict],
+        model_name: str,
+        system_instruction: Optional[str] = None,
+        declarations: Optional[List[Dict]] = None
+    ):
+        """Next model turn of a tool conversation: function calls or the final text"""
+        # Callers check supports_tools first; getting here is a wiring mistake
+        raise TypeError(f"{type(self).__name__} does not support function calling (supports_tools is False)")
+
+    def stream(
+        self,
+        contents: Any,
+        model_name: str,
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None
+    ) -> Iterator:
+        """Response chunks as they are generated (default: one chunk)"""
+        yield self.generate(contents, model_name, system_instruction, cached_content)
+
+    async def astream(
+        self,
+        contents: Any,
+        model_name: str,
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None
+    ) -> AsyncIterator:
+        yield await self.agenerate(contents, model_name, system_instruction, cached_content)
+
+    def cache_prefix(self, model_name: str, system_instruction: Optional[str], prefix: str, ttl_seconds: int) -> Optional[str]:
+        """Register a reusable prompt prefix; returns a handle or None if unsupported"""
+        return None
+
+
+class GeminiBackend(LLMBackend):
+    """google.generativeai, with explicit context caching via genai.caching"""
+
+    supports_response_schema = True
+    supports_tools = True
+
+    def __init__(self, api_key: Optional[str] = None):
+        import google.generativeai as genai
+
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment variables")
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self._models: Dict[Tuple, Any] = {}
+
+    def _model(self, model_name: str, system_instruction: Optional[str], cached_content: Optional[str]):
+        key = (model_name, system_instruction, cached_content)
+        model = self._models.get(key)
+        if model is None:
+            if cached_content:
+                # The cache already carries the model and system instruction
+                model = self.genai.GenerativeModel.from_cached_content(cached_content)
+            else:
+                model = self.genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            self._models[key] = model
+        return model
+
+    @staticmethod
+    def _generation_config(response_schema: Optional[Type[BaseModel]]) -> Optional[Dict[str, Any]]:
+        if response_schema is None:
+            return None
+        return {'response_mime_type': 'application/json', 'response_schema': gemini_schema(response_schema)}
+
+    @staticmethod
+    def _request_options() -> Dict[str, float]:
+        # So an abandoned call stops at the caller's deadline instead of hanging on
+        return {'timeout': call_timeout()}
+
+    def generate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        return self._model(model_name, system_instruction, cached_content).generate_content(
+            contents, generation_config=self._generation_config(response_schema),
+            request_options=self._request_options()
+        )
+
+    async def agenerate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        return await self._model(model_name, system_instruction, cached_content).generate_content_async(
+            contents, generation_config=self._generation_config(response_schema),
+            request_options=self._request_options()
+        )
+
+    def _tool_contents(self, turns: List[Dict]) -> List[Dict]:
+        protos = self.genai.protos
+        contents = []
+        for turn in turns:
+            if turn['role'] == 'user':
+                contents.append({'role': 'user', 'parts': [turn['text']]})
+            elif turn['role'] == 'model':
+                contents.append({'role': 'model', 'parts': [
+                    protos.Part(function_call=protos.FunctionCall(name=call.name, args=call.args))
+                    for call in turn['calls']
+                ]})
+            else:
+                # Function results go back in a user turn
+                contents.append({'role': 'user', 'parts': [
+                    protos.Part(function_response=protos.FunctionResponse(name=name, response=result))
+                    for name, result in turn['results']
+                ]})
+        return contents
+
+    def generate_with_tools(self, turns, model_name, system_instruction=None, declarations=None):
+        return self._model(model_name, system_instruction, None).generate_content(
+            self._tool_contents(turns),
+            tools=[{'function_declarations': declarations}] if declarations else None,
+            request_options=self._request_options()
+        )
+
+    def stream(self, contents, model_name, system_instruction=None, cached_content=None):
+        yield from self._model(model_name, system_instruction, cached_content).generate_content(
+            contents, stream=True, request_options=self._request_options()
+        )
+
+    async def astream(self, contents, model_name, system_instruction=None, cached_content=None):
+        response = await self._model(model_name, system_instruction, cached_content).generate_content_async(
+            contents, stream=True, request_options=self._request_options()
+        )
+        async for chunk in response:
+            yield chunk
+
+    def cache_prefix(self, model_name, system_instruction, prefix, ttl_seconds):
+        cached = self.genai.caching.CachedContent.create(
+            model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+            system_instruction=system_instruction,
+            contents=[prefix],
+            ttl=timedelta(seconds=ttl_seconds)
+        )
+        return cached.name
+
+
+class ContextCacheRegistry:
+    """
+    Remembers which (model, system instruction, prefix) combinations already
+    have a context cache, so every call sharing a prefix reuses one handle.
+    Prefixes the backend refuses (e.g. below the provider's minimum size)
+    are remembered too and sent inline until the entry expires.
+    """
+
+    def __init__(self, ttl_seconds: int = 600, min_tokens: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.counters = {'created': 0, 'reused': 0, 'refused': 0}
+
+    @staticmethod
+    def make_key(model_name: str, system_instruction: Optional[str], prefix: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model_name, system_instruction or "", prefix):
+            data = part.encode('utf-8')
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def handle(self, backend: LLMBackend, model_name: str, system_instruction: Optional[str], prefix: str) -> Optional[str]:
+        """Cache handle for this prefix, creating it on first use"""
+        if estimate_tokens([system_instruction or "", prefix]) < self.min_tokens:
+            return None
+        key = self.make_key(model_name, system_instruction, prefix)
+        # Held while creating, so concurrent briefing steps share one cache
+        with self._lock:
+            entry = self._entries.get(key)
+            # Leave a margin so a handle doesn't expire mid-request
+            if entry is not None and entry['expires_at'] - 30 > time.time():
+                if entry['name']:
+                    self.counters['reused'] += 1
+                return entry['name']
+
+            try:
+                name = backend.cache_prefix(model_name, system_instruction, prefix, self.ttl_seconds)
+            except Exception as e:
+                print(f"⚠️ Context cache not created, sending prefix inline: {e}")
+                name = None
+            self.counters['created' if name else 'refused'] += 1
+            self._entries[key] = {'name': name, 'expires_at': time.time() + self.ttl_seconds}
+            return name
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+
+_shared_backend: Optional[LLMBackend] = None
+
+
+def get_shared_backend() -> LLMBackend:
+    """Process-wide backend chosen by LLM_BACKEND (gemini, record, replay or fake)"""
+    global _shared_backend
+    if _shared_backend is None:
+        mode = Settings.LLM_BACKEND.lower()
+        if mode == "gemini":
+            _shared_backend = GeminiBackend()
+        else:
+            from tools.offline_backend import make_offline_backend
+            _shared_backend = make_offline_backend(mode)
+    return _shared_backend
+
+
+_shared_registry: Optional[ContextCacheRegistry] = None
+
+
+def get_shared_context_caches() -> ContextCacheRegistry:
+    """Process-wide registry shared by every GeminiBrain"""
+    global _shared_registry
+    if _shared_registry is None:
+        _shared_registry = ContextCacheRegistry(
+            ttl_seconds=Settings.CONTEXT_CACHE_TTL_SECONDS,
+            min_tokens=Settings.CONTEXT_CACHE_MIN_TOKENS
+        )
+    return _shared_registry
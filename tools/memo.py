@@ -0,0 +1,71 @@
+"""
+Memo - Agent-level memoization keyed by the ledger data each method reads
+An agent method declares the store collections it depends on; its result is
+reused until a write bumps one of those collections' version counters (or
+the day changes, since every analysis is relative to today). Results
+built from a stale answer or an apology while Gemini was down aren't kept,
+so the next call tries again.
+
+    @memoize(*LEDGER_READS)
+    def analyze_collections(self): ...
+"""
+
+import functools
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict
+
+from config.settings import Settings
+from tools.resilience import watch_degraded
+
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'not_kept': 0}
+
+
+def _degraded(result) -> bool:
+    # The apology AgentResponse GeminiBrain returns when it can't answer
+    return bool(getattr(result, 'needs_human_review', False)) and getattr(result, 'confidence', None) == 0
+
+
+def memoize(*reads: str):
+    """
+    Cache a method of an object with a `data_store` under the versions of
+    the `reads` collections and its (hashable) arguments.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not Settings.AGENT_MEMO_ENABLED:
+                return func(self, *args, **kwargs)
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())),
+                   self.data_store.version(*reads), date.today())
+            with _lock:
+                memo = self.__dict__.setdefault('_memo', OrderedDict())
+                if key in memo:
+                    memo.move_to_end(key)
+                    _counters['hits'] += 1
+                    return memo[key]
+                _counters['misses'] += 1
+
+            with watch_degraded() as seen:
+                result = func(self, *args, **kwargs)
+            if seen['degraded'] or _degraded(result):
+                with _lock:
+                    _counters['not_kept'] += 1
+                return result
+            with _lock:
+                memo[key] = result
+                # Entries for old versions are never asked for again; let them age out
+                while len(memo) > Settings.AGENT_MEMO_MAX_ENTRIES:
+                    memo.popitem(last=False)
+            return result
+
+        wrapper.reads = reads
+        return wrapper
+    return decorator
+
+
+def memo_stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,86 @@
+"""
+Model Router - Picks the Gemini model for each call site
+Call sites (the tracked agent methods, e.g. "priya.understand_message") map
+to a tier; tiers map to model names. Classification-style calls go to the
+lite tier, the CFO's own reasoning to the heavy tier, everything else to
+standard. Any call site can be pointed at a tier or a model name with the
+MODEL_ROUTES setting.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from config.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = "standard"
+
+DEFAULT_ROUTES = {
+    # Intent / lookup / matching: short answers, cheapest model
+    "priya.understand_message": "lite",
+    "meera.match_vendor": "lite",
+    "memory.summarize": "lite",
+    # Rajesh's synthesis and judgement calls
+    "rajesh.daily_briefing": "heavy",
+    "rajesh.handle_unusual": "heavy",
+}
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """'site=tier,site=model-name' -> {site: tier or model}"""
+    routes = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        site, target = item.split("=", 1)
+        if site.strip() and target.strip():
+            routes[site.strip()] = target.strip()
+    return routes
+
+
+class ModelRouter:
+    """
+    router.model_for("priya.understand_message") -> "gemini-flash-lite-latest"
+    """
+
+    def __init__(self, tiers: Dict[str, str], routes: Optional[Dict[str, str]] = None):
+        self.tiers = dict(tiers)
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        self._logged: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, call_site: str) -> Tuple[str, str]:
+        """(tier, model name) for a call site. A route naming a model, not a tier, is used as-is."""
+        target = self.routes.get(call_site, DEFAULT_TIER)
+        if target in self.tiers:
+            return target, self.tiers[target]
+        return "custom", target
+
+    def model_for(self, call_site: str) -> str:
+        tier, model_name = self.resolve(call_site)
+        with self._lock:
+            # Log each decision once, and again if the route changes
+            if self._logged.get(call_site) != model_name:
+                self._logged[call_site] = model_name
+                logger.info(f"Model route: {call_site} -> {tier} ({model_name})")
+        return model_name
+
+
+_shared_router: Optional[ModelRouter] = None
+
+
+def get_shared_router() -> ModelRouter:
+    """Process-wide router built from Settings"""
+    global _shared_router
+    if _shared_router is None:
+        _shared_router = ModelRouter(
+            tiers={
+                "lite": Settings.MODEL_TIER_LITE,
+                "standard": Settings.MODEL_NAME,
+                "heavy": Settings.MODEL_TIER_HEAVY,
+            },
+            routes=parse_routes(Settings.MODEL_ROUTES)
+        )
+    return _shared_router
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 class BankAccount(BaseModel):
@@ -93,3 +93,85 @@ class FinancialGoal(BaseModel):
     deadline: Optional[datetime] = None
     status: str = "In Progress"  # In Progress, Achieved, Failed
     strategy: str  # Description of how to achieve it
+
+class LLMCallRecord(BaseModel):
+    run_id: str
+    call_site: str  # e.g. "arjun.recommend_payments"
+    call_type: str  # think, see_and_think, discuss
+    model_name: str
+    prompt_bytes: int
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None  # prompt tokens served from a context cache
+    latency_ms: float
+    first_chunk_ms: Optional[float] = None  # streaming calls: time to first text
+    retries: int = 0
+    cache_hit: bool = False
+    coalesced: bool = False  # answered by an identical request already in flight
+    error: Optional[str] = None
+    timestamp: datetime
+
+# ============ STRUCTURED REPLIES ============
+# Schemas for GeminiBrain.think_structured. Field descriptions are sent to the
+# model as part of the response schema, so they double as instructions.
+
+class MessageUnderstanding(BaseModel):
+    intent: Literal["approval", "rejection", "question", "instruction", "acknowledgment"]
+    is_decision: bool = Field(description="True if the human is approving or rejecting something we asked about")
+    explanation: str = Field(description="What you understood")
+    reply_suggestion: str = Field(description="How we should reply")
+
+class ChatNotes(BaseModel):
+    notes: str = Field(description="The updated running notes, every decision and open question kept")
+
+class HumanResponseUnderstanding(BaseModel):
+    understanding: str = Field(description="What the human approved, rejected, changed or asked")
+    actions_to_take: List[str] = Field(description="Actions we should take now")
+    reply_to_user: str = Field(description="The exact message to send back to the human")
+    needs_clarification: bool = Field(description="True if the response is unclear and we must ask again")
+
+class VendorMatch(BaseModel):
+    matched_vendor: Optional[str] = Field(None, description="vendor_id of the matching known vendor, null if none")
+    confidence: float = Field(description="0.0 to 1.0")
+    notes: str
+
+class ExtractedFields(BaseModel):
+    date: Optional[str] = Field(None, description="Document date, YYYY-MM-DD")
+    due_date: Optional[str] = Field(None, description="YYYY-MM-DD")
+    vendor_name: Optional[str] = None
+    client_name: Optional[str] = None
+    bank_name: Optional[str] = None
+    invoice_number: Optional[str] = None
+    po_number: Optional[str] = None
+    base_amount: Optional[float] = None
+    tax_amount: Optional[float] = None
+    total_amount: Optional[float] = None
+    line_items: List[str] = Field(default_factory=list, description="Short summary of each item bought or sold")
+
+class DocumentAnalysis(BaseModel):
+    document_type: str = Field(description="invoice, receipt, bank_statement, cheque, etc.")
+    readable: bool
+    extracted_data: ExtractedFields
+    validation_notes: str = Field(description="Do base + tax = total, are the dates valid, any warning flags")
+    confidence_score: float = Field(description="0.0 to 1.0")
+
+class PaymentDecision(BaseModel):
+    invoice_id: str
+    vendor_name: str
+    amount: float
+    decision: Literal["pay_now", "hold", "negotiate"]
+    reason: str
+
+class ActionItem(BaseModel):
+    decision: str = Field(description="What the human has to decide")
+    recommendation: str = Field(description="What Rajesh recommends and why, in one line")
+    how_to_reply: str = Field(description="The one-word reply that approves it, e.g. YES GST")
+
+class DailyBriefing(BaseModel):
+    cash_assessment: str = Field(description="Available cash vs near-term obligations: comfortable, tight or critical, and why")
+    payment_plan: List[PaymentDecision] = Field(description="Every open bill worth deciding on today")
+    cash_after_payments: float = Field(description="Bank balance left if every pay_now bill is paid")
+    collections: str = Field(description="What is overdue, who to chase and how")
+    goals: str = Field(description="Progress on each financial goal and what to do this week")
+    action_items: List[ActionItem]
+    phone_text: str = Field(description="The whole briefing for a phone: most important first, emojis, under 3000 characters, ending with how to reply")
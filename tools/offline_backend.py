@@ -0,0 +1,372 @@
+"""
+Offline Backend - Record, replay and fake LLM backends
+Selected with LLM_BACKEND:
+- record: call Gemini and append every response to a cassette (JSON lines)
+- replay: answer from the cassette with the recorded (or scaled) latency, no network
+- fake:   invent schema-valid answers instantly, for running the pipeline with no cassette
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Literal, Optional, Type, get_args, get_origin
+
+from pydantic import BaseModel
+
+from config.settings import Settings
+from tools.llm_backend import LLMBackend, GeminiBackend, FunctionCall, function_calls
+from tools.rate_limiter import estimate_tokens
+
+# Pieces a replayed or fake answer is split into when streamed
+STREAM_CHUNKS = 8
+
+
+class CassetteMiss(KeyError):
+    """Replay was asked for a request that was never recorded"""
+
+
+class CannedResponse:
+    """Looks enough like a google.generativeai response for GeminiBrain"""
+
+    def __init__(self, text: Optional[str], usage: Optional[Dict[str, Optional[int]]] = None,
+                 calls: Optional[List[FunctionCall]] = None):
+        self.text = text or ""
+        self.parts = [text] if text else []
+        self.parts += [SimpleNamespace(function_call=SimpleNamespace(name=c.name, args=c.args)) for c in calls or []]
+        self.usage_metadata = SimpleNamespace(**(usage or {}))
+
+
+def _part_bytes(part: Any) -> bytes:
+    if isinstance(part, bytes):
+        return part
+    if isinstance(part, str):
+        return part.encode('utf-8')
+    if hasattr(part, 'tobytes'):
+        # PIL images
+        return part.tobytes()
+    return repr(part).encode('utf-8')
+
+
+def _digest(*parts: Any) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        data = _part_bytes(part)
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _usage(response) -> Dict[str, Optional[int]]:
+    usage = getattr(response, 'usage_metadata', None)
+    fields = ('prompt_token_count', 'candidates_token_count', 'cached_content_token_count', 'total_token_count')
+    return {name: value for name in fields if isinstance(value := getattr(usage, name, None), int)}
+
+
+def _text(response) -> Optional[str]:
+    try:
+        return response.text
+    except ValueError:
+        # Blocked or empty responses have no text
+        return None
+
+
+def _tool_contents(turns: List[Dict]) -> List[str]:
+    """A tool conversation as cassette key parts"""
+    return ["tools", json.dumps(turns, ensure_ascii=False, sort_keys=True, default=str)]
+
+
+def _tool_instruction(system_instruction: Optional[str], declarations: Optional[List[Dict]]) -> str:
+    # Keeps tool turns from loosely matching plain calls with the same instruction
+    names = ",".join(d['name'] for d in declarations or [])
+    return f"{system_instruction or ''}\n#tools:{names}"
+
+
+def _split(text: str, pieces: int = STREAM_CHUNKS) -> List[str]:
+    size = max(len(text) // pieces, 1)
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class _Cassette(LLMBackend):
+    """
+    Shared request keys for recording and replay. Context cache handles
+    differ from run to run, so requests are keyed on the cached prefix itself.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._prefixes: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _keys(self, contents, model_name, system_instruction, cached_content, response_schema):
+        """(exact key, loose key). Loose ignores the prompt, for data that drifts (e.g. today's date)."""
+        parts = contents if isinstance(contents, list) else [contents]
+        prefix = self._prefixes.get(cached_content, cached_content or "")
+        schema = response_schema.__name__ if response_schema else ""
+        loose = _digest(model_name, system_instruction or "", schema)
+        return _digest(loose, prefix, *parts), loose
+
+
+class RecordingBackend(_Cassette):
+    """Passes calls to a real backend and appends each response to the cassette"""
+
+    def __init__(self, inner: LLMBackend, path: str):
+        super().__init__(path)
+        self.inner = inner
+        self.supports_response_schema = inner.supports_response_schema
+        self.supports_tools = inner.supports_tools
+
+    def _record(self, keys, model_name, response_schema, contents, text, usage, latency_ms, calls=None):
+        exact, loose = keys
+        entry = {
+            'key': exact, 'loose_key': loose, 'model_name': model_name,
+            'schema': response_schema.__name__ if response_schema else None,
+            'prompt_preview': str(contents[-1] if isinstance(contents, list) and contents else contents)[:200],
+            'response': text, 'usage': usage, 'latency_ms': round(latency_ms, 1),
+            'recorded_at': datetime.now().isoformat(),
+        }
+        if calls:
+            entry['calls'] = [call._asdict() for call in calls]
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _call_kwargs(self, response_schema):
+        # Only pass response_schema to backends that asked for one
+        return {'response_schema': response_schema} if response_schema is not None else {}
+
+    def generate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        keys = self._keys(contents, model_name, system_instruction, cached_content, response_schema)
+        started = time.perf_counter()
+        response = self.inner.generate(contents, model_name, system_instruction, cached_content,
+                                       **self._call_kwargs(response_schema))
+        self._record(keys, model_name, response_schema, contents, _text(response), _usage(response),
+                     (time.perf_counter() - started) * 1000)
+        return response
+
+    async def agenerate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        keys = self._keys(contents, model_name, system_instruction, cached_content, response_schema)
+        started = time.perf_counter()
+        response = await self.inner.agenerate(contents, model_name, system_instruction, cached_content,
+                                              **self._call_kwargs(response_schema))
+        self._record(keys, model_name, response_schema, contents, _text(response), _usage(response),
+                     (time.perf_counter() - started) * 1000)
+        return response
+
+    def generate_with_tools(self, turns, model_name, system_instruction=None, declarations=None):
+        contents = _tool_contents(turns)
+        keys = self._keys(contents, model_name, _tool_instruction(system_instruction, declarations), None, None)
+        started = time.perf_counter()
+        response = self.inner.generate_with_tools(turns, model_name, system_instruction, declarations)
+        calls = function_calls(response)
+        self._record(keys, model_name, None, contents, None if calls else _text(response), _usage(response),
+                     (time.perf_counter() - started) * 1000, calls)
+        return response
+
+    def stream(self, contents, model_name, system_instruction=None, cached_content=None):
+        keys = self._keys(contents, model_name, system_instruction, cached_content, None)
+        started = time.perf_counter()
+        texts, last = [], None
+        for chunk in self.inner.stream(contents, model_name, system_instruction, cached_content):
+            last = chunk
+            texts.append(_text(chunk) or "")
+            yield chunk
+        self._record(keys, model_name, None, contents, "".join(texts), _usage(last),
+                     (time.perf_counter() - started) * 1000)
+
+    async def astream(self, contents, model_name, system_instruction=None, cached_content=None):
+        keys = self._keys(contents, model_name, system_instruction, cached_content, None)
+        started = time.perf_counter()
+        texts, last = [], None
+        async for chunk in self.inner.astream(contents, model_name, system_instruction, cached_content):
+            last = chunk
+            texts.append(_text(chunk) or "")
+            yield chunk
+        self._record(keys, model_name, None, contents, "".join(texts), _usage(last),
+                     (time.perf_counter() - started) * 1000)
+
+    def cache_prefix(self, model_name, system_instruction, prefix, ttl_seconds):
+        handle = self.inner.cache_prefix(model_name, system_instruction, prefix, ttl_seconds)
+        if handle:
+            with self._lock:
+                self._prefixes[handle] = _digest(prefix)
+        return handle
+
+
+class ReplayBackend(_Cassette):
+    """
+    Answers from a cassette. Exact matches first; unless `strict`, a request
+    whose prompt drifted (dates, balances) gets the next unused recording
+    with the same model, system instruction and schema.
+    """
+
+    supports_response_schema = True
+    supports_tools = True
+
+    def __init__(self, path: str, latency_scale: float = 1.0, strict: bool = False):
+        super().__init__(path)
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._exact: Dict[str, Dict] = {}
+        self._loose: Dict[str, List[Dict]] = {}
+        self.counters = {'exact': 0, 'loose': 0, 'misses': 0}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            raise FileNotFoundError(f"No cassette at {self.path}; record one with LLM_BACKEND=record")
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                # Later recordings of the same request win
+                self._exact[entry['key']] = entry
+                self._loose.setdefault(entry['loose_key'], []).append(entry)
+
+    def _lookup(self, keys) -> Dict:
+        exact, loose = keys
+        with self._lock:
+            entry = self._exact.get(exact)
+            if entry is not None:
+                self.counters['exact'] += 1
+                return entry
+            candidates = self._loose.get(loose)
+            if not self.strict and candidates:
+                self.counters['loose'] += 1
+                # Rotate so repeated drifted calls walk through the recordings in order
+                entry = candidates.pop(0)
+                candidates.append(entry)
+                return entry
+            self.counters['misses'] += 1
+        raise CassetteMiss(f"No recording for this request in {self.path}")
+
+    def _delay(self, entry: Dict) -> float:
+        return entry.get('latency_ms', 0) / 1000 * self.latency_scale
+
+    def generate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        entry = self._lookup(self._keys(contents, model_name, system_instruction, cached_content, response_schema))
+        time.sleep(self._delay(entry))
+        return CannedResponse(entry['response'], entry.get('usage'))
+
+    async def agenerate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        entry = self._lookup(self._keys(contents, model_name, system_instruction, cached_content, response_schema))
+        await asyncio.sleep(self._delay(entry))
+        return CannedResponse(entry['response'], entry.get('usage'))
+
+    def generate_with_tools(self, turns, model_name, system_instruction=None, declarations=None):
+        entry = self._lookup(self._keys(_tool_contents(turns), model_name,
+                                        _tool_instruction(system_instruction, declarations), None, None))
+        time.sleep(self._delay(entry))
+        calls = [FunctionCall(call['name'], call['args']) for call in entry.get('calls', [])]
+        return CannedResponse(entry['response'], entry.get('usage'), calls)
+
+    def stream(self, contents, model_name, system_instruction=None, cached_content=None):
+        entry = self._lookup(self._keys(contents, model_name, system_instruction, cached_content, None))
+        pieces = _split(entry['response'] or "")
+        for i, piece in enumerate(pieces):
+            time.sleep(self._delay(entry) / len(pieces))
+            yield CannedResponse(piece, entry.get('usage') if i == len(pieces) - 1 else None)
+
+    async def astream(self, contents, model_name, system_instruction=None, cached_content=None):
+        entry = self._lookup(self._keys(contents, model_name, system_instruction, cached_content, None))
+        pieces = _split(entry['response'] or "")
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(self._delay(entry) / len(pieces))
+            yield CannedResponse(piece, entry.get('usage') if i == len(pieces) - 1 else None)
+
+    def cache_prefix(self, model_name, system_instruction, prefix, ttl_seconds):
+        digest = _digest(prefix)
+        handle = f"replay/{digest[:16]}"
+        with self._lock:
+            self._prefixes[handle] = digest
+        return handle
+
+
+def fake_instance(schema: Type[BaseModel]) -> BaseModel:
+    """A valid instance of `schema` with placeholder values"""
+    def value(name: str, annotation: Any) -> Any:
+        origin, args = get_origin(annotation), get_args(annotation)
+        if origin is not None and type(None) in args:
+            return None
+        if origin in (list, List):
+            return []
+        if origin is Literal:
+            return args[0]
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return fake_instance(annotation)
+        if annotation is bool:
+            return False
+        if annotation in (int, float):
+            return 0
+        if origin in (dict, Dict):
+            return {}
+        return f"fake {name}"
+
+    return schema(**{name: value(name, field.annotation) for name, field in schema.model_fields.items()})
+
+
+class FakeBackend(LLMBackend):
+    """Deterministic made-up answers, schema-valid when a schema is given"""
+
+    supports_response_schema = True
+    supports_tools = True
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+
+    def _respond(self, contents, model_name, response_schema) -> CannedResponse:
+        if response_schema is not None:
+            text = fake_instance(response_schema).model_dump_json()
+        else:
+            # Echo the prompt, so the answer carries the request's data downstream
+            prompt = " ".join(str(contents[-1] if isinstance(contents, list) and contents else contents).split())
+            text = f"Thinking (fake {model_name})...\n\nFake answer: {prompt[:600]}"
+        prompt_tokens = estimate_tokens(contents)
+        completion_tokens = max(len(text) // 4, 1)
+        return CannedResponse(text, {
+            'prompt_token_count': prompt_tokens, 'candidates_token_count': completion_tokens,
+            'total_token_count': prompt_tokens + completion_tokens,
+        })
+
+    def generate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        time.sleep(self.latency_ms / 1000)
+        return self._respond(contents, model_name, response_schema)
+
+    async def agenerate(self, contents, model_name, system_instruction=None, cached_content=None, response_schema=None):
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._respond(contents, model_name, response_schema)
+
+    def generate_with_tools(self, turns, model_name, system_instruction=None, declarations=None):
+        """Calls the first tool that needs no arguments once, then answers from its result"""
+        time.sleep(self.latency_ms / 1000)
+        callable_now = [d for d in declarations or [] if not d.get('parameters', {}).get('required')]
+        if turns[-1]['role'] == 'user' and callable_now:
+            return CannedResponse(None, calls=[FunctionCall(callable_now[0]['name'], {})])
+        return self._respond([json.dumps(turns[-1], ensure_ascii=False, default=str)], model_name, None)
+
+    def stream(self, contents, model_name, system_instruction=None, cached_content=None) -> Iterator:
+        response = self.generate(contents, model_name, system_instruction, cached_content)
+        for piece in _split(response.text):
+            yield CannedResponse(piece)
+
+    async def astream(self, contents, model_name, system_instruction=None, cached_content=None):
+        response = await self.agenerate(contents, model_name, system_instruction, cached_content)
+        for piece in _split(response.text):
+            yield CannedResponse(piece)
+
+
+def make_offline_backend(mode: str) -> LLMBackend:
+    """Backend for LLM_BACKEND=record/replay/fake"""
+    if mode == "record":
+        return RecordingBackend(GeminiBackend(), Settings.LLM_CASSETTE)
+    if mode == "replay":
+        return ReplayBackend(Settings.LLM_CASSETTE, Settings.LLM_REPLAY_LATENCY_SCALE, Settings.LLM_REPLAY_STRICT)
+    if mode == "fake":
+        return FakeBackend(Settings.LLM_FAKE_LATENCY_MS)
+    raise ValueError(f"Unknown LLM_BACKEND '{mode}' (expected gemini, record, replay or fake)")
@@ -0,0 +1,174 @@
+"""
+PDF Extract - Page text for the model, read only as far as the budget needs
+Pages are parsed one at a time from a memory-mapped file and reading stops
+as soon as the character budget is met, so a 300-page statement costs what
+its first few pages cost. Long documents are read a wave of page ranges at a
+time across a process pool, in order, and every page's text is kept in a
+small LRU so re-reading a document (a retry, a second question) is free.
+"""
+
+import mmap
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from multiprocessing import get_context
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import PyPDF2
+
+from config.settings import Settings
+
+# (absolute path, size, mtime) - a rewritten file gets a new key
+FileKey = Tuple[str, int, int]
+
+
+class PdfText(NamedTuple):
+    text: str
+    pages_read: int
+    page_count: int
+    truncated: bool
+
+
+# ============ PAGE CACHE ============
+
+_cache_lock = threading.Lock()
+_page_cache: "OrderedDict[Tuple[FileKey, int], str]" = OrderedDict()
+_counters = {'pages_parsed': 0, 'cache_hits': 0}
+
+
+def _file_key(path: str) -> FileKey:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _cached(key: FileKey, index: int) -> Optional[str]:
+    with _cache_lock:
+        text = _page_cache.get((key, index))
+        if text is not None:
+            _page_cache.move_to_end((key, index))
+            _counters['cache_hits'] += 1
+        return text
+
+
+def _remember(key: FileKey, index: int, text: str):
+    with _cache_lock:
+        _page_cache[(key, index)] = text
+        while len(_page_cache) > Settings.PDF_PAGE_CACHE_ENTRIES:
+            _page_cache.popitem(last=False)
+
+
+def pdf_stats() -> dict:
+    with _cache_lock:
+        return dict(_counters, cached_pages=len(_page_cache))
+
+
+# ============ READING ============
+
+@contextmanager
+def _mapped_reader(path: str):
+    # The OS pages the file in as PyPDF2 seeks; nothing is read up front
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield PyPDF2.PdfReader(mapped)
+
+
+def _page_text(page) -> str:
+    return page.extract_text() or ""
+
+
+def _extract_pages(path: str, start: int, stop: int) -> List[str]:
+    """Worker: text of pages [start, stop). Top level so the pool can pickle it."""
+    with _mapped_reader(path) as reader:
+        return [_page_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def _local_pages(reader, key: FileKey, page_count: int) -> Iterator[str]:
+    for index in range(page_count):
+        text = _cached(key, index)
+        if text is None:
+            text = _page_text(reader.pages[index])
+            _remember(key, index, text)
+            with _cache_lock:
+                _counters['pages_parsed'] += 1
+        yield text
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_shared_pdf_pool() -> ProcessPoolExecutor:
+    """Process-wide pool for page extraction (spawned, so the bot's threads aren't forked)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=Settings.PDF_WORKERS, mp_context=get_context("spawn"))
+        return _pool
+
+
+def _parallel_pages(path: str, key: FileKey, page_count: int) -> Iterator[str]:
+    """
+    Pages in order, extracted PDF_PAGES_PER_TASK at a time in the pool. Only
+    one wave (two ranges per worker) is in flight ahead of the reader, and
+    whatever is still queued is cancelled once the caller stops reading.
+    """
+    size = Settings.PDF_PAGES_PER_TASK
+    starts = iter(range(0, page_count, size))
+    in_flight: deque = deque()
+
+    def submit():
+        start = next(starts, None)
+        if start is None:
+            return
+        stop = min(start + size, page_count)
+        with _cache_lock:
+            whole = all((key, i) in _page_cache for i in range(start, stop))
+        if whole:
+            future = Future()
+            future.set_result([_cached(key, i) for i in range(start, stop)])
+        else:
+            future = get_shared_pdf_pool().submit(_extract_pages, path, start, stop)
+        in_flight.append((start, future, not whole))
+
+    for _ in range(Settings.PDF_WORKERS * 2):
+        submit()
+    try:
+        while in_flight:
+            start, future, parsed = in_flight.popleft()
+            texts = future.result()
+            submit()
+            if parsed:
+                for offset, text in enumerate(texts):
+                    _remember(key, start + offset, text)
+                with _cache_lock:
+                    _counters['pages_parsed'] += len(texts)
+            yield from texts
+    finally:
+        for _, future, _ in in_flight:
+            future.cancel()
+
+
+def extract_text(path: str, max_chars: Optional[int] = None) -> PdfText:
+    """Text of the PDF's pages in order, up to `max_chars` (default PDF_MAX_CHARS)"""
+    max_chars = max_chars or Settings.PDF_MAX_CHARS
+    key = _file_key(path)
+    parts: List[str] = []
+    length = pages_read = 0
+    with _mapped_reader(path) as reader:
+        page_count = len(reader.pages)
+        if Settings.PDF_WORKERS > 1 and page_count >= Settings.PDF_PARALLEL_MIN_PAGES:
+            pages = _parallel_pages(path, key, page_count)
+        else:
+            pages = _local_pages(reader, key, page_count)
+        with closing(pages):
+            for text in pages:
+                pages_read += 1
+                if text:
+                    parts.append(text)
+                    length += len(text) + 1
+                if length >= max_chars:
+                    break
+
+    text = "\n".join(parts)
+    return PdfText(text[:max_chars], pages_read, page_count, len(text) > max_chars or pages_read < page_count)
@@ -0,0 +1,126 @@
+"""
+Progressive Message - A Telegram message that fills in as text streams in
+Sends a placeholder straight away, then edits it as chunks arrive, no more
+often than Telegram's edit limits allow. Text beyond one message's limit
+goes out as follow-up messages when the stream finishes.
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Callable, List, Optional
+
+from telegram.error import BadRequest, RetryAfter
+
+from config.settings import Settings
+
+# Telegram's per-message text limit
+MAX_MESSAGE_LENGTH = 4096
+CURSOR = " ▌"
+# Shown in place of the rest of a stream that broke off
+STREAM_FAILED = "⚠️ The rest of this message could not be generated. Please ask again in a moment."
+
+
+def _seconds(value) -> float:
+    # RetryAfter.retry_after is an int or a timedelta depending on the PTB version
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split on paragraph/line boundaries where possible"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut].rstrip())
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+class ProgressiveMessage:
+    """
+    progress = ProgressiveMessage(bot, chat_id)
+    await progress.start("Thinking...")
+    text = await progress.stream(brain.astream_think(...))
+    """
+
+    def __init__(
+        self,
+        bot,
+        chat_id: int,
+        min_interval: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = Settings.TELEGRAM_EDIT_INTERVAL if min_interval is None else min_interval
+        self.clock = clock
+        self.message_id: Optional[int] = None
+        self.shown = ""
+        self._last_edit = float("-inf")
+        self.edits = 0
+
+    async def start(self, placeholder: str = "…"):
+        message = await self.bot.send_message(chat_id=self.chat_id, text=placeholder)
+        self.message_id = message.message_id
+        self.shown = placeholder
+        self._last_edit = self.clock()
+
+    async def update(self, text: str):
+        """Show partial text if the edit interval has passed"""
+        if self.clock() - self._last_edit < self.min_interval:
+            return
+        preview = split_message(text)[0]
+        if len(preview) + len(CURSOR) <= MAX_MESSAGE_LENGTH:
+            preview += CURSOR
+        await self._edit(preview, wait_if_limited=False)
+
+    async def finish(self, text: str):
+        """Show the complete text, spilling into extra messages if needed"""
+        if not text.strip():
+            text = "…"
+        first, *rest = split_message(text)
+        if self.message_id is None:
+            await self.start(first)
+        else:
+            await self._edit(first, wait_if_limited=True)
+        for chunk in rest:
+            await self.bot.send_message(chat_id=self.chat_id, text=chunk)
+
+    async def stream(self, chunks: AsyncIterator[str]) -> str:
+        """Consume a stream of text deltas, editing as it grows. Returns the full text."""
+        if self.message_id is None:
+            await self.start()
+        text = ""
+        try:
+            async for delta in chunks:
+                text += delta
+                await self.update(text)
+        except Exception:
+            # Don't leave a half-written message with the cursor still on it
+            await self.finish(f"{text}\n\n{STREAM_FAILED}" if text.strip() else STREAM_FAILED)
+            raise
+        await self.finish(text)
+        return text
+
+    async def _edit(self, text: str, wait_if_limited: bool):
+        if text == self.shown:
+            return
+        try:
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message_id, text=text)
+        except RetryAfter as e:
+            if not wait_if_limited:
+                # Skip this frame; a later update or finish() will catch up
+                self._last_edit = self.clock() + _seconds(e.retry_after)
+                return
+            await asyncio.sleep(_seconds(e.retry_after))
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message_id, text=text)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self.shown = text
+        self._last_edit = self.clock()
+        self.edits += 1
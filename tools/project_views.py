@@ -0,0 +1,137 @@
+"""
+Project Views - Materialized per-project financial roll-ups
+Kept in step with payables/receivables writes so project questions are O(1)
+"""
+
+from typing import Dict, List, Optional
+
+
+# Accumulated totals per project. Derived figures (margin, burn, etc.) are
+# computed from these on read.
+_TOTAL_FIELDS = (
+    'billed_to_date',
+    'billed_base',
+    'received',
+    'outstanding',
+    'committed_cost',
+    'committed_base',
+    'paid_cost',
+    'unpaid_cost',
+    'payable_count',
+    'receivable_count',
+)
+
+_CLOSED_STATUSES = ('Paid', 'Cancelled')
+
+
+def _amount(record: Dict, key: str) -> float:
+    return float(record.get(key) or 0)
+
+
+def _payable_contribution(payable: Dict) -> Dict[str, float]:
+    """What a single payable adds to its project's totals"""
+    if payable.get('status') == 'Cancelled':
+        return {}
+    paid = payable.get('status') == 'Paid'
+    return {
+        'committed_cost': _amount(payable, 'total_amount'),
+        'committed_base': _amount(payable, 'base_amount'),
+        'paid_cost': _amount(payable, 'net_payable') if paid else 0.0,
+        'unpaid_cost': 0.0 if paid else _amount(payable, 'net_payable'),
+        'payable_count': 1,
+    }
+
+
+def _receivable_contribution(receivable: Dict) -> Dict[str, float]:
+    """What a single receivable adds to its project's totals"""
+    if receivable.get('status') == 'Cancelled':
+        return {}
+    open_invoice = receivable.get('status') not in _CLOSED_STATUSES
+    return {
+        'billed_to_date': _amount(receivable, 'total_amount'),
+        'billed_base': _amount(receivable, 'base_amount'),
+        'received': _amount(receivable, 'amount_received'),
+        'outstanding': _amount(receivable, 'balance_due') if open_invoice else 0.0,
+        'receivable_count': 1,
+    }
+
+
+class ProjectViews:
+    """
+    Materialized financial view per project.
+    Built once from the ledger, then updated incrementally on every
+    payable/receivable write by removing the old record's contribution
+    and adding the new one.
+    """
+
+    def __init__(self):
+        self._projects: Dict[str, Dict] = {}
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def rebuild(self, projects: List[Dict], payables: List[Dict], receivables: List[Dict]):
+        """Recompute every view from scratch (used on load/refresh)"""
+        self._projects = {p['project_id']: p for p in projects}
+        self._totals = {}
+        for payable in payables:
+            self.apply_payable(None, payable)
+        for receivable in receivables:
+            self.apply_receivable(None, receivable)
+
+    def apply_payable(self, old: Optional[Dict], new: Optional[Dict]):
+        """Move a payable's contribution from its old state to its new state"""
+        if old:
+            self._apply(old.get('project_id'), _payable_contribution(old), -1)
+        if new:
+            self._apply(new.get('project_id'), _payable_contribution(new), 1)
+
+    def apply_receivable(self, old: Optional[Dict], new: Optional[Dict]):
+        """Move a receivable's contribution from its old state to its new state"""
+        if old:
+            self._apply(old.get('project_id'), _receivable_contribution(old), -1)
+        if new:
+            self._apply(new.get('project_id'), _receivable_contribution(new), 1)
+
+    def _apply(self, project_id: Optional[str], contribution: Dict[str, float], sign: int):
+        if not project_id or not contribution:
+            return
+        totals = self._totals.get(project_id)
+        if totals is None:
+            totals = self._totals[project_id] = dict.fromkeys(_TOTAL_FIELDS, 0)
+        for key, value in contribution.items():
+            totals[key] += sign * value
+
+    def get(self, project_id: str) -> Optional[Dict]:
+        """Get the financial view for one project"""
+        project = self._projects.get(project_id)
+        totals = self._totals.get(project_id)
+        if project is None and totals is None:
+            return None
+        return self._compose(project_id, project or {}, totals or dict.fromkeys(_TOTAL_FIELDS, 0))
+
+    def get_all(self) -> List[Dict]:
+        """Get financial views for every known project"""
+        project_ids = list(self._projects) + [pid for pid in self._totals if pid not in self._projects]
+        return [self.get(pid) for pid in project_ids]
+
+    def _compose(self, project_id: str, project: Dict, totals: Dict[str, float]) -> Dict:
+        contract_value = float(project.get('contract_value') or 0)
+        percent_complete = float(project.get('percent_complete') or 0)
+        earned_value = contract_value * percent_complete / 100
+        margin = totals['billed_base'] - totals['committed_base']
+
+        view = {
+            'project_id': project_id,
+            'name': project.get('name'),
+            'client_id': project.get('client_id'),
+            'status': project.get('status'),
+            'contract_value': contract_value,
+            'percent_complete': percent_complete,
+            'earned_value': earned_value,
+            'unbilled_work': earned_value - totals['billed_base'],
+        }
+        view.update(totals)
+        view['margin'] = margin
+        view['margin_pct'] = round(margin / totals['billed_base'] * 100, 2) if totals['billed_base'] else None
+        # Cash the project has consumed so far: paid out to vendors minus collected
+        view['cash_burn'] = totals['paid_cost'] - totals['received']
+        return view
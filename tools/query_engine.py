@@ -0,0 +1,261 @@
+"""
+Query Engine - Answers simple numeric questions straight from the ledger
+Balances, totals by vendor/client/project, overdue lists and what's due this
+week don't need the LLM. Anything it doesn't recognise returns None so the
+caller can fall back to the model.
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tools.data_store import DataStore, format_currency
+
+
+# Questions asking for judgement rather than numbers go to the LLM
+_OPEN_ENDED = re.compile(r'\b(should|why|recommend|advise|suggest|strategy|think|plan|worr\w*|risk\w*|explain|compare)\b')
+
+# Words too common in company names to identify one on their own
+_GENERIC_NAME_WORDS = {
+    'ltd', 'limited', 'pvt', 'private', 'the', 'and', 'group', 'services',
+    'traders', 'construction', 'infrastructure', 'bank', 'of', 'india',
+}
+
+
+def _to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'[^a-z0-9 ]+', ' ', text.lower())
+
+
+def _name_score(question: str, name: str) -> int:
+    """How strongly the question mentions a name (0 = not at all)"""
+    words = _normalize(name).split()
+    if not words:
+        return 0
+    padded = f" {question} "
+    if f" {' '.join(words)} " in padded:
+        return 3
+    if len(words) > 1 and f" {' '.join(words[:2])} " in padded:
+        return 2
+    if words[0] not in _GENERIC_NAME_WORDS and len(words[0]) > 2 and f" {words[0]} " in padded:
+        return 1
+    return 0
+
+
+def _invoice_line(record: Dict, party_key: str, amount_key: str) -> str:
+    return (f"- {record.get(party_key)} ({record.get('invoice_number') or record.get('invoice_id')}): "
+            f"{format_currency(record.get(amount_key) or 0)}, due {record.get('due_date')}")
+
+
+class QueryEngine:
+    """
+    Pattern-matched, deterministic answers over DataStore.
+    Each handler returns a string answer or None if it doesn't apply.
+    """
+
+    def __init__(self, data_store: DataStore):
+        self.data_store = data_store
+        self._handlers: List[Callable[[str], Optional[str]]] = [
+            self._vendor_owed,
+            self._client_owes,
+            self._project_question,
+            self._overdue,
+            self._due_this_week,
+            self._account_balance,
+            self._total_balance,
+            self._totals,
+        ]
+
+    def answer(self, question: str) -> Optional[str]:
+        """Answer from the data if the question matches a known pattern"""
+        normalized = _normalize(question)
+        if _OPEN_ENDED.search(normalized):
+            return None
+        for handler in self._handlers:
+            result = handler(normalized)
+            if result is not None:
+                return result
+        return None
+
+    # ============ NAME LOOKUPS ============
+
+    def _best_match(self, question: str, records: List[Dict], name_key: str = 'name') -> Optional[Dict]:
+        best: Tuple[int, Optional[Dict]] = (0, None)
+        for record in records:
+            score = _name_score(question, record.get(name_key, ''))
+            if score > best[0]:
+                best = (score, record)
+        return best[1]
+
+    def _find_project(self, question: str) -> Optional[Dict]:
+        for project in self.data_store.get_all_projects():
+            if f" {project['project_id'].lower()} " in f" {question} ":
+                return project
+        return self._best_match(question, self.data_store.get_all_projects())
+
+    # ============ HANDLERS ============
+
+    def _total_balance(self, q: str) -> Optional[str]:
+        if not re.search(r'\b(bank balance|total balance|cash balance|how much cash|cash do we have|cash position)\b', q):
+            return None
+        lines = [f"Total bank balance: {format_currency(self.data_store.get_total_bank_balance())}"]
+        for account in self.data_store.get_all_bank_accounts():
+            line = f"- {account['bank_name']} ({account['account_type']}): {format_currency(account.get('balance') or 0)}"
+            if account.get('cc_limit'):
+                line += f" of {format_currency(account['cc_limit'])} limit"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def _account_balance(self, q: str) -> Optional[str]:
+        if 'balance' not in q:
+            return None
+        account = self._best_match(q, self.data_store.get_all_bank_accounts(), 'bank_name')
+        if account is None:
+            return None
+        return (f"{account['bank_name']} {account['account_type']} account balance: "
+                f"{format_currency(account.get('balance') or 0)} (as of {account.get('last_updated')})")
+
+    def _vendor_owed(self, q: str) -> Optional[str]:
+        if not re.search(r'\b(owe|pay|payable|payables|outstanding|due)\b', q) or re.search(r'\bowes? us\b', q):
+            return None
+        vendor = self._best_match(q, self.data_store.get_all_vendors())
+        if vendor is None:
+            return None
+        pending = [p for p in self.data_store.get_payables_for_vendor(vendor['vendor_id'])
+                   if p.get('status') not in ['Paid', 'Cancelled']]
+        total = sum(p.get('net_payable', 0) for p in pending)
+        lines = [f"We owe {vendor['name']} {format_currency(total)} across {len(pending)} open invoice(s)."]
+        lines += [_invoice_line(p, 'project_id', 'net_payable') + f" [{p.get('status')}]" for p in pending]
+        return "\n".join(lines)
+
+    def _client_owes(self, q: str) -> Optional[str]:
+        if not re.search(r'\b(owes? us|receivable|receivables|outstanding|collect|due from)\b', q):
+            return None
+        client = self._best_match(q, self.data_store.get_all_clients())
+        if client is None:
+            return None
+        pending = [r for r in self.data_store.get_receivables_for_client(client['client_id'])
+                   if r.get('status') not in ['Paid', 'Cancelled']]
+        total = sum(r.get('balance_due', 0) for r in pending)
+        lines = [f"{client['name']} owes us {format_currency(total)} across {len(pending)} open invoice(s)."]
+        lines += [_invoice_line(r, 'project_id', 'balance_due') + f" [{r.get('status')}]" for r in pending]
+        return "\n".join(lines)
+
+    def _project_question(self, q: str) -> Optional[str]:
+        if not re.search(r'\b(project|margin|billed|burn|contract)\b', q):
+            return None
+        project = self._find_project(q)
+        if project is None:
+            return None
+        view = self.data_store.get_project_financials(project['project_id'])
+        margin_pct = f" ({view['margin_pct']}%)" if view['margin_pct'] is not None else ""
+        return "\n".join([
+            f"{view['name']} ({view['project_id']}), {view['percent_complete']:.0f}% complete, "
+            f"contract {format_currency(view['contract_value'])}",
+            f"- Billed to date: {format_currency(view['billed_to_date'])}",
+            f"- Received: {format_currency(view['received'])}",
+            f"- Outstanding from client: {format_currency(view['outstanding'])}",
+            f"- Committed vendor cost: {format_currency(view['committed_cost'])}",
+            f"- Margin on billed work: {format_currency(view['margin'])}{margin_pct}",
+            f"- Cash burn (paid out minus received): {format_currency(view['cash_burn'])}",
+        ])
+
+    def _overdue(self, q: str) -> Optional[str]:
+        if 'overdue' not in q and 'late' not in q.split():
+            return None
+        sections = []
+        want_payables = not re.search(r'\b(receivable|receivables|client|clients|collection|collections)\b', q)
+        want_receivables = not re.search(r'\b(payable|payables|vendor|vendors|bills)\b', q)
+        if want_payables:
+            sections.append(self._overdue_section(
+                "Overdue payables", self._past_due(self.data_store.get_pending_payables()),
+                'vendor_name', 'net_payable'))
+        if want_receivables:
+            sections.append(self._overdue_section(
+                "Overdue receivables", self._past_due(self.data_store.get_pending_receivables()),
+                'client_name', 'balance_due'))
+        return "\n\n".join(sections)
+
+    def _due_this_week(self, q: str) -> Optional[str]:
+        if not re.search(r'\b(this week|next 7 days|next seven days|due soon)\b', q):
+            return None
+        today = date.today()
+        week_end = today + timedelta(days=7)
+
+        def due_within(records: List[Dict]) -> List[Dict]:
+            return [r for r in records
+                    if (_to_date(r.get('due_date')) or date.max) <= week_end]
+
+        sections = []
+        if not re.search(r'\b(receivable|receivables|collect|collections)\b', q):
+            sections.append(self._overdue_section(
+                f"Payables due by {week_end} (including overdue)",
+                due_within(self.data_store.get_pending_payables()), 'vendor_name', 'net_payable'))
+        if not re.search(r'\b(pay|payable|payables|vendor|vendors)\b', q):
+            sections.append(self._overdue_section(
+                f"Receivables due by {week_end} (including overdue)",
+                due_within(self.data_store.get_pending_receivables()), 'client_name', 'balance_due'))
+        return "\n\n".join(sections)
+
+    def _totals(self, q: str) -> Optional[str]:
+        if not re.search(r'\b(total|how much)\b', q):
+            return None
+        if re.search(r'\b(payable|payables|we owe)\b', q):
+            pending = self.data_store.get_pending_payables()
+            return (f"Total pending payables: {format_currency(self.data_store.get_total_pending_payables())} "
+                    f"across {len(pending)} invoice(s).")
+        if re.search(r'\b(receivable|receivables|owed to us|owe us)\b', q):
+            pending = self.data_store.get_pending_receivables()
+            return (f"Total pending receivables: {format_currency(self.data_store.get_total_pending_receivables())} "
+                    f"across {len(pending)} invoice(s).")
+        return None
+
+    # ============ HELPERS ============
+
+    def _past_due(self, records: List[Dict]) -> List[Dict]:
+        today = date.today()
+        return [r for r in records
+                if r.get('status') == 'Overdue' or (_to_date(r.get('due_date')) or date.max) < today]
+
+    def _overdue_section(self, title: str, records: List[Dict], party_key: str, amount_key: str) -> str:
+        records = sorted(records, key=lambda r: str(r.get('due_date')))
+        total = sum(r.get(amount_key, 0) or 0 for r in records)
+        lines = [f"{title}: {format_currency(total)} across {len(records)} invoice(s)"]
+        lines += [_invoice_line(r, party_key, amount_key) for r in records]
+        return "\n".join(lines)
+
+    # ============ STATUS REPORT ============
+
+    def status_report(self) -> str:
+        """Deterministic financial status (no LLM)"""
+        ds = self.data_store
+        overdue_payables = self._past_due(ds.get_pending_payables())
+        overdue_receivables = self._past_due(ds.get_pending_receivables())
+        cheques = ds.get_pending_cheques_summary()
+        cc_headroom = sum((a.get('cc_limit') or 0) + min(a.get('balance') or 0, 0)
+                          for a in ds.get_all_bank_accounts() if a.get('cc_limit'))
+        return "\n\n".join([
+            self._total_balance("total balance"),
+            "\n".join([
+                f"Credit line headroom: {format_currency(cc_headroom)}",
+                f"Pending cheques: issued {format_currency(cheques['issued'])}, "
+                f"received {format_currency(cheques['received'])}",
+                f"Pending payables: {format_currency(ds.get_total_pending_payables())}",
+                f"Pending receivables: {format_currency(ds.get_total_pending_receivables())}",
+                f"Overdue payables: {len(overdue_payables)} "
+                f"({format_currency(sum(p.get('net_payable', 0) for p in overdue_payables))})",
+                f"Overdue receivables: {len(overdue_receivables)} "
+                f"({format_currency(sum(r.get('balance_due', 0) for r in overdue_receivables))})",
+            ]),
+            self._due_this_week("due this week"),
+        ])
@@ -0,0 +1,243 @@
+"""
+Rate Limiter - Client-side admission control for Gemini calls
+Two token buckets (requests per minute, tokens per minute) shared by every
+GeminiBrain in the process. Callers are admitted before they reach the API,
+higher priority lanes go first, and the budget shrinks when a 429 still
+gets through, then grows back as calls succeed.
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Callable, Dict, Optional
+
+from config.settings import Settings
+from tools.resilience import DeadlineExceeded, remaining
+
+
+class Priority(IntEnum):
+    """Lower value = served first"""
+    INTERACTIVE = 0   # Telegram chat replies
+    ALERT = 1
+    BRIEFING = 2
+    BULK = 3          # Document ingestion
+
+
+# Share of each bucket a lane must leave untouched, so a burst of bulk work
+# can never drain the budget an interactive reply needs
+LANE_RESERVE = {
+    Priority.INTERACTIVE: 0.0,
+    Priority.ALERT: 0.1,
+    Priority.BRIEFING: 0.2,
+    Priority.BULK: 0.4,
+}
+
+# Rough output allowance added to the prompt estimate
+DEFAULT_OUTPUT_TOKENS = 512
+# Approximate cost of one image part
+IMAGE_TOKENS = 258
+# Longest a waiter sleeps before re-checking (a higher lane may have arrived)
+POLL_SECONDS = 0.25
+
+_current_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.BRIEFING)
+
+
+@contextmanager
+def llm_priority(level: Priority):
+    """Run the block's Gemini calls in the given lane"""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def in_lane(level: Priority):
+    """Decorator form of llm_priority for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with llm_priority(level):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with llm_priority(level):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+def estimate_tokens(contents: Any) -> int:
+    """Cheap prompt size estimate (~4 characters per token) plus output allowance"""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    total = 0
+    for part in parts:
+        total += len(part) // 4 if isinstance(part, str) else IMAGE_TOKENS
+    return total + DEFAULT_OUTPUT_TOKENS
+
+
+class RateLimiter:
+    """
+    limiter.acquire(tokens)          # blocks until admitted
+    await limiter.aacquire(tokens)   # same, without blocking the event loop
+    limiter.record_usage(estimated, actual)
+    limiter.on_rate_limited() / limiter.on_success()
+    """
+
+    def __init__(
+        self,
+        rpm: int,
+        tpm: int,
+        min_scale: float = 0.1,
+        recovery_step: float = 0.05,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.min_scale = min_scale
+        self.recovery_step = recovery_step
+        self.clock = clock
+        # Fraction of the configured budget currently allowed (AIMD)
+        self.scale = 1.0
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = clock()
+        self._waiting: Dict[Priority, int] = {level: 0 for level in Priority}
+        self._lock = threading.Lock()
+        self.counters = {'admitted': 0, 'waited': 0, 'rate_limited': 0}
+
+    # ============ ADMISSION ============
+
+    def acquire(self, tokens: int, priority: Optional[Priority] = None):
+        priority = current_priority() if priority is None else priority
+        self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_admit(priority, tokens)
+                if wait <= 0:
+                    return
+                self._check_deadline(wait)
+                time.sleep(min(wait, POLL_SECONDS))
+        finally:
+            self._dequeue(priority)
+
+    async def aacquire(self, tokens: int, priority: Optional[Priority] = None):
+        priority = current_priority() if priority is None else priority
+        self._enqueue(priority)
+        try:
+            while True:
+                wait = self._try_admit(priority, tokens)
+                if wait <= 0:
+                    return
+                self._check_deadline(wait)
+                await asyncio.sleep(min(wait, POLL_SECONDS))
+        finally:
+            self._dequeue(priority)
+
+    def try_acquire(self, tokens: int, priority: Optional[Priority] = None) -> bool:
+        """Admit now or not at all (for optional extra calls such as hedges)"""
+        priority = current_priority() if priority is None else priority
+        return self._try_admit(priority, tokens) <= 0
+
+    @staticmethod
+    def _check_deadline(wait: float):
+        left = remaining()
+        if left is not None and wait > left:
+            raise DeadlineExceeded(f"Rate limit wait of {wait:.1f}s would pass the deadline")
+
+    def _enqueue(self, priority: Priority):
+        with self._lock:
+            self._waiting[priority] += 1
+
+    def _dequeue(self, priority: Priority):
+        with self._lock:
+            self._waiting[priority] -= 1
+
+    def _try_admit(self, priority: Priority, tokens: int) -> float:
+        """Take from both buckets and return 0, or return seconds to wait"""
+        with self._lock:
+            self._refill()
+            if any(self._waiting[level] for level in Priority if level < priority):
+                self.counters['waited'] += 1
+                return POLL_SECONDS
+
+            reserve = LANE_RESERVE[priority]
+            # A single oversized prompt must still be admissible eventually
+            tokens = min(tokens, self.tpm)
+            need_requests = min(1 + reserve * self.rpm, self.rpm)
+            need_tokens = min(tokens + reserve * self.tpm, self.tpm)
+            if self._requests >= need_requests and self._tokens >= need_tokens:
+                self._requests -= 1
+                self._tokens -= tokens
+                self.counters['admitted'] += 1
+                return 0.0
+
+            self.counters['waited'] += 1
+            per_second = self.scale / 60.0
+            return max(
+                (need_requests - self._requests) / (self.rpm * per_second),
+                (need_tokens - self._tokens) / (self.tpm * per_second),
+                0.01
+            )
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self._updated
+        self._updated = now
+        per_second = self.scale / 60.0
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm * per_second)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm * per_second)
+
+    # ============ FEEDBACK ============
+
+    def record_usage(self, estimated: int, actual: Optional[int]):
+        """Correct the token bucket once the real usage is known"""
+        if actual is None:
+            return
+        with self._lock:
+            self._tokens -= actual - min(estimated, self.tpm)
+
+    def on_rate_limited(self):
+        """The API still said 429: halve the rate and drain the request bucket"""
+        with self._lock:
+            self.scale = max(self.min_scale, self.scale / 2)
+            self._requests = min(self._requests, 0.0)
+            self.counters['rate_limited'] += 1
+
+    def on_success(self):
+        with self._lock:
+            self.scale = min(1.0, self.scale + self.recovery_step)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return dict(
+                self.counters,
+                scale=round(self.scale, 3),
+                requests_available=round(self._requests, 2),
+                tokens_available=int(self._tokens),
+                waiting={level.name: count for level, count in self._waiting.items() if count}
+            )
+
+
+_shared_limiter: Optional[RateLimiter] = None
+
+
+def get_shared_limiter() -> RateLimiter:
+    """Process-wide limiter shared by every GeminiBrain"""
+    global _shared_limiter
+    if _shared_limiter is None:
+        _shared_limiter = RateLimiter(rpm=Settings.GEMINI_RPM, tpm=Settings.GEMINI_TPM)
+    return _shared_limiter
@@ -0,0 +1,342 @@
+"""
+Resilience - Deadlines, hedged requests and a circuit breaker for Gemini calls
+An entry point (Telegram handler, CLI command, briefing) sets a deadline and
+every Gemini call below it only gets the time that is left. Calls slower than
+usual can be hedged with a duplicate request, and repeated failures open a
+breaker so callers fall back to a cached or degraded answer straight away.
+"""
+
+import asyncio
+import contextvars
+import functools
+import inspect
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from config.settings import Settings
+
+
+class BackendUnavailable(Exception):
+    """Gemini can't answer in time; use a cached or degraded answer instead"""
+
+
+class DeadlineExceeded(BackendUnavailable, TimeoutError):
+    pass
+
+
+class CircuitOpenError(BackendUnavailable):
+    pass
+
+
+# ============ DEADLINES ============
+
+_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Give the block at most `seconds`. A nested deadline can only shorten the outer one."""
+    if seconds is None:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def with_deadline(seconds: Optional[float]):
+    """Decorator form of deadline for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with deadline(seconds):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with deadline(seconds):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None if there is none"""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def check_deadline() -> Optional[float]:
+    """Raise DeadlineExceeded if the deadline has passed, else return the time left"""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline passed before the Gemini call could start")
+    return left
+
+
+def call_timeout() -> float:
+    """Timeout for one API attempt: the per-call limit, cut short by the deadline"""
+    left = remaining()
+    timeout = Settings.GEMINI_CALL_TIMEOUT_SECONDS
+    return timeout if left is None else max(min(timeout, left), 0.0)
+
+
+# ============ DEGRADED ANSWERS ============
+
+# Callers that keep results (the agent memo) watch for answers served while
+# Gemini was down, so an apology or a stale answer isn't kept as if fresh
+_watchers: ContextVar[tuple] = ContextVar("degraded_watchers", default=())
+
+
+@contextmanager
+def watch_degraded():
+    """
+    with watch_degraded() as seen: ...
+    seen['degraded'] is True if any answer inside (in this thread or a task
+    or worker started from it) was a stale answer or an apology.
+    """
+    seen = {'degraded': False}
+    token = _watchers.set(_watchers.get() + (seen,))
+    try:
+        yield seen
+    finally:
+        _watchers.reset(token)
+
+
+def note_degraded():
+    for seen in _watchers.get():
+        seen['degraded'] = True
+
+
+# ============ CIRCUIT BREAKER ============
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive outages
+    it opens and calls fail fast with CircuitOpenError. After `reset_seconds`
+    one probe call is let through (half-open); its outcome closes or reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe: Optional[int] = None
+        self._probe_started = 0.0
+        self._probes = itertools.count(1)
+        self._lock = threading.Lock()
+        self.counters = {'opened': 0, 'rejected': 0, 'probes_released': 0}
+
+    def before_call(self) -> Optional[int]:
+        """
+        Admit a call or raise CircuitOpenError. Returns a probe token when
+        this call is the half-open probe: hand it to release_probe() if the
+        call ends without recording an outcome.
+        """
+        with self._lock:
+            now = self.clock()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_seconds:
+                self.state, self._probe = self.HALF_OPEN, None
+            if self.state == self.CLOSED:
+                return None
+            if self.state == self.HALF_OPEN and self._probe is not None and now - self._probe_started >= self.reset_seconds:
+                # Nothing heard from the last probe in a whole reset period: presume it lost
+                self._probe = None
+                self.counters['probes_released'] += 1
+            if self.state == self.HALF_OPEN and self._probe is None:
+                self._probe, self._probe_started = next(self._probes), now
+                return self._probe
+            self.counters['rejected'] += 1
+            retry_in = max(self.reset_seconds - (now - self._opened_at), 0)
+            raise CircuitOpenError(f"Gemini looks unavailable; not calling it for another {retry_in:.0f}s")
+
+    def release_probe(self, token: Optional[int]):
+        """The probe ended with no outcome (deadline, cancellation, stream closed early): let another through"""
+        if token is None:
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probe == token:
+                self._probe = None
+                self.counters['probes_released'] += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state, self._failures, self._probe = self.CLOSED, 0, None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.counters['opened'] += 1
+                self.state, self._opened_at, self._probe = self.OPEN, self.clock(), None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, state=self.state, failures=self._failures)
+
+
+# ============ HEDGED REQUESTS ============
+
+_call_threads = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini-call")
+
+
+class Hedger:
+    """
+    Runs one API attempt with a timeout. Once `min_samples` latencies are
+    known for a model, an attempt still running after the `percentile`
+    latency gets a duplicate request (if `allow_hedge` says the budget has
+    room); whichever answers first wins.
+    """
+
+    def __init__(self, enabled: bool = True, percentile: float = 0.95, min_samples: int = 20, window: int = 200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self.counters = {'hedged': 0, 'hedge_wins': 0, 'timeouts': 0}
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._latencies[key].append(seconds)
+
+    def hedge_after(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is off or there's too little history"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies[key])
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(len(samples) * self.percentile), len(samples) - 1)]
+
+    def _timed_out(self, timeout: float) -> TimeoutError:
+        with self._lock:
+            self.counters['timeouts'] += 1
+        return TimeoutError(f"Gemini call timed out after {timeout:.1f}s")
+
+    def _won(self, key: str, started: float, hedge: bool):
+        self.record(key, time.monotonic() - started)
+        if hedge:
+            with self._lock:
+                self.counters['hedge_wins'] += 1
+
+    def _hedging(self, allow_hedge: Callable[[], bool]) -> bool:
+        if not allow_hedge():
+            return False
+        with self._lock:
+            self.counters['hedged'] += 1
+        return True
+
+    def call(self, key: str, func: Callable[[], Any], timeout: float,
+             allow_hedge: Callable[[], bool] = lambda: True) -> Any:
+        """Blocking attempt. A request that outlives its timeout is abandoned, not killed."""
+        started = time.monotonic()
+        delay = self.hedge_after(key)
+        futures = [_call_threads.submit(contextvars.copy_context().run, func)]
+        if delay is not None and delay < timeout:
+            done, _ = wait(futures, timeout=delay)
+            if not done and self._hedging(allow_hedge):
+                futures.append(_call_threads.submit(contextvars.copy_context().run, func))
+
+        pending, error = set(futures), None
+        while pending:
+            left = timeout - (time.monotonic() - started)
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self._won(key, started, future is not futures[0])
+                    return future.result()
+                error = future.exception()
+        if not pending and error is not None:
+            raise error
+        raise self._timed_out(timeout)
+
+    async def acall(self, key: str, attempt: Callable[[], Awaitable[Any]], timeout: float,
+                    allow_hedge: Callable[[], bool] = lambda: True) -> Any:
+        """Async attempt; the losing or timed-out request is cancelled."""
+        started = time.monotonic()
+        delay = self.hedge_after(key)
+        tasks = [asyncio.ensure_future(attempt())]
+        try:
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._hedging(allow_hedge):
+                    tasks.append(asyncio.ensure_future(attempt()))
+
+            pending, error = set(tasks), None
+            while pending:
+                left = timeout - (time.monotonic() - started)
+                if left <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._won(key, started, task is not tasks[0])
+                        return task.result()
+                    error = task.exception()
+            if not pending and error is not None:
+                raise error
+            raise self._timed_out(timeout)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.counters, models=len(self._latencies))
+
+
+_shared_breaker: Optional[CircuitBreaker] = None
+_shared_hedger: Optional[Hedger] = None
+
+
+def get_shared_breaker() -> CircuitBreaker:
+    """Process-wide breaker shared by every GeminiBrain"""
+    global _shared_breaker
+    if _shared_breaker is None:
+        _shared_breaker = CircuitBreaker(
+            failure_threshold=Settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_seconds=Settings.CIRCUIT_RESET_SECONDS
+        )
+    return _shared_breaker
+
+
+def get_shared_hedger() -> Hedger:
+    """Process-wide latency history shared by every GeminiBrain"""
+    global _shared_hedger
+    if _shared_hedger is None:
+        _shared_hedger = Hedger(
+            enabled=Settings.HEDGE_ENABLED,
+            percentile=Settings.HEDGE_PERCENTILE,
+            min_samples=Settings.HEDGE_MIN_SAMPLES
+        )
+    return _shared_hedger
@@ -0,0 +1,184 @@
+"""
+Response Cache - Content-addressed cache for Gemini responses
+Two tiers: an in-memory LRU and a size-bounded directory on disk.
+Entries expire per call type (a document read stays valid far longer than
+an answer about today's cash).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from config.settings import Settings
+
+
+# Seconds an entry stays valid, by call type
+DEFAULT_TTLS = {
+    'think': 15 * 60,
+    'discuss': 5 * 60,
+    'see_and_think': 7 * 24 * 3600,
+}
+DEFAULT_TTL = 15 * 60
+
+
+class ResponseCache:
+    """
+    Maps sha256(model name + prompt parts) -> response text.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = "data/cache/llm",
+        max_memory_entries: int = 256,
+        max_disk_bytes: int = 50 * 1024 * 1024,
+        ttls: Optional[Dict[str, int]] = None
+    ):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._disk_bytes = self._scan_disk_usage()
+
+    @staticmethod
+    def make_key(model_name: str, *parts: Union[str, bytes]) -> str:
+        """Content address for a request"""
+        digest = hashlib.sha256(model_name.encode('utf-8'))
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+            # Length prefix so ("ab", "c") and ("a", "bc") differ
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    # ============ READ / WRITE ============
+
+    def get(self, key: str, call_type: str) -> Optional[str]:
+        """Cached text if present and not expired"""
+        ttl = self.ttls.get(call_type, DEFAULT_TTL)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry['created_at'] <= ttl:
+                self._memory.move_to_end(key)
+                self.counters['hits'] += 1
+                self.counters['memory_hits'] += 1
+                return entry['text']
+
+            entry = self._read_disk(key)
+            if entry is not None and now - entry['created_at'] <= ttl:
+                self._remember(key, entry)
+                self.counters['hits'] += 1
+                self.counters['disk_hits'] += 1
+                return entry['text']
+
+            self.counters['misses'] += 1
+            return None
+
+    def get_stale(self, key: str) -> Optional[str]:
+        """Cached text even if expired: better than nothing when Gemini is down"""
+        with self._lock:
+            entry = self._memory.get(key) or self._read_disk(key)
+            return entry['text'] if entry is not None else None
+
+    def put(self, key: str, call_type: str, text: str):
+        """Store a response in both tiers"""
+        entry = {'call_type': call_type, 'created_at': time.time(), 'text': text}
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk(key, entry)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters plus current sizes"""
+        with self._lock:
+            return dict(self.counters, memory_entries=len(self._memory), disk_bytes=self._disk_bytes)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.cache_dir and self.cache_dir.exists():
+                for path in self.cache_dir.glob('*/*.json'):
+                    path.unlink(missing_ok=True)
+            self._disk_bytes = 0
+
+    # ============ MEMORY TIER ============
+
+    def _remember(self, key: str, entry: Dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    # ============ DISK TIER ============
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Dict]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # mark as recently used for eviction
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, entry: Dict):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous = path.stat().st_size if path.exists() else 0
+            payload = json.dumps(entry, ensure_ascii=False)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            self._disk_bytes += path.stat().st_size - previous
+        except OSError as e:
+            print(f"⚠️ Could not write response cache entry: {e}")
+            return
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _scan_disk_usage(self) -> int:
+        if not self.cache_dir or not self.cache_dir.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.cache_dir.glob('*/*.json'))
+
+    def _evict_disk(self):
+        """Drop least recently used files until under 90% of the budget"""
+        files = sorted(self.cache_dir.glob('*/*.json'), key=lambda p: p.stat().st_mtime)
+        target = self.max_disk_bytes * 0.9
+        for path in files:
+            if self._disk_bytes <= target:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self._disk_bytes -= size
+            self.counters['evictions'] += 1
+
+
+_shared_cache: Optional[ResponseCache] = None
+
+
+def get_shared_cache() -> ResponseCache:
+    """Process-wide cache shared by every GeminiBrain"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ResponseCache(
+            cache_dir=Settings.LLM_CACHE_DIR or None,
+            max_memory_entries=Settings.LLM_CACHE_MEMORY_ENTRIES,
+            max_disk_bytes=Settings.LLM_CACHE_DISK_MB * 1024 * 1024
+        )
+    return _shared_cache
@@ -0,0 +1,108 @@
+"""
+Single Flight - Coalesces identical Gemini requests that are in flight at once
+The first caller of a key (the leader) makes the request; anyone asking for
+the same key before it finishes waits for that result instead of paying for
+another one. Leaders and followers can be threads or asyncio tasks in any mix,
+because the shared result is a concurrent.futures.Future.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from tools.resilience import BackendUnavailable, DeadlineExceeded, remaining
+
+
+class SingleFlight:
+    """
+    text, shared = flights.do(key, produce)          # threads
+    text, shared = await flights.ado(key, aproduce)  # asyncio
+    `shared` is True when the result came from another caller's request.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.counters = {'leaders': 0, 'coalesced': 0}
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """(the key's future, whether this caller leads it)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters['coalesced'] += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self.counters['leaders'] += 1
+            return future, True
+
+    def _land(self, key: str, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    @staticmethod
+    def _follower_timeout() -> Optional[float]:
+        # A follower waits no longer than its own deadline, whatever the leader's is
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("Deadline passed while waiting for a shared Gemini request")
+        return left
+
+    def do(self, key: str, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                return future.result(timeout=self._follower_timeout()), True
+            except FutureTimeout:
+                raise DeadlineExceeded("Deadline passed while waiting for a shared Gemini request")
+        try:
+            result = func()
+        except BaseException as e:
+            self._land(key, future, error=e)
+            raise
+        self._land(key, future, result)
+        return result, False
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                # shield: a follower giving up must not cancel the leader's result
+                return await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)), self._follower_timeout()
+                ), True
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("Deadline passed while waiting for a shared Gemini request")
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # The leader's task went away; followers fall back like on an outage
+            self._land(key, future, error=BackendUnavailable("Shared Gemini request was cancelled"))
+            raise
+        except BaseException as e:
+            self._land(key, future, error=e)
+            raise
+        self._land(key, future, result)
+        return result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._inflight))
+
+
+_shared_flights: Optional[SingleFlight] = None
+
+
+def get_shared_flights() -> SingleFlight:
+    """Process-wide in-flight table shared by every GeminiBrain"""
+    global _shared_flights
+    if _shared_flights is None:
+        _shared_flights = SingleFlight()
+    return _shared_flights
@@ -0,0 +1,212 @@
+"""
+Snapshot Store - Append-only daily time series of financial position
+Stored column-wise in a gzip-compressed JSON file next to the database.
+"""
+
+import bisect
+import gzip
+import json
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# Days past due -> bucket name. Anything not yet due is 'current'.
+AGING_BUCKETS = (
+    (0, 'current'),
+    (30, '1_30'),
+    (60, '31_60'),
+    (90, '61_90'),
+    (None, '90_plus'),
+)
+
+
+def _to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        return None
+
+
+def aging_buckets(records: List[Dict], amount_key: str, as_of: date) -> Dict[str, float]:
+    """Sum outstanding amounts by how many days past due they are"""
+    buckets = {name: 0.0 for _, name in AGING_BUCKETS}
+    for record in records:
+        due = _to_date(record.get('due_date'))
+        days_late = (as_of - due).days if due else 0
+        for limit, name in AGING_BUCKETS:
+            if limit is None or days_late <= limit:
+                buckets[name] += float(record.get(amount_key) or 0)
+                break
+    return buckets
+
+
+def build_snapshot(data_store, as_of: date) -> Dict[str, float]:
+    """Flatten the store's current position into one row of numbers"""
+    payables = data_store.get_pending_payables()
+    receivables = data_store.get_pending_receivables()
+
+    row = {
+        'total_balance': data_store.get_total_bank_balance(),
+        'pending_payables': data_store.get_total_pending_payables(),
+        'pending_receivables': data_store.get_total_pending_receivables(),
+    }
+    for account in data_store.get_all_bank_accounts():
+        row[f"balance:{account['account_id']}"] = float(account.get('balance') or 0)
+    for name, amount in aging_buckets(payables, 'net_payable', as_of).items():
+        row[f"payables_{name}"] = amount
+    for name, amount in aging_buckets(receivables, 'balance_due', as_of).items():
+        row[f"receivables_{name}"] = amount
+    return row
+
+
+class SnapshotStore:
+    """
+    One row per day, stored as columns:
+        {"date": [ordinal, ...], "total_balance": [...], "balance:BA001": [...], ...}
+    Rows can only be appended; recording again on the same day replaces that
+    day's row so intraday updates don't create duplicates.
+    """
+
+    def __init__(self, path: str = "data/snapshots.json.gz"):
+        self.path = Path(path)
+        self.columns: Dict[str, List] = {'date': []}
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        """(Re)load from disk if another store instance has written since"""
+        if not self.path.exists():
+            return
+        mtime = self.path.stat().st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            self.columns = json.load(f)
+        self._mtime = mtime
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            json.dump(self.columns, f, separators=(',', ':'))
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def __len__(self) -> int:
+        return len(self.columns['date'])
+
+    # ============ WRITE ============
+
+    def append(self, day: date, row: Dict[str, float]) -> bool:
+        """Append (or replace today's) snapshot row"""
+        self._load()
+        ordinal = day.toordinal()
+        dates = self.columns['date']
+        if dates and ordinal < dates[-1]:
+            print(f"Snapshot for {day} is older than the latest ({date.fromordinal(dates[-1])}); skipped")
+            return False
+
+        replace = bool(dates) and dates[-1] == ordinal
+        if not replace:
+            dates.append(ordinal)
+            for values in self.columns.values():
+                if values is not dates:
+                    values.append(None)
+
+        n = len(dates)
+        for key, value in row.items():
+            if key not in self.columns:
+                # New series (e.g. a new bank account): backfill with gaps
+                self.columns[key] = [None] * n
+            self.columns[key][-1] = round(value, 2) if value is not None else None
+
+        self._save()
+        return True
+
+    def record(self, data_store, day: Optional[date] = None) -> bool:
+        """Take a snapshot of the store's current position"""
+        day = day or date.today()
+        return self.append(day, build_snapshot(data_store, day))
+
+    # ============ READ ============
+
+    def series(self) -> List[str]:
+        """Names of all recorded series"""
+        return [key for key in self.columns if key != 'date']
+
+    def range(self, start: Optional[date] = None, end: Optional[date] = None,
+              fields: Optional[List[str]] = None) -> Dict[str, List]:
+        """Columns for snapshots between start and end (inclusive)"""
+        self._load()
+        dates = self.columns['date']
+        lo = bisect.bisect_left(dates, start.toordinal()) if start else 0
+        hi = bisect.bisect_right(dates, end.toordinal()) if end else len(dates)
+        fields = fields or self.series()
+        result = {'date': [date.fromordinal(d) for d in dates[lo:hi]]}
+        for field in fields:
+            result[field] = self.columns.get(field, [None] * len(dates))[lo:hi]
+        return result
+
+    def downsample(self, start: Optional[date] = None, end: Optional[date] = None,
+                   fields: Optional[List[str]] = None, period: str = 'week',
+                   how: str = 'last') -> Dict[str, List]:
+        """
+        Collapse daily rows into weekly or monthly points.
+        how='last' keeps the period's closing value, how='mean' averages it.
+        """
+        window = self.range(start, end, fields)
+        out: Dict[str, List] = {key: [] for key in window}
+        current_key = None
+        bucket: Dict[str, List] = {}
+
+        def flush():
+            if not bucket:
+                return
+            out['date'].append(bucket['date'][-1])
+            for field, values in bucket.items():
+                if field == 'date':
+                    continue
+                present = [v for v in values if v is not None]
+                if not present:
+                    out[field].append(None)
+                elif how == 'mean':
+                    out[field].append(round(sum(present) / len(present), 2))
+                else:
+                    out[field].append(present[-1])
+
+        for i, day in enumerate(window['date']):
+            if period == 'month':
+                key = (day.year, day.month)
+            else:
+                key = day.isocalendar()[:2]
+            if key != current_key:
+                flush()
+                bucket = {field: [] for field in window}
+                current_key = key
+            for field in window:
+                bucket[field].append(window[field][i])
+        flush()
+        return out
+
+    def trend_summary(self, days: int = 90, as_of: Optional[date] = None) -> str:
+        """A few numbers describing how cash and dues have moved"""
+        as_of = as_of or date.today()
+        start = date.fromordinal(as_of.toordinal() - days)
+        fields = ['total_balance', 'pending_payables', 'pending_receivables']
+        window = self.range(start, as_of, fields)
+        if len(window['date']) < 2:
+            return "Not enough history yet."
+
+        lines = [f"{len(window['date'])} snapshots from {window['date'][0]} to {window['date'][-1]}"]
+        for field in fields:
+            values = [v for v in window[field] if v is not None]
+            if not values:
+                continue
+            lines.append(
+                f"{field}: start {values[0]:,.0f}, now {values[-1]:,.0f}, "
+                f"change {values[-1] - values[0]:+,.0f}, low {min(values):,.0f}, high {max(values):,.0f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,83 @@
+"""
+Task Graph - Run dependent steps concurrently on a bounded thread pool
+Each step starts as soon as the steps it depends on have finished, so the
+total wall time approaches the critical path rather than the sum of steps.
+"""
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+class TaskGraph:
+    """
+    graph = TaskGraph(max_workers=4)
+    graph.add("cash", analyze_cash)
+    graph.add("payments", lambda cash: recommend(cash), depends_on=["cash"])
+    results, timings = graph.run()
+
+    A step's function is called with the results of its dependencies as
+    keyword arguments named after those steps.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._steps: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[..., Any], depends_on: Iterable[str] = ()) -> "TaskGraph":
+        depends_on = tuple(depends_on)
+        missing = [dep for dep in depends_on if dep not in self._steps]
+        if missing:
+            raise ValueError(f"Step '{name}' depends on unknown step(s): {', '.join(missing)}")
+        self._steps[name] = (func, depends_on)
+        return self
+
+    def run(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Execute every step. Returns (results by step name, timings).
+        timings has per-step {"start", "seconds"} offsets plus "wall_seconds".
+        If a step raises, pending steps are cancelled and the error is re-raised.
+        """
+        results: Dict[str, Any] = {}
+        timings: Dict[str, Any] = {}
+        remaining = dict(self._steps)
+        started = time.perf_counter()
+
+        def timed(name: str, func: Callable[..., Any], kwargs: Dict[str, Any]):
+            step_start = time.perf_counter()
+            try:
+                return func(**kwargs)
+            finally:
+                timings[name] = {
+                    "start": round(step_start - started, 3),
+                    "seconds": round(time.perf_counter() - step_start, 3),
+                }
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+
+            def submit_ready():
+                for name, (func, deps) in list(remaining.items()):
+                    if all(dep in results for dep in deps):
+                        kwargs = {dep: results[dep] for dep in deps}
+                        # Copy context so tracing spans nest under the caller
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, timed, name, func, kwargs)] = name
+                        del remaining[name]
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception:
+                        for pending in running:
+                            pending.cancel()
+                        raise
+                submit_ready()
+
+        timings["wall_seconds"] = round(time.perf_counter() - started, 3)
+        return results, timings
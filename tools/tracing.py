@@ -0,0 +1,48 @@
+"""
+Tracing - opik's @track that also tags Gemini calls with their call site
+Agents use this in place of opik.track so local call metrics are attributed
+to the same names as the opik spans.
+"""
+
+import functools
+import inspect
+from typing import Optional
+
+from opik import track as opik_track
+
+from tools.call_metrics import call_site
+
+
+def track(name: Optional[str] = None, **kwargs):
+    def decorator(func):
+        site = name or func.__qualname__
+        traced = opik_track(name=name, **kwargs)(func)
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kw):
+                with call_site(site):
+                    async for item in traced(*args, **kw):
+                        yield item
+            return async_gen_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kw):
+                with call_site(site):
+                    yield from traced(*args, **kw)
+            return gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kw):
+                with call_site(site):
+                    return await traced(*args, **kw)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kw):
+            with call_site(site):
+                return traced(*args, **kw)
+        return wrapper
+    return decorator
@@ -1,35 +1,117 @@
 import uuid
 import json
 import re
+from typing import Any, Dict, List, Optional
+from tools.data_store import format_currency
+
+# Columns worth sending to the model, per collection. Anything else
+# (account numbers, IFSC, phone numbers, GSTINs) is dropped.
+LLM_FIELDS = {
+    'payables': ['invoice_id', 'vendor_name', 'project_id', 'invoice_number', 'due_date',
+                 'description', 'net_payable', 'status', 'priority'],
+    'receivables': ['invoice_id', 'client_name', 'project_id', 'due_date', 'description',
+                    'net_receivable', 'amount_received', 'balance_due', 'status',
+                    'last_follow_up', 'client_remarks'],
+    'vendors': ['vendor_id', 'name', 'category', 'credit_days', 'is_critical', 'is_active'],
+    'clients': ['client_id', 'name', 'client_type', 'payment_terms_days', 'avg_payment_days', 'notes'],
+    'bank_accounts': ['bank_name', 'account_type', 'balance', 'cc_limit', 'last_updated'],
+    'cheques': ['cheque_number', 'party_name', 'amount', 'cheque_date', 'status', 'remarks'],
+    'flags': ['invoice_id', 'type', 'severity', 'detail'],
+    'goals': ['description', 'target_amount', 'current_amount', 'deadline', 'status', 'strategy'],
+    'projects': ['project_id', 'name', 'status', 'percent_complete', 'contract_value', 'billed_to_date',
+                 'received', 'outstanding', 'committed_cost', 'unpaid_cost', 'margin', 'margin_pct', 'cash_burn'],
+}
+
+# Keys holding rupee amounts (shown as lakhs/crores)
+_AMOUNT_KEY = re.compile(r'amount|balance|payable|receivable|limit|value|cost|margin$|billed|received|outstanding|burn')
 
 def generate_id(prefix: str = "doc") -> str:
     """Generate a unique ID with an optional prefix."""
     return f"{prefix}_{uuid.uuid4().hex[:8]}"
 
+def extract_json(text: str, object_only: bool = False) -> Optional[Any]:
+    """
+    First complete JSON object (or array) in text, found in one pass.
+    Tracks brace depth and string literals, so prose around the JSON, code
+    fences and braces inside strings don't confuse it. None if there is none.
+    """
+    openers = '{' if object_only else '{['
+    start = None
+    stack: List[str] = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if start is None:
+            if ch in openers:
+                start, stack = i, [ch]
+            continue
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+        elif ch in '}]':
+            if stack.pop() != ('{' if ch == '}' else '['):
+                # Mismatched bracket: not JSON, look for the next candidate
+                start, stack = None, []
+                continue
+            if not stack:
+                try:
+                    return json.loads(text[start:i + 1])
+                except ValueError:
+                    start = None
+    return None
+
 def parse_json(text: str) -> dict:
     """
     Attempt to parse JSON from text, handling markdown code blocks.
     """
-    try:
-        # Look for markdown code blocks
-        json_match = re.search(r'```json\s*(.*?)\s*```', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(1))
-        
-        # If no code block, try finding anything that looks like { ... } or [ ... ]
-        json_match = re.search(r'(\{.*\}|\[.*\])', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(1))
-        
-        # Fallback to direct parse
-        return json.loads(text)
-    except Exception:
-        return {}
-
-def format_data(data: list) -> str:
+    parsed = extract_json(text)
+    return parsed if parsed is not None else {}
+
+def _cell(key: str, value: Any) -> str:
+    if value is None or value == "":
+        return "-"
+    if isinstance(value, bool):
+        return "Y" if value else "N"
+    if isinstance(value, (int, float)) and _AMOUNT_KEY.search(key):
+        return format_currency(value)
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, list):
+        return ",".join(str(v) for v in value) or "-"
+    text = str(value)
+    if text.endswith(" 00:00:00"):
+        text = text[:-9]
+    return text.replace("|", "/").replace("\n", " ")
+
+
+def format_table(data: List[Dict], fields: Optional[List[str]] = None) -> str:
+    """
+    Compact table for LLM context: one header row, then one pipe-delimited
+    row per record. Columns that are empty in every record are dropped.
+    """
+    if not data: return "None"
+    if fields is None:
+        fields = []
+        for item in data:
+            fields += [key for key in item if key not in fields]
+    fields = [f for f in fields if any(item.get(f) not in (None, "") for item in data)]
+    lines = ["|".join(fields)]
+    for item in data:
+        lines.append("|".join(_cell(f, item.get(f)) for f in fields))
+    return "\n".join(lines)
+
+
+def format_data(data: list, fields: Optional[List[str]] = None) -> str:
     """Format a list of dicts for LLM consumption."""
     if not data: return "No data available."
-    return json.dumps(data, indent=2)
+    return format_table(data, fields)
 
 def format_summary(data: list) -> str:
     """Create a high-level summary of records."""
@@ -37,23 +119,25 @@ def format_summary(data: list) -> str:
     total = sum(float(item.get("total_amount", 0) or item.get("net_payable", 0) or item.get("net_receivable", 0) or 0) for item in data)
     return f"Count: {len(data)}, Total Value: {total:.2f}"
 
-def format_detailed(data: list) -> str:
+def format_detailed(data: list, fields: Optional[List[str]] = None) -> str:
     """Format detailed records for analysis."""
     if not data: return "None"
-    return json.dumps(data, indent=2)
+    return format_table(data, fields)
+
+def _uncleared_cheques(cheques: list, cheque_type: str) -> list:
+    return [c for c in cheques
+            if str(c.get("type", "")).lower() == cheque_type and str(c.get("status", "")).lower() != "cleared"]
 
 def format_cheques_issued(cheques: list) -> str:
-    issued = [c for c in cheques if c.get("type") == "issued" and c.get("status") != "cleared"]
-    return format_detailed(issued)
+    return format_detailed(_uncleared_cheques(cheques, "issued"), LLM_FIELDS['cheques'])
 
 def format_cheques_received(cheques: list) -> str:
-    received = [c for c in cheques if c.get("type") == "received" and c.get("status") != "cleared"]
-    return format_detailed(received)
+    return format_detailed(_uncleared_cheques(cheques, "received"), LLM_FIELDS['cheques'])
 
 def format_vendor_context(vendors: list) -> str:
     if not vendors: return "No vendor master data."
-    return format_detailed(vendors)
+    return format_detailed(vendors, LLM_FIELDS['vendors'])
 
 def format_client_context(clients: list) -> str:
     if not clients: return "No client master data."
-    return format_detailed(clients)
+    return format_detailed(clients, LLM_FIELDS['clients'])
@@ -0,0 +1,72 @@
+import sys
+import json
+from tools.data_store import DataStore
+from tools.utils import (
+    format_data, format_detailed, format_cheques_issued, format_cheques_received,
+    format_vendor_context, format_client_context, LLM_FIELDS
+)
+
+
+def old_format(data: list) -> str:
+    """What the briefing context used to send: pretty-printed JSON"""
+    if not data: return "None"
+    return json.dumps(data, indent=2)
+
+
+def old_cheques(cheques: list, cheque_type: str) -> str:
+    return old_format([c for c in cheques
+                       if str(c.get("type", "")).lower() == cheque_type and c.get("status") != "Cleared"])
+
+
+def briefing_sections(ds: DataStore) -> dict:
+    """(old, new) rendering of every data section a full briefing sends"""
+    cheques = ds.get_cheque_register()
+    return {
+        "bank accounts": (old_format(ds.get_all_bank_accounts()),
+                          format_data(ds.get_all_bank_accounts(), LLM_FIELDS['bank_accounts'])),
+        "cheques issued": (old_cheques(cheques, "issued"), format_cheques_issued(cheques)),
+        "cheques received": (old_cheques(cheques, "received"), format_cheques_received(cheques)),
+        "payables": (old_format(ds.get_all_payables()),
+                     format_detailed(ds.get_all_payables(), LLM_FIELDS['payables'])),
+        "vendors": (old_format(ds.get_all_vendors()), format_vendor_context(ds.get_all_vendors())),
+        "anomaly flags": (old_format(ds.get_payable_flags()),
+                          format_detailed(ds.get_payable_flags(), LLM_FIELDS['flags'])),
+        "receivables": (old_format(ds.get_all_receivables()),
+                        format_detailed(ds.get_all_receivables(), LLM_FIELDS['receivables'])),
+        "clients": (old_format(ds.get_all_clients()), format_client_context(ds.get_all_clients())),
+        "goals": (old_format(ds.get_financial_goals()),
+                  format_data(ds.get_financial_goals(), LLM_FIELDS['goals'])),
+    }
+
+
+def make_counter(use_gemini: bool):
+    if not use_gemini:
+        # ~4 characters per token for English/JSON text
+        return lambda text: len(text) // 4
+    import os
+    import google.generativeai as genai
+    from config.settings import Settings
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    model = genai.GenerativeModel(Settings.MODEL_NAME)
+    return lambda text: model.count_tokens(text).total_tokens
+
+
+def main():
+    use_gemini = "--gemini" in sys.argv[1:]
+    count = make_counter(use_gemini)
+    print(f"📏 Token counts per briefing section ({'Gemini count_tokens' if use_gemini else 'estimated, chars/4'})\n")
+    print(f"{'section':<18} {'old':>7} {'new':>7} {'ratio':>6}")
+
+    total_old = total_new = 0
+    for name, (old, new) in briefing_sections(DataStore()).items():
+        old_tokens, new_tokens = count(old), count(new)
+        total_old += old_tokens
+        total_new += new_tokens
+        ratio = old_tokens / new_tokens if new_tokens else 0
+        print(f"{name:<18} {old_tokens:>7} {new_tokens:>7} {ratio:>5.1f}x")
+
+    print(f"{'TOTAL':<18} {total_old:>7} {total_new:>7} {total_old / max(total_new, 1):>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()